@@ -0,0 +1,364 @@
+"""
+Offline microbenchmarks for Alita's per-message hot path.
+
+Nothing touches the network: the Bot API session and the Groq gateway are
+stubbed. Corpora are synthetic Hinglish messages (seeded, so every run sees
+the same text) and bad-word lists of several sizes.
+
+    python bench.py                              # full run, JSON on stdout
+    python bench.py --quick -o before.json       # smaller corpora, to a file
+    python bench.py --compare before.json        # fail if anything got >10% slower
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from datetime import datetime
+from types import SimpleNamespace
+
+# Must be set before bot.py is imported
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK-token-not-used-for-anything")
+os.environ.pop("GROQ_API_KEY", None)
+os.environ.pop("BAD_WORDS_FILE", None)
+
+import bot as alita
+
+SEED = 1234
+
+VOCAB = (
+    "yaar kya haal hai bhai aaj kal movie dekhi mast thi accha nahi pata chal raha kaise ho tum main "
+    "ghar ja khana kha liya office boring scene bro sach mein bilkul theek hu kuch bhi matlab chalo "
+    "baad baat karte hain cricket match dekha kohli century exam padhai neend aa rahi chai peete "
+    "lol haha pakka kal milte weekend plan bana na please sun toh zara"
+).split() + ["😂", "🙏", "❤️", "😅", "🔥", "भाई", "क्या", "हाल", "है", "ठीक", "हूँ", "अच्छा"]
+
+ASCII_VOCAB = [word for word in VOCAB if word.isascii()]
+
+LINKS = ["t.me/joinchat/AbCdEf123", "https://t.me/+xyz987", "chat.whatsapp.com/Kf8s7d"]
+DISGUISES = [lambda w: w, str.upper, lambda w: w.replace("i", "1").replace("o", "0"), lambda w: " ".join(w)]
+
+# --- CORPORA ---
+def make_word_list(size: int, rng: random.Random) -> list:
+    """The shipped list padded with pronounceable fake words up to `size`"""
+    words = list(alita.BAD_WORDS)
+    consonants, vowels = "bcdghjklmnprstvy", "aeiou"
+    while len(words) < size:
+        length = rng.randint(2, 4)
+        words.append("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(length)))
+    return words[:max(size, len(alita.BAD_WORDS))]
+
+def make_corpus(count: int, words_per_message: int, rng: random.Random,
+                link_rate: float = 0.02, bad_rate: float = 0.03, vocab: list = VOCAB) -> list:
+    """Unique Hinglish messages with a sprinkle of links and (disguised) bad words"""
+    messages = []
+    for index in range(count):
+        words = [rng.choice(vocab) for _ in range(words_per_message)]
+        if rng.random() < link_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(LINKS))
+        if rng.random() < bad_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(DISGUISES)(rng.choice(alita.BAD_WORDS)))
+        # A trailing counter keeps every message distinct so caches cannot help
+        messages.append(" ".join(words) + f" {index}")
+    return messages
+
+# --- STUBS ---
+async def stub_bot_request(bot, method, timeout=None):
+    # Every Bot API call on the benchmarked paths returns a bool
+    return True
+
+class StubGroq:
+    """Stands in for groq_gateway: answers instantly with a canned completion"""
+
+    def __init__(self):
+        self.calls = 0
+        self.completion = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Haan yaar, bilkul sahi! 😊 Aur batao?"))],
+            usage=None
+        )
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return self.completion
+
+def install_stubs():
+    alita.bot.session.make_request = stub_bot_request
+    alita.groq_gateway = StubGroq()
+
+def reset_state():
+    for mapping in (alita.chat_memory, alita.chat_summaries, alita.user_warnings, alita.user_emotions,
+                    alita.user_last_interaction, alita.last_messages):
+        mapping.clear()
+    alita.state_store._dirty.clear()
+    alita.response_cache._entries.clear()
+    alita.moderation.scan.cache_clear()
+
+def fake_message(chat_id: int, user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), from_user=SimpleNamespace(id=user_id))
+
+# --- HARNESS ---
+def run_case(name: str, params: dict, inputs: list, call, repeat: int, is_async: bool = False,
+             before_round=None) -> dict:
+    """Time `call(item)` over all inputs, `repeat` rounds; report per-op nanoseconds"""
+    loop = asyncio.new_event_loop() if is_async else None
+
+    async def async_round():
+        for item in inputs:
+            await call(item)
+
+    rounds = []
+    try:
+        for _ in range(repeat + 1):  # The first round is a warm-up
+            if before_round:
+                before_round()
+            gc.collect()
+            started = time.perf_counter_ns()
+            if is_async:
+                loop.run_until_complete(async_round())
+            else:
+                for item in inputs:
+                    call(item)
+            rounds.append((time.perf_counter_ns() - started) / len(inputs))
+    finally:
+        if loop:
+            loop.close()
+
+    rounds = rounds[1:]
+    median = statistics.median(rounds)
+    result = {
+        "name": name,
+        "params": params,
+        "ops": len(inputs),
+        "repeat": repeat,
+        "ns_per_op_min": round(min(rounds), 1),
+        "ns_per_op_median": round(median, 1),
+        "ops_per_sec": round(1e9 / median) if median else None
+    }
+    print(f"  {name:<24} {json.dumps(params):<42} {median / 1000:>10.2f} µs/op", file=sys.stderr)
+    return result
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+# --- BENCHMARKS ---
+def bench_moderation(results: list, sizes: dict, repeat: int):
+    shipped = alita.moderation
+    rng = random.Random(SEED)
+    corpora = {length: make_corpus(sizes["messages"], length, rng) for length in sizes["message_words"]}
+    try:
+        for list_size in sizes["word_lists"]:
+            alita.moderation = alita.ModerationEngine(make_word_list(list_size, rng), alita.GROUP_LINK_PATTERNS)
+            for length, corpus in corpora.items():
+                params = {"words_per_message": length, "word_list": alita.moderation.word_count}
+                for name, fn in (("contains_group_link", alita.contains_group_link),
+                                 ("contains_bad_words", alita.contains_bad_words)):
+                    # Clear the verdict cache each round: this measures the actual scan
+                    results.append(run_case(name, params, corpus, fn, repeat,
+                                            before_round=alita.moderation.scan.cache_clear))
+            hot = corpora[min(corpora)][:64] * (sizes["messages"] // 64 or 1)
+            results.append(run_case("contains_bad_words", {"words_per_message": min(corpora),
+                                    "word_list": alita.moderation.word_count, "repeated_texts": True},
+                                    hot, alita.contains_bad_words, repeat))
+    finally:
+        alita.moderation = shipped
+    
+    # Every scan starts here; emojis and Devanagari take the Unicode path, plain ASCII skips it
+    for length, corpus in corpora.items():
+        texts = {"ascii": make_corpus(sizes["messages"], length, rng, vocab=ASCII_VOCAB),
+                 "non_ascii": [text for text in corpus if not text.isascii()]}
+        for script, inputs in texts.items():
+            results.append(run_case("normalize_text", {"words_per_message": length, "text": script},
+                                    inputs, alita.normalize_text, repeat))
+
+def bench_spam(results: list, sizes: dict, repeat: int):
+    rng = random.Random(SEED)
+    for senders in sizes["spam_senders"]:
+        # Everyone stays under the limit: the common path is "not spam"
+        messages = [fake_message(-100 - rng.randrange(senders // 10 + 1), rng.randrange(senders))
+                    for _ in range(sizes["messages"])]
+        results.append(run_case("check_spam", {"tracked_senders": senders}, messages, alita.check_spam,
+                                repeat, is_async=True, before_round=alita.last_messages.clear))
+
+def bench_emotions(results: list, sizes: dict, repeat: int):
+    rng = random.Random(SEED)
+    for length in sizes["message_words"]:
+        corpus = make_corpus(sizes["messages"], length, rng)
+        pairs = [(rng.randrange(10000), text) for text in corpus]
+        results.append(run_case("update_user_emotion", {"words_per_message": length}, pairs,
+                                lambda pair: alita.update_user_emotion(*pair), repeat))
+        batches = [corpus[i:i + 100] for i in range(0, len(corpus), 100)]
+        results.append(run_case("classify_batch", {"words_per_message": length, "batch": 100}, batches,
+                                alita.message_classifier.classify_batch, repeat))
+
+    user_ids = [rng.randrange(10000) for _ in range(sizes["messages"])]
+    for user_id in user_ids:
+        alita.user_emotions[user_id] = rng.choice(list(alita.EMOTIONAL_RESPONSES))
+    results.append(run_case("get_emotion", {"kind": "named"}, list(alita.EMOTIONAL_RESPONSES) * 100,
+                            alita.get_emotion, repeat))
+    results.append(run_case("get_emotion", {"kind": "per_user"}, user_ids,
+                            lambda user_id: alita.get_emotion(None, user_id), repeat))
+    results.append(run_case("get_emotion", {"kind": "random"}, [None] * sizes["messages"],
+                            alita.get_emotion, repeat))
+
+def bench_warnings(results: list, sizes: dict, repeat: int):
+    rng = random.Random(SEED)
+    for reason in ("link", "bad_words", "spam"):
+        # Every third warning for a user triggers the (stubbed) restrictChatMember call
+        calls = [(-100 - rng.randrange(50), rng.randrange(500)) for _ in range(sizes["messages"] // 4)]
+        results.append(run_case(
+            "give_warning", {"reason": reason}, calls,
+            lambda call, reason=reason: alita.give_warning(call[0], call[1], "bench_user", reason),
+            repeat, is_async=True, before_round=alita.user_warnings.clear
+        ))
+
+def bench_prompt(results: list, sizes: dict, repeat: int):
+    rng = random.Random(SEED)
+    history = make_corpus(50, 12, rng, link_rate=0, bad_rate=0)
+
+    def fill_memory():
+        alita.chat_memory.clear()
+        alita.chat_summaries.clear()
+        alita.response_cache._entries.clear()
+        for chat_id in range(100):
+            alita.chat_memory[chat_id] = deque(
+                ({"role": "user" if i % 2 else "assistant", "content": text} for i, text in enumerate(history)),
+                maxlen=50
+            )
+
+    # Summaries are refreshed in background tasks, off the request path; keep them out of the timings
+    summary_batch = alita.context_builder.summary_batch
+    alita.context_builder.summary_batch = float("inf")
+    try:
+        for length in sizes["message_words"]:
+            corpus = make_corpus(sizes["messages"], length, rng, link_rate=0, bad_rate=0)
+            calls = [(rng.randrange(100), text, rng.randrange(10000)) for text in corpus]
+            results.append(run_case("build_ai_request", {"words_per_message": length}, calls,
+                                    lambda call: alita.build_ai_request(*call), repeat, before_round=fill_memory))
+            results.append(run_case("get_ai_response", {"words_per_message": length, "groq": "stub"}, calls,
+                                    lambda call: alita.get_ai_response(*call), repeat, is_async=True,
+                                    before_round=fill_memory))
+    finally:
+        alita.context_builder.summary_batch = summary_batch
+
+def bench_photos(results: list, sizes: dict, repeat: int):
+    rng = random.Random(SEED)
+    image = alita.Image.new("RGB", (90, 90))
+    image.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(90 * 90)])
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as thumbnail:
+        image.save(thumbnail, "JPEG", quality=80)
+    try:
+        results.append(run_case("photo_dhash", {"thumbnail": "90x90 jpeg"}, [thumbnail.name] * 200,
+                                alita.photo_dhash, repeat))
+    finally:
+        os.remove(thumbnail.name)
+
+    for stored in sizes["photo_hashes"]:
+        index = alita.PhotoHashIndex(window=3600, max_entries=stored)
+        hashes = [rng.getrandbits(64) for _ in range(stored)]
+        for value in hashes:
+            index.add(value, now=0.0)
+        # Half are small variations of stored images, half are new
+        queries = []
+        for i in range(sizes["messages"]):
+            value = rng.choice(hashes) if i % 2 else rng.getrandbits(64)
+            for bit in rng.sample(range(64), 3):
+                value ^= 1 << bit
+            queries.append(value)
+        for distance in (2, 5, 8):
+            results.append(run_case("photo_index_near", {"hashes": stored, "distance": distance}, queries,
+                                    lambda value, distance=distance: index.near(value, distance, now=1.0), repeat))
+
+BENCHMARKS = {
+    "moderation": bench_moderation,
+    "spam": bench_spam,
+    "emotions": bench_emotions,
+    "warnings": bench_warnings,
+    "prompt": bench_prompt,
+    "photos": bench_photos
+}
+
+SIZES = {
+    "full": {"messages": 4000, "message_words": [5, 20, 100], "word_lists": [0, 500, 5000],
+             "spam_senders": [100, 10000], "photo_hashes": [10000, 1000000]},
+    "quick": {"messages": 1000, "message_words": [5, 40], "word_lists": [0, 2000],
+              "spam_senders": [1000], "photo_hashes": [100000]}
+}
+
+# --- COMPARISON ---
+def case_key(result: dict) -> str:
+    return f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print per-case change against a baseline run; True when nothing regressed"""
+    before = {case_key(result): result for result in baseline["results"]}
+    ok = True
+    for result in current["results"]:
+        old = before.get(case_key(result))
+        if not old:
+            continue
+        change = result["ns_per_op_median"] / old["ns_per_op_median"] - 1
+        regressed = change > threshold
+        ok = ok and not regressed
+        marker = "❌" if regressed else "✅"
+        print(f"{marker} {case_key(result):<70} {change:+7.1%}", file=sys.stderr)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller corpora and fewer rounds")
+    parser.add_argument("--repeat", type=int, help="timed rounds per case (default 5, quick 3)")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run only these groups")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown for --compare")
+    args = parser.parse_args()
+
+    sizes = SIZES["quick" if args.quick else "full"]
+    repeat = args.repeat or (3 if args.quick else 5)
+    random.seed(SEED)  # bot.py picks replies/emojis with the global RNG
+    install_stubs()
+
+    results = []
+    for group in args.only or BENCHMARKS:
+        print(f"🏃 {group}", file=sys.stderr)
+        reset_state()
+        BENCHMARKS[group](results, sizes, repeat)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": "quick" if args.quick else "full",
+            "repeat": repeat
+        },
+        "results": results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # Startup phases are measured from here
+
 import os
 import asyncio
 import random
@@ -5,67 +8,933 @@ import re
 import json
 import base64
 import io
-from collections import defaultdict, deque
+import sys
+import tempfile
+import mmap
+import importlib
+import unicodedata
+import hashlib
+import heapq
+import sqlite3
+import copy
+import bisect
+import itertools
+import queue
+import multiprocessing
+import threading
+import signal
+import tracemalloc
+from functools import lru_cache
+from contextlib import aclosing, asynccontextmanager, contextmanager, suppress
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import defaultdict, deque, OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Set, Optional
+from typing import Dict, List, Set, Optional, NamedTuple, Tuple, Any, Callable, Awaitable
+
+# (phase, seconds) in startup order; reported when the first update arrives
+STARTUP_PHASES: List[Tuple[str, float]] = []
+_startup_mark = STARTUP_STARTED
+
+def mark_startup(phase: str):
+    """Close the current startup phase"""
+    global _startup_mark
+    now = time.perf_counter()
+    STARTUP_PHASES.append((phase, now - _startup_mark))
+    _startup_mark = now
+
+mark_startup("import stdlib")
+
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest, TelegramForbiddenError
 from aiogram.types import Message, ChatMemberUpdated, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
-from groq import AsyncGroq
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+mark_startup("import aiogram")
+from groq import AsyncGroq, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+mark_startup("import groq")
 from aiohttp import web
 import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED
 import aiohttp
-from PIL import Image
-import speech_recognition as sr
-from pydub import AudioSegment
+mark_startup("import aiohttp, apscheduler, pytz")
+
+# --- LAZY IMPORTS ---
+class LazyModule:
+    """Stand-in for a heavy module that is imported on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            took = time.perf_counter() - started
+            LAZY_IMPORT_SECONDS.set(took, module=self._name)
+            print(f"📦 Loaded {self._name} in {took * 1000:.0f} ms")
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+# Only media handlers need these; text-only processes never import them
+Image = LazyModule("PIL.Image")
+sr = LazyModule("speech_recognition")
+pydub = LazyModule("pydub")
 
 # --- CONFIGURATION ---
 TOKEN = os.getenv("BOT_TOKEN")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 PORT = int(os.getenv("PORT", 10000))
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+
+# Alternative API endpoints (local Bot API server, load tests); empty = official
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+# Worker processes: >1 routes updates by chat_id to that many handler processes
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Update delivery: "polling" (default) or "webhook" (served by the health server on PORT)
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL")  # Public base URL
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token; derived from the token if unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or (
+    hashlib.sha256(TOKEN.encode()).hexdigest()[:32] if TOKEN else None
+)
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY", "demo_key")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))  # Seconds per city
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))          # Max open connections
+
+# Groq budgets (match your account's limits for the model)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))                      # Requests per minute
+GROQ_TPM = int(os.getenv("GROQ_TPM", "6000"))                    # Tokens per minute
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_QUEUE_SIZE = int(os.getenv("GROQ_QUEUE_SIZE", "100"))       # Max callers waiting for a slot
+GROQ_DEADLINE = float(os.getenv("GROQ_DEADLINE", "20"))          # Seconds a reply may wait in total
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+
+# Streaming replies: "off", "private" (private chats only) or "all"
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "private")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # Min seconds between edits
+
+# Cache for replies to short, common prompts
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))      # Max cached prompts
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "1800"))        # Seconds per prompt
+RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3")) # Replies collected before serving hits
+RESPONSE_CACHE_MAX_WORDS = 6                                             # Longer prompts are never cached
+# Prompt context: recent turns packed into a token budget, older ones kept as a rolling summary
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "500"))   # Whole prompt, system prompt included
+CONTEXT_TURN_TOKENS = int(os.getenv("CONTEXT_TURN_TOKENS", "120"))     # Longer turns are clipped
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")     # Small model for summaries
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "8"))                   # Unsummarized older turns per refresh
+BAD_WORDS_FILE = os.getenv("BAD_WORDS_FILE")  # Optional extra word list, one word per line
+
+# Spam limits (defaults, overridable per group via group_settings)
+SPAM_LIMIT = int(os.getenv("SPAM_LIMIT", "5"))            # Max messages per window
+SPAM_WINDOW = int(os.getenv("SPAM_WINDOW", "30"))         # Window in seconds
+SPAM_IDLE_TTL = int(os.getenv("SPAM_IDLE_TTL", "300"))    # Drop trackers idle this long
+
+# Durable state (SQLite in WAL mode, written behind the in-memory dicts)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "alita_state.db")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))  # Seconds between batched writes
+
+# Reminders: only those due within the horizon are held in memory
+REMINDER_HORIZON = int(os.getenv("REMINDER_HORIZON", "3600"))   # Seconds loaded ahead from the database
+REMINDER_GRACE = int(os.getenv("REMINDER_GRACE", "21600"))      # Still deliver reminders missed by this much
+
+# Memory limits for per-chat / per-user maps (idle entries are evicted, persisted ones spill to disk)
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "256"))
+MAX_TRACKED_CHATS = int(os.getenv("MAX_TRACKED_CHATS", "5000"))
+MAX_TRACKED_USERS = int(os.getenv("MAX_TRACKED_USERS", "100000"))
+
+# Broadcasts (daily reminders): stay under Telegram's ~30 msg/s global limit
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))          # Messages per second
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+
+# FSM states (UserStates) expire this many seconds after their last write
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+
+# Burst coalescing: wait this long after a message for more before replying
+CHAT_DEBOUNCE = float(os.getenv("CHAT_DEBOUNCE", "1.2"))       # Seconds of quiet
+CHAT_DEBOUNCE_MAX = float(os.getenv("CHAT_DEBOUNCE_MAX", "4"))  # Never hold a burst longer
+
+# Voice notes: offline transcription (faster-whisper) in a process pool
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "1"))            # Transcription processes
+VOICE_QUEUE_MAX = int(os.getenv("VOICE_QUEUE_MAX", "8"))        # Voice notes in flight before refusing more
+VOICE_MAX_SECONDS = int(os.getenv("VOICE_MAX_SECONDS", "60"))   # Longer notes are not transcribed
+VOICE_MODEL = os.getenv("VOICE_MODEL", "base")                  # Whisper model size or local path
+VOICE_LANGUAGE = os.getenv("VOICE_LANGUAGE") or None            # e.g. "hi"; unset = detect per note
+VOICE_CPU_THREADS = int(os.getenv("VOICE_CPU_THREADS", "2"))    # Threads per transcription process
+
+# Downloaded media, content-addressed on disk and reused across forwards (0 = no cache)
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_CACHE_MB = int(os.getenv("MEDIA_CACHE_MB", "256"))
+
+# Photo floods: near-duplicate images (perceptual hash) reposted within the window
+PHOTO_DUP_WINDOW = int(os.getenv("PHOTO_DUP_WINDOW", "900"))        # Seconds a photo is remembered
+PHOTO_DUP_DISTANCE = min(int(os.getenv("PHOTO_DUP_DISTANCE", "5")), 8)  # Max differing bits of 64
+PHOTO_DUP_LIMIT = int(os.getenv("PHOTO_DUP_LIMIT", "3"))            # Earlier copies by the same user that make a flood
+PHOTO_INDEX_MAX = int(os.getenv("PHOTO_INDEX_MAX", "200000"))       # Distinct hashes kept (~0.5 KB each)
+
+# Chat admin lists are cached for this many seconds (refreshed in the background)
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "600"))
+ADMIN_CACHE_ERROR_TTL = int(os.getenv("ADMIN_CACHE_ERROR_TTL", "30"))  # Retry delay after a failed lookup (doubles)
 
 # Timezone for India
 INDIAN_TIMEZONE = pytz.timezone('Asia/Kolkata')
 
-# Initialize with MemoryStorage
-storage = MemoryStorage()
-bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=storage)
+# Initialize bot (the dispatcher is created with its FSM storage under PERSISTENT STATE)
+bot = Bot(
+    token=TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+)
+
+# Initialize Groq client (retries are handled by groq_gateway, not the SDK)
+client = AsyncGroq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, max_retries=0) if GROQ_API_KEY else None
+
+# --- BOUNDED MEMORY ---
+class BoundedDict(OrderedDict):
+    """Dict kept in least-recently-used order with per-key access times.
+
+    Item reads and writes refresh a key; `in` and .get() do not. With
+    default_factory it behaves like a defaultdict. Past max_entries the
+    least recently used key is evicted through on_evict.
+    """
+
+    def __init__(self, default_factory: Optional[Callable] = None, max_entries: int = 0):
+        super().__init__()
+        self.default_factory = default_factory
+        self.max_entries = max_entries
+        self.on_evict: Optional[Callable] = None
+        self.atime: Dict = {}
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        self.atime[key] = time.monotonic()
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        self.atime[key] = time.monotonic()
+        if self.max_entries and len(self) > self.max_entries:
+            self.evict(next(iter(self)))
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.atime.pop(key, None)
+
+    def __missing__(self, key):
+        if self.default_factory is None:
+            raise KeyError(key)
+        value = self.default_factory()
+        self[key] = value
+        return value
+
+    def pop(self, key, *default):
+        self.atime.pop(key, None)
+        return super().pop(key, *default)
+
+    def clear(self):
+        super().clear()
+        self.atime.clear()
+
+    def evict(self, key):
+        value = self.pop(key)
+        if self.on_evict:
+            self.on_evict(key, value)
+
+def _approx_sizeof(obj, depth: int = 3) -> int:
+    """Rough deep size of a value (containers are followed `depth` levels)"""
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        size += sum(_approx_sizeof(k, 0) + _approx_sizeof(v, depth - 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, deque)):
+        size += sum(_approx_sizeof(item, depth - 1) for item in obj)
+    return size
+
+class MemoryRegistry:
+    """Central list of per-chat/per-user maps with LRU/TTL eviction and a global budget"""
+
+    SAMPLE_SIZE = 32
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._maps: Dict[str, Dict] = {}
+        self.evictions: Dict[str, int] = defaultdict(int)
+
+    def register(self, name: str, mapping: Dict, max_entries: int = 0, ttl: float = 0,
+                 spill: Optional[Callable] = None, evict: bool = True):
+        """Track `mapping`; BoundedDicts get the limits, plain dicts only stats and budget eviction.
+
+        spill(name, key, value) is called for every evicted entry. evict=False
+        keeps the map out of budget eviction (for state that is never restored).
+        """
+        self._maps[name] = {"mapping": mapping, "ttl": ttl, "spill": spill, "evict": evict}
+        if isinstance(mapping, BoundedDict):
+            mapping.max_entries = max_entries
+            mapping.on_evict = lambda key, value: self._evicted(name, key, value)
+
+    def _evicted(self, name: str, key, value):
+        self.evictions[name] += 1
+        spill = self._maps[name]["spill"]
+        if spill:
+            spill(name, key, value)
+
+    def _evict_oldest(self, name: str, count: int):
+        mapping = self._maps[name]["mapping"]
+        for _ in range(min(count, len(mapping))):
+            key = next(iter(mapping))
+            if isinstance(mapping, BoundedDict):
+                mapping.evict(key)
+            else:
+                self._evicted(name, key, mapping.pop(key))
+
+    def approx_bytes(self, name: str) -> int:
+        """Estimate from a sample of the most recently used entries"""
+        mapping = self._maps[name]["mapping"]
+        if not mapping:
+            return sys.getsizeof(mapping)
+        sample = []
+        for key in reversed(mapping):
+            sample.append(_approx_sizeof(key, 0) + _approx_sizeof(dict.__getitem__(mapping, key)))
+            if len(sample) >= self.SAMPLE_SIZE:
+                break
+        return sys.getsizeof(mapping) + len(mapping) * sum(sample) // len(sample)
+
+    def sweep(self):
+        """Apply TTLs, then trim the largest maps until under the global budget"""
+        now = time.monotonic()
+        for name, entry in self._maps.items():
+            mapping = entry["mapping"]
+            if not entry["ttl"] or not isinstance(mapping, BoundedDict):
+                continue
+            while mapping and now - mapping.atime.get(next(iter(mapping)), now) > entry["ttl"]:
+                mapping.evict(next(iter(mapping)))
+        
+        sizes = {name: self.approx_bytes(name) for name in self._maps}
+        evictable = {name for name, entry in self._maps.items() if entry["evict"] and entry["mapping"]}
+        while sum(sizes.values()) > self.budget_bytes and evictable:
+            name = max(evictable, key=sizes.get)
+            mapping = self._maps[name]["mapping"]
+            self._evict_oldest(name, max(1, len(mapping) // 10))
+            sizes[name] = self.approx_bytes(name)
+            if not mapping:
+                evictable.discard(name)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "entries": len(entry["mapping"]),
+                "approx_bytes": self.approx_bytes(name),
+                "evictions": self.evictions[name]
+            }
+            for name, entry in self._maps.items()
+        }
 
-# Initialize Groq client
-client = AsyncGroq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+memory_registry = MemoryRegistry(MEMORY_BUDGET_MB * 1024 * 1024)
 
 # --- MEMORY SYSTEMS ---
-chat_memory: Dict[int, deque] = {}
-user_warnings: Dict[int, Dict[int, Dict]] = defaultdict(lambda: defaultdict(dict))
-user_message_count: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
-last_messages: Dict[int, Dict[int, List]] = defaultdict(lambda: defaultdict(list))
+# chat_id -> last 50 turns: {"role", "content", "seq"}; seq numbers the chat's turns from 1
+chat_memory: Dict[int, deque] = BoundedDict()
+# chat_id -> {"text": rolling summary of turns older than the prompt window, "upto": "seq" of its newest turn}
+chat_summaries: Dict[int, Dict] = BoundedDict()
+user_warnings: Dict[int, Dict[int, Dict]] = BoundedDict(lambda: defaultdict(dict))
+user_message_count: Dict[int, Dict[int, int]] = BoundedDict(lambda: defaultdict(int))
+# (chat_id, user_id) -> ring buffer of monotonic timestamps, ordered by last activity
+last_messages: "OrderedDict[Tuple[int, int], deque]" = OrderedDict()
 
 # User data storage
 user_data: Dict[int, Dict] = defaultdict(dict)
-user_notes: Dict[int, List[Dict]] = defaultdict(list)
-user_reminders: Dict[int, List[Dict]] = defaultdict(list)
+user_notes: Dict[int, List[Dict]] = BoundedDict(list)
 user_reputation: Dict[int, int] = defaultdict(int)
 
 # Emotional states for each user
-user_emotions: Dict[int, str] = {}
-user_last_interaction: Dict[int, datetime] = {}
+user_emotions: Dict[int, str] = BoundedDict()
+user_last_interaction: Dict[int, datetime] = BoundedDict()
+
+# Daily reminder broadcast: user_id -> IST date last sent, run date (YYYYMMDD) -> progress
+daily_reminder_sent: Dict[int, str] = BoundedDict()
+broadcast_runs: Dict[int, Dict] = {}
+# user_id -> IST date a broadcast found us blocked (cleared when they write to us privately again)
+broadcast_opt_outs: Dict[int, str] = {}
 
 # Group management
-group_settings: Dict[int, Dict] = defaultdict(lambda: {
+DEFAULT_GROUP_SETTINGS = {
     "welcome_enabled": True,
     "auto_mod_enabled": True,
     "greetings_enabled": True,
     "custom_welcome": None,
-    "language": "hinglish"
-})
+    "language": "hinglish",
+    "spam_limit": SPAM_LIMIT,
+    "spam_window": SPAM_WINDOW
+}
+group_settings: Dict[int, Dict] = defaultdict(lambda: dict(DEFAULT_GROUP_SETTINGS))
+
+# --- PERSISTENT STATE ---
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return {"__dt__": obj.isoformat()}
+    if isinstance(obj, (deque, set)):
+        return list(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and "__dt__" in obj:
+        return datetime.fromisoformat(obj["__dt__"])
+    return obj
+
+def encode_state(value) -> str:
+    return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+
+def decode_state(text: str):
+    return json.loads(text, object_hook=_json_object_hook)
+
+class StateStore:
+    """Write-behind SQLite (WAL) persistence for module-level state dicts.
+
+    The registered dicts stay the source of truth for reads. Mutations only
+    mark a key dirty (O(1), no I/O); a background task serializes dirty keys
+    and writes them in one transaction on a dedicated thread.
+    """
+
+    def __init__(self, path: str, flush_interval: float):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._namespaces: Dict[str, Tuple[Dict, Callable]] = {}
+        self._key_types: Dict[str, Callable] = {}
+        self._dirty: Dict[str, Set] = defaultdict(set)
+        self._spilled: Dict[Tuple[str, Any], str] = {}
+        self._statements: List[Tuple[str, Tuple]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, mapping: Dict, decode: Callable = lambda value: value, key_type: Callable = int):
+        """Persist `mapping` under `name`; `decode` rebuilds a value loaded from JSON"""
+        self._namespaces[name] = (mapping, decode)
+        self._key_types[name] = key_type
+
+    def mark_dirty(self, name: str, key):
+        self._dirty[name].add(key)
+
+    def enqueue(self, sql: str, params: Tuple = ()):
+        """Buffer a custom statement for the next batched write"""
+        self._statements.append((sql, params))
+
+    def spill(self, name: str, key, value):
+        """Eviction hook: persist a value that is leaving memory (if it has unsaved changes)"""
+        if key in self._dirty.get(name, ()):
+            self._dirty[name].discard(key)
+            self._spilled[(name, key)] = encode_state(value)
+
+    async def restore(self, name: str, key) -> bool:
+        """Load one evicted key back into its dict; never overwrites a live entry"""
+        mapping, decode = self._namespaces[name]
+        if key in mapping or self._conn is None:
+            return key in mapping
+        pending = self._spilled.get((name, key))
+        if pending is None:
+            row = await self.run(
+                lambda conn: conn.execute(
+                    "SELECT value FROM kv WHERE namespace = ? AND key = ?", (name, str(key))
+                ).fetchone()
+            )
+            if row is None:
+                return False
+            pending = row[0]
+        if key not in mapping:
+            mapping[key] = decode(decode_state(pending))
+        return True
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(conn, *args) on the store thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._conn, *args))
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+        self._conn = conn
+
+    @staticmethod
+    def _load_rows(conn: sqlite3.Connection, namespace: str) -> List[Tuple[str, str]]:
+        return conn.execute("SELECT key, value FROM kv WHERE namespace = ?", (namespace,)).fetchall()
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, upserts: List[Tuple], deletes: List[Tuple], statements: List[Tuple]):
+        conn.execute("BEGIN")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            if upserts:
+                conn.executemany("INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)", upserts)
+            if deletes:
+                conn.executemany("DELETE FROM kv WHERE namespace = ? AND key = ?", deletes)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def start(self, namespaces: Optional[Set[str]] = None, key_filter: Optional[Callable] = None):
+        """Open the database, load registered namespaces and start flushing.
+
+        `namespaces` limits what is preloaded and key_filter(name, key) picks
+        keys within them; anything else is read lazily via restore().
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._open)
+        for name, (mapping, decode) in self._namespaces.items():
+            if namespaces is not None and name not in namespaces:
+                continue
+            key_type = self._key_types[name]
+            rows = await self.run(self._load_rows, name)
+            for key, value in rows:
+                if key_filter is None or key_filter(name, key_type(key)):
+                    mapping[key_type(key)] = decode(decode_state(value))
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _has_unsaved(self, name: str, key) -> bool:
+        return key in self._dirty.get(name, ()) or (name, key) in self._spilled
+
+    async def reload(self, name: str, key):
+        """Re-read one key written by another process, unless we have unsaved changes to it"""
+        if self._has_unsaved(name, key):
+            return
+        self._namespaces[name][0].pop(key, None)
+        await self.restore(name, key)
+
+    async def reload_namespace(self, name: str):
+        """Re-read a whole namespace written by other processes"""
+        mapping, decode = self._namespaces[name]
+        key_type = self._key_types[name]
+        for key, value in await self.run(self._load_rows, name):
+            if not self._has_unsaved(name, key_type(key)):
+                mapping[key_type(key)] = decode(decode_state(value))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"State flush failed: {e}")
+
+    async def flush(self):
+        if not (self._dirty or self._spilled or self._statements) or self._conn is None:
+            return
+        dirty, self._dirty = self._dirty, defaultdict(set)
+        spilled, self._spilled = self._spilled, {}
+        statements, self._statements = self._statements, []
+        
+        # Serialize on the loop so we see a consistent snapshot, write on the store thread
+        upserts = [(name, str(key), value) for (name, key), value in spilled.items()]
+        deletes = []
+        try:
+            for name, keys in dirty.items():
+                mapping = self._namespaces[name][0]
+                for key in keys:
+                    if key in mapping:
+                        upserts.append((name, str(key), encode_state(mapping[key])))
+                    else:
+                        deletes.append((name, str(key)))
+            await self.run(self._write, upserts, deletes, statements)
+        except BaseException:
+            # Keep the keys dirty so the next flush retries them
+            for name, keys in dirty.items():
+                self._dirty[name].update(keys)
+            for spill_key, value in spilled.items():
+                self._spilled.setdefault(spill_key, value)
+            self._statements[:0] = statements
+            raise
+
+    async def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._conn is not None:
+            await self.flush()
+            await self.run(lambda conn: conn.close())
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+def _decode_warnings(value: Dict) -> Dict:
+    return defaultdict(dict, {int(user_id): data for user_id, data in value.items()})
+
+state_store = StateStore(STATE_DB_PATH, STATE_FLUSH_INTERVAL)
+state_store.register("chat_memory", chat_memory, lambda value: deque(value, maxlen=50))
+state_store.register("chat_summaries", chat_summaries)
+state_store.register("user_warnings", user_warnings, _decode_warnings)
+state_store.register("user_notes", user_notes)
+state_store.register("user_reputation", user_reputation)
+state_store.register("group_settings", group_settings, lambda value: {**DEFAULT_GROUP_SETTINGS, **value})
+state_store.register("user_last_interaction", user_last_interaction)
+state_store.register("daily_reminder_sent", daily_reminder_sent)
+state_store.register("broadcast_runs", broadcast_runs)
+state_store.register("broadcast_opt_outs", broadcast_opt_outs)
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage kept in the state store.
+
+    Sessions are read through a bounded in-memory cache (misses are cached
+    too, so lookups for users without a state never touch SQLite), written
+    behind with the store's batches and expire `ttl` seconds after their
+    last write.
+    """
+
+    def __init__(self, store: StateStore, ttl: float):
+        self.store = store
+        self.ttl = ttl
+        self.sessions = BoundedDict()
+        self._absent = BoundedDict(max_entries=MAX_TRACKED_USERS)
+        store.register("fsm", self.sessions, key_type=str)
+
+    @staticmethod
+    def make_key(key: StorageKey) -> str:
+        return (f"{key.chat_id}:{key.user_id}:{key.bot_id}:{key.thread_id or ''}:"
+                f"{key.business_connection_id or ''}:{key.destiny}")
+
+    @staticmethod
+    def chat_of(storage_key: str) -> int:
+        return int(storage_key.split(":", 1)[0])
+
+    async def _get(self, key: str) -> Optional[Dict]:
+        if key in self.sessions:
+            entry = self.sessions[key]
+        elif key in self._absent:
+            return None
+        elif await self.store.restore("fsm", key):
+            entry = self.sessions[key]
+        else:
+            self._absent[key] = True
+            return None
+        if entry["expires"] < time.time():
+            self._delete(key)
+            return None
+        return entry
+
+    def _put(self, key: str, state: Optional[str], data: Dict):
+        if state is None and not data:
+            self._delete(key)
+            return
+        self._absent.pop(key, None)
+        self.sessions[key] = {"state": state, "data": data, "expires": time.time() + self.ttl}
+        self.store.mark_dirty("fsm", key)
+
+    def _delete(self, key: str):
+        self.sessions.pop(key, None)
+        self._absent[key] = True
+        self.store.mark_dirty("fsm", key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.make_key(key)
+        entry = await self._get(storage_key)
+        value = state.state if isinstance(state, State) else state
+        self._put(storage_key, value, entry["data"] if entry else {})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = await self._get(self.make_key(key))
+        return entry["state"] if entry else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.make_key(key)
+        entry = await self._get(storage_key)
+        self._put(storage_key, entry["state"] if entry else None, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = await self._get(self.make_key(key))
+        return copy.deepcopy(entry["data"]) if entry else {}
+
+    def purge_expired(self):
+        """Drop expired sessions from memory and (in the next batch) from disk"""
+        now = time.time()
+        for key in [key for key, entry in self.sessions.items() if entry["expires"] < now]:
+            self._delete(key)
+        self.store.enqueue(
+            "DELETE FROM kv WHERE namespace = 'fsm' AND json_extract(value, '$.expires') < ?", (now,)
+        )
+
+    async def close(self) -> None:
+        # The state store is flushed and closed by its own shutdown hook
+        pass
+
+# FSM states live in the same database and survive restarts
+storage = SQLiteStorage(state_store, FSM_TTL)
+dp = Dispatcher(storage=storage)
+
+# Idle entries leave memory; persisted ones are spilled to the store and restored on next use
+memory_registry.register("chat_memory", chat_memory, MAX_TRACKED_CHATS, ttl=3 * 86400, spill=state_store.spill)
+memory_registry.register("chat_summaries", chat_summaries, MAX_TRACKED_CHATS, ttl=3 * 86400,
+                         spill=state_store.spill)
+memory_registry.register("user_warnings", user_warnings, MAX_TRACKED_CHATS, ttl=7 * 86400, spill=state_store.spill)
+memory_registry.register("user_notes", user_notes, MAX_TRACKED_USERS, ttl=86400, spill=state_store.spill)
+memory_registry.register("user_last_interaction", user_last_interaction, MAX_TRACKED_USERS, ttl=4 * 86400,
+                         spill=state_store.spill)
+memory_registry.register("user_emotions", user_emotions, MAX_TRACKED_USERS, ttl=86400)
+memory_registry.register("daily_reminder_sent", daily_reminder_sent, MAX_TRACKED_USERS, ttl=2 * 86400,
+                         spill=state_store.spill)
+memory_registry.register("user_message_count", user_message_count, MAX_TRACKED_CHATS, ttl=86400)
+memory_registry.register("last_messages", last_messages)
+# Plain dicts read without restore(): dropping an entry would lose it (or overwrite the stored row)
+memory_registry.register("user_reputation", user_reputation, evict=False)
+memory_registry.register("user_data", user_data, evict=False)
+memory_registry.register("group_settings", group_settings, evict=False)
+memory_registry.register("fsm", storage.sessions, MAX_TRACKED_USERS, ttl=FSM_TTL, spill=state_store.spill)
+
+# --- METRICS ---
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Metric:
+    """One metric family; samples are keyed by label values in `labelnames` order"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, Any] = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple, *extra: Tuple[str, str]) -> Tuple:
+        return tuple(zip(self.labelnames, key)) + extra
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+    def clear(self):
+        self._values.clear()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """Mirror a counter that is kept elsewhere"""
+        self._values[self._key(labels)] = value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            # Per-bucket (not cumulative) counts, then sum and count
+            data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        result = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                result.append((f"{self.name}_bucket", self._labels(key, ("le", le)), cumulative))
+            result.append((f"{self.name}_sum", self._labels(key), total))
+            result.append((f"{self.name}_count", self._labels(key), count))
+        return result
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry (no client library needed)"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def _add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> List[Tuple[str, str, str, List]]:
+        """Picklable copy of every family: (name, kind, help, samples)"""
+        return [(m.name, m.kind, m.documentation, m.samples()) for m in self._metrics]
+
+    @staticmethod
+    def render(sources: List[Tuple[Tuple, List]]) -> str:
+        """Text exposition of snapshots; each source adds its own labels to its samples"""
+        families: Dict[str, Tuple[str, str, List]] = {}
+        for extra, snapshot in sources:
+            for name, kind, documentation, samples in snapshot:
+                family = families.setdefault(name, (kind, documentation, []))
+                family[2].extend((sample, labels + extra, value) for sample, labels, value in samples)
+
+        lines = []
+        for name, (kind, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, labels, value in samples:
+                lines.append(f"{sample}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+HANDLER_SECONDS = metrics.histogram("alita_handler_seconds", "Update handler latency", ("handler",))
+REPLY_SECONDS = metrics.histogram("alita_reply_seconds", "Time to produce and send one chat lane reply")
+LANE_MERGED = metrics.counter("alita_lane_merged_messages_total", "Messages answered together with a later one")
+GROQ_REQUESTS = metrics.counter("alita_groq_requests_total", "Groq API calls (each retry counts)", ("mode",))
+GROQ_ERRORS = metrics.counter("alita_groq_errors_total", "Failed Groq calls", ("mode", "error"))
+GROQ_SECONDS = metrics.histogram("alita_groq_request_seconds", "Groq call latency (streams: until the last chunk)",
+                                 ("mode",))
+GROQ_FIRST_TOKEN = metrics.histogram("alita_groq_first_token_seconds", "Time to the first streamed delta")
+GROQ_TOKENS = metrics.counter("alita_groq_tokens_total", "Tokens billed by Groq", ("kind",))
+TOKEN_BUCKETS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400)
+GROQ_REQUEST_TOKENS = metrics.histogram("alita_groq_request_tokens", "Tokens billed per Groq request", ("kind",),
+                                        buckets=TOKEN_BUCKETS)
+PROMPT_TOKENS = metrics.histogram("alita_prompt_tokens", "Estimated tokens per chat prompt, by part", ("part",),
+                                  buckets=TOKEN_BUCKETS)
+PROMPT_TURNS = metrics.histogram("alita_prompt_turns", "Chat turns packed into a prompt",
+                                 buckets=(1, 2, 3, 5, 8, 13, 21, 34, 50))
+SUMMARY_REFRESHES = metrics.counter("alita_summary_refreshes_total", "Rolling chat summary refreshes", ("result",))
+MODERATION_HITS = metrics.counter("alita_moderation_hits_total", "Messages removed by auto-moderation", ("reason",))
+BOT_API_SECONDS = metrics.histogram("alita_bot_api_seconds", "Bot API call latency", ("method",))
+BOT_API_ERRORS = metrics.counter("alita_bot_api_errors_total", "Failed Bot API calls (TelegramRetryAfter = 429)",
+                                 ("method", "error"))
+SCHEDULER_LAG = metrics.histogram("alita_scheduler_lag_seconds", "Delay between a job's run time and its submission",
+                                  ("job",))
+SCHEDULER_MISSED = metrics.counter("alita_scheduler_missed_total", "Job runs skipped as too late", ("job",))
+MAP_ENTRIES = metrics.gauge("alita_map_entries", "Entries in in-memory per-chat/per-user maps", ("map",))
+MAP_BYTES = metrics.gauge("alita_map_approx_bytes", "Estimated size of in-memory maps", ("map",))
+MAP_EVICTIONS = metrics.counter("alita_map_evictions_total", "Entries evicted from in-memory maps", ("map",))
+RESPONSE_CACHE_ENTRIES = metrics.gauge("alita_response_cache_entries", "Prompts in the LLM response cache")
+RESPONSE_CACHE_LOOKUPS = metrics.counter("alita_response_cache_lookups_total", "Response cache lookups", ("result",))
+GROQ_CONCURRENCY = metrics.gauge("alita_groq_concurrency", "Groq gateway limiter state", ("state",))
+ACTIVE_LANES = metrics.gauge("alita_active_lanes", "Chats with a reply lane running")
+STARTUP_SECONDS = metrics.gauge("alita_startup_phase_seconds", "Time spent in each startup phase", ("phase",))
+FIRST_UPDATE_SECONDS = metrics.gauge("alita_time_to_first_update_seconds",
+                                     "From the first line of bot.py to the first update received")
+VOICE_SECONDS = metrics.histogram("alita_voice_seconds", "Voice note download plus transcription time",
+                                  buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120))
+VOICE_REJECTED = metrics.counter("alita_voice_rejected_total", "Voice notes not transcribed", ("reason",))
+MEDIA_CACHE_BYTES = metrics.gauge("alita_media_cache_bytes", "Bytes of media kept in the disk cache")
+MEDIA_CACHE_LOOKUPS = metrics.counter("alita_media_cache_lookups_total", "Media cache lookups (miss = download)",
+                                      ("result",))
+PHOTO_INDEX_ENTRIES = metrics.gauge("alita_photo_index_hashes", "Distinct photo hashes in the flood window")
+LAZY_IMPORT_SECONDS = metrics.gauge("alita_lazy_import_seconds", "Import time of lazily loaded modules", ("module",))
+
+class HandlerTimer:
+    """Inner middleware: latency per handler function"""
+
+    async def __call__(self, handler, event, data: Dict):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=data["handler"].callback.__name__)
+
+async def time_bot_api(make_request, bot_instance: Bot, method):
+    """Bot session middleware: latency and errors per API method"""
+    name = method.__api_method__
+    started = time.perf_counter()
+    try:
+        return await make_request(bot_instance, method)
+    except Exception as e:
+        BOT_API_ERRORS.inc(method=name, error=type(e).__name__)
+        raise
+    finally:
+        BOT_API_SECONDS.observe(time.perf_counter() - started, method=name)
+
+def record_job_event(event):
+    """Scheduler listener: how late jobs start"""
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_MISSED.inc(job=event.job_id)
+        return
+    for run_time in event.scheduled_run_times:
+        SCHEDULER_LAG.observe(max(0.0, (datetime.now(run_time.tzinfo) - run_time).total_seconds()), job=event.job_id)
+
+first_update_seen = False
+
+def report_startup():
+    """Print the startup phase breakdown and export it as metrics"""
+    total = time.perf_counter() - STARTUP_STARTED
+    print("⏱️ Startup phases:")
+    for phase, seconds in STARTUP_PHASES:
+        STARTUP_SECONDS.set(round(seconds, 4), phase=phase)
+        print(f"• {phase:<36} {seconds * 1000:>8.0f} ms")
+    FIRST_UPDATE_SECONDS.set(round(total, 4))
+    print(f"• {'time to first update':<36} {total * 1000:>8.0f} ms")
+
+async def record_first_update(handler, event: types.Update, data: Dict):
+    """Outer update middleware: close the startup report on the first update"""
+    global first_update_seen
+    if not first_update_seen:
+        first_update_seen = True
+        mark_startup("wait for first update")
+        report_startup()
+    return await handler(event, data)
+
+def add_pre_fsm_middleware(middleware):
+    """Register an outer update middleware ahead of aiogram's FSM one (no state lookup before it)"""
+    # The manager has no public insert; its built-in order is errors, user context, FSM
+    middlewares = dp.update.outer_middleware._middlewares
+    position = next(i for i, m in enumerate(middlewares) if isinstance(m, FSMContextMiddleware))
+    middlewares.insert(position, middleware)
+
+add_pre_fsm_middleware(record_first_update)
+for observer in (dp.message, dp.callback_query, dp.chat_member, dp.my_chat_member):
+    observer.middleware(HandlerTimer())
+bot.session.middleware(time_bot_api)
 
 # --- ADVANCED FEATURES DATA ---
 MEME_TEMPLATES = [
@@ -101,9 +970,58 @@ ROAST_RESPONSES = [
     "Tumhari logic dekh ke toh Einstein bhi pagal ho jaate! 🧠💥"
 ]
 
+JOKES = [
+    "Teacher: Homework kyun nahi kiya? Student: Ma'am, main hostel mein rehta hu, aur hostel mein 'home' nahi hota! 😂",
+    "Pappu: Doctor sahab, mujhe bhoolne ki bimari hai. Doctor: Kab se? Pappu: Kya kab se? 🤔",
+    "Wife: Suno ji, main moti lag rahi hu? Husband: Nahi, tum toh bas... zyada dikh rahi ho! 🏃‍♂️💨",
+    "Santa ne WiFi ka naam rakha 'Virus'. Ab koi connect hi nahi karta! 📶😆",
+    "Exam hall mein sabse zyada dosti paper aane ke 5 minute pehle hoti hai! 📝🤝",
+    "Mummy: Phone rakh do, aankhein kharab ho jayengi. Main: Mummy, aankhein toh already 'Chashme' mein hain! 🤓"
+]
+
+# --- AUTO-MODERATION DATA ---
+# Patterns are matched against the normalized text (see normalize_text)
+GROUP_LINK_PATTERNS = [
+    r"t\.me/",
+    r"telegram\.me/",
+    r"telegram\.dog/",
+    r"tg://join",
+    r"joinchat",
+    r"chat\.whatsapp\.com/",
+    r"discord\.gg/"
+]
+
+BAD_WORDS = [
+    "madarchod", "maderchod", "behenchod", "bhenchod", "behanchod",
+    "chutiya", "chutiye", "chootiya", "gandu", "bhosdike", "bhosdi",
+    "harami", "kamina", "kamine", "randi", "lavde", "lawde", "lodu",
+    "fuck", "bitch", "bastard", "asshole", "slut", "whore",
+    "मादरचोद", "बहनचोद", "भेनचोद", "चूतिया", "चुतिया", "गांडू",
+    "भोसडीके", "हरामी", "कमीना", "रंडी"
+]
+
+WARNING_MESSAGES = [
+    "⚠️ **Warning {count}/3** for {name}!\nPlease don't {action} here! 🙏",
+    "🚨 Oye {name}! **Warning {count}/3** 😠\nYahan {action} allowed nahi hai!",
+    "👮‍♀️ {name}, ye **warning {count}/3** hai!\nDobara {action} kiya toh mute ho jaoge! 🤐"
+]
+
+# Mute length by warning count (warnings reset after a mute)
+MUTE_DURATIONS = {
+    1: timedelta(minutes=10),
+    2: timedelta(minutes=30),
+    3: timedelta(hours=1)
+}
+
+if BAD_WORDS_FILE and os.path.exists(BAD_WORDS_FILE):
+    with open(BAD_WORDS_FILE, encoding="utf-8") as f:
+        BAD_WORDS.extend(line.strip() for line in f if line.strip())
+
 # --- TIME-BASED GREETING SYSTEM ---
 greeting_scheduler = AsyncIOScheduler()
-greeted_groups: Dict[int, datetime] = {}
+greeting_scheduler.add_listener(record_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+greeted_groups: Dict[int, datetime] = BoundedDict()
+memory_registry.register("greeted_groups", greeted_groups, max_entries=MAX_TRACKED_USERS, ttl=2 * 86400)
 
 def get_indian_time():
     """Get current Indian time"""
@@ -151,9 +1069,389 @@ GREETING_STICKERS = {
     ]
 }
 
+# --- CACHING UTILITIES ---
+class AsyncTTLCache:
+    """TTL cache with single-flight loading: concurrent misses for a key share one load.
+
+    With error_ttl, a failed load is remembered too: for that long (doubling
+    with each further failure, at most `ttl`) gets re-raise it and refreshes
+    do nothing, instead of calling the loader again.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 0, stale_while_revalidate: bool = False,
+                 error_ttl: float = 0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_while_revalidate = stale_while_revalidate
+        self.error_ttl = error_ttl
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        # key -> (retry after, failures in a row, last error)
+        self._failures: "OrderedDict[Any, Tuple[float, int, Exception]]" = OrderedDict()
+        self._inflight: Dict[Any, asyncio.Future] = {}
+
+    def peek(self, key, allow_stale: bool = True):
+        """Return the cached value without loading, or None"""
+        entry = self._entries.get(key)
+        if entry and (allow_stale or entry[0] > time.monotonic()):
+            return entry[1]
+        return None
+
+    def _backing_off(self, key) -> Optional[Exception]:
+        failure = self._failures.get(key)
+        if failure and failure[0] > time.monotonic():
+            return failure[2]
+        return None
+
+    async def get(self, key, loader: Callable[[], Awaitable]):
+        entry = self._entries.get(key)
+        if entry:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            if self.stale_while_revalidate:
+                self.refresh(key, loader)
+                return entry[1]
+        error = self._backing_off(key)
+        if error is not None:
+            raise error.with_traceback(None)
+        return await self._load(key, loader)
+
+    def refresh(self, key, loader: Callable[[], Awaitable]):
+        """Reload a key in the background (no-op if a load is already running or backing off)"""
+        if key not in self._inflight and self._backing_off(key) is None:
+            task = asyncio.create_task(self._load(key, loader))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _load(self, key, loader: Callable[[], Awaitable]):
+        future = self._inflight.get(key)
+        if future:
+            return await asyncio.shield(future)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            if self.error_ttl and isinstance(e, Exception):
+                streak = self._failures.pop(key, (0, 0, None))[1] + 1
+                backoff = min(self.error_ttl * 2 ** (streak - 1), max(self.ttl, self.error_ttl))
+                self._failures[key] = (time.monotonic() + backoff, streak, e)
+                if self.maxsize and len(self._failures) > self.maxsize:
+                    self._failures.popitem(last=False)
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        
+        self._failures.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if self.maxsize and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+            self._failures.clear()
+        else:
+            self._entries.pop(key, None)
+            self._failures.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+# --- RATE LIMITING ---
+class TokenBucket:
+    """Budget of `capacity` units refilled evenly over `period` seconds"""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """Take units; may go negative to account for usage reported after the fact"""
+        self._refill()
+        self.tokens -= amount
+
+    def sync(self, remaining: float):
+        """Never believe we have more budget than the server says"""
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+    async def acquire(self, amount: float = 1):
+        while (delay := self.delay_for(amount)) > 0:
+            await asyncio.sleep(delay)
+        self.consume(amount)
+
+# --- GROQ GATEWAY ---
+class GroqOverloaded(Exception):
+    """Request could not be admitted before its deadline"""
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded FIFO wait queue"""
+
+    def __init__(self, max_limit: int, max_queue: int, min_limit: int = 1):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.max_queue = max_queue
+        self.inflight = 0
+        self._waiters: deque = deque()
+
+    async def acquire(self, deadline: float):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise GroqOverloaded("wait queue full")
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # A slot was handed over just as we gave up
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise GroqOverloaded("deadline exceeded while queued")
+            raise
+
+    def release(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        # Hand free slots straight to waiters so newcomers cannot jump the queue
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def on_success(self):
+        # Additive increase: about +1 slot per `limit` successful calls
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_overload(self):
+        # Multiplicative decrease on 429s and timeouts
+        self.limit = max(self.min_limit, self.limit / 2)
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq durations like '2.5', '7.66s', '2m59.56s' or '150ms' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+class GroqGateway:
+    """Wrapper around AsyncGroq with RPM/TPM budgets, retries and adaptive concurrency"""
+
+    def __init__(self, groq_client: AsyncGroq, rpm: int, tpm: int, max_concurrency: int,
+                 max_queue: int, deadline: float, max_retries: int):
+        self.client = groq_client
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limiter = AdaptiveLimiter(max_concurrency, max_queue)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self._paused_until = 0.0
+
+    @staticmethod
+    def estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+        return prompt_tokens(messages) + max_tokens
+
+    async def _wait_for_budget(self, tokens: int, deadline: float):
+        while True:
+            delay = max(
+                self._paused_until - time.monotonic(),
+                self.requests.delay_for(1),
+                self.tokens.delay_for(tokens)
+            )
+            if delay <= 0:
+                break
+            if time.monotonic() + delay > deadline:
+                raise GroqOverloaded("budget exhausted until after deadline")
+            await asyncio.sleep(delay)
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+
+    @staticmethod
+    def _record_usage(usage):
+        GROQ_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+        GROQ_TOKENS.inc(usage.completion_tokens, kind="completion")
+        GROQ_REQUEST_TOKENS.observe(usage.prompt_tokens, kind="prompt")
+        GROQ_REQUEST_TOKENS.observe(usage.completion_tokens, kind="completion")
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        if response is not None:
+            with suppress(TypeError, ValueError):
+                self.tokens.sync(float(response.headers.get("x-ratelimit-remaining-tokens")))
+            delay = _parse_duration(response.headers.get("retry-after"))
+            if delay is None:
+                delay = _parse_duration(response.headers.get("x-ratelimit-reset-tokens"))
+            if delay is not None:
+                return delay
+        return min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.8, 1.2)
+
+    def _handle_failure(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Back off after a retryable error; returns the delay or re-raises when out of retries"""
+        self.limiter.on_overload()
+        delay = self._retry_delay(error, attempt)
+        if isinstance(error, RateLimitError):
+            # Everyone backs off, not just this caller
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        if attempt == self.max_retries or time.monotonic() + delay > deadline:
+            raise error
+        return delay
+
+    async def create(self, **kwargs):
+        """chat.completions.create with admission control; raises on final failure"""
+        deadline = time.monotonic() + self.deadline
+        estimate = self.estimate_tokens(kwargs["messages"], kwargs.get("max_tokens") or 0)
+        
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(deadline)
+            try:
+                await self._wait_for_budget(estimate, deadline)
+                GROQ_REQUESTS.inc(mode="create")
+                started = time.perf_counter()
+                completion = await self.client.chat.completions.create(**kwargs)
+                GROQ_SECONDS.observe(time.perf_counter() - started, mode="create")
+                if completion.usage:
+                    # Correct the estimate with what Groq actually billed
+                    self.tokens.consume(completion.usage.total_tokens - estimate)
+                    self._record_usage(completion.usage)
+                self.limiter.on_success()
+                return completion
+            except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+                GROQ_ERRORS.inc(mode="create", error=type(e).__name__)
+                delay = self._handle_failure(e, attempt, deadline)
+            except Exception as e:
+                GROQ_ERRORS.inc(mode="create", error=type(e).__name__)
+                raise
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(delay)
+
+    async def stream(self, **kwargs):
+        """Streaming variant yielding content deltas; retries only before the first delta"""
+        deadline = time.monotonic() + self.deadline
+        estimate = self.estimate_tokens(kwargs["messages"], kwargs.get("max_tokens") or 0)
+        
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(deadline)
+            started = False
+            try:
+                await self._wait_for_budget(estimate, deadline)
+                GROQ_REQUESTS.inc(mode="stream")
+                request_started = time.perf_counter()
+                chunks = await self.client.chat.completions.create(stream=True, **kwargs)
+                # Closing the generator early (edit error, cancellation) closes the HTTP stream too
+                async with chunks:
+                    async for chunk in chunks:
+                        usage = chunk.x_groq.usage if chunk.x_groq else None
+                        if usage:
+                            self.tokens.consume(usage.total_tokens - estimate)
+                            self._record_usage(usage)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if not started:
+                                GROQ_FIRST_TOKEN.observe(time.perf_counter() - request_started)
+                            started = True
+                            yield chunk.choices[0].delta.content
+                GROQ_SECONDS.observe(time.perf_counter() - request_started, mode="stream")
+                self.limiter.on_success()
+                return
+            except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+                GROQ_ERRORS.inc(mode="stream", error=type(e).__name__)
+                if started:
+                    raise
+                delay = self._handle_failure(e, attempt, deadline)
+            except Exception as e:
+                GROQ_ERRORS.inc(mode="stream", error=type(e).__name__)
+                raise
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(delay)
+
+groq_gateway = GroqGateway(
+    client, GROQ_RPM, GROQ_TPM, GROQ_MAX_CONCURRENCY,
+    GROQ_QUEUE_SIZE, GROQ_DEADLINE, GROQ_MAX_RETRIES
+) if client else None
+
+# --- SHARED HTTP CLIENT ---
+_http_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Shared keep-alive session for outbound HTTP (created on first use)"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300, keepalive_timeout=60)
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+    return _http_session
+
+async def close_http_session():
+    global _http_session
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
 # --- ADVANCED UTILITY FUNCTIONS ---
+# Normalized city -> formatted weather text
+weather_cache = AsyncTTLCache(WEATHER_CACHE_TTL, maxsize=512)
+
+def normalize_city(city: str) -> str:
+    return " ".join(city.split()).casefold()
+
+async def fetch_weather(city: str) -> str:
+    """Call OpenWeatherMap (or WEATHER_API_URL stand-in); raises on service errors"""
+    params = {"q": city, "appid": WEATHER_API_KEY, "units": "metric"}
+    async with get_http_session().get(WEATHER_API_URL, params=params) as response:
+        data = await response.json(content_type=None)
+        if response.status == 200:
+            return (
+                f"🌤️ Weather in {data['name']}\n"
+                f"• Temperature: {data['main']['temp']}°C\n"
+                f"• Condition: {data['weather'][0]['description'].title()}\n"
+                f"• Humidity: {data['main']['humidity']}%\n"
+                f"• Wind: {data['wind']['speed']} m/s"
+            )
+        if response.status == 404:
+            return f"❌ City not found! Try: Mumbai, Delhi, Bangalore"
+        raise RuntimeError(f"Weather API returned {response.status}")
+
 async def get_weather_real(city: str) -> str:
     """Get real weather data"""
+    city_key = normalize_city(city)
     try:
         if WEATHER_API_KEY == "demo_key":
             # Demo data
@@ -162,7 +1460,7 @@ async def get_weather_real(city: str) -> str:
                 "delhi": {"temp": 28, "condition": "Partly Cloudy", "humidity": 55},
                 "bangalore": {"temp": 26, "condition": "Light Rain", "humidity": 70}
             }
-            city_data = demo_weather.get(city.lower(), {"temp": 30, "condition": "Clear", "humidity": 60})
+            city_data = demo_weather.get(city_key, {"temp": 30, "condition": "Clear", "humidity": 60})
             return (
                 f"🌤️ Weather in {city.title()}\n"
                 f"• Temperature: {city_data['temp']}°C\n"
@@ -170,21 +1468,8 @@ async def get_weather_real(city: str) -> str:
                 f"• Humidity: {city_data['humidity']}%"
             )
         
-        # Real API call
-        async with aiohttp.ClientSession() as session:
-            url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={WEATHER_API_KEY}&units=metric"
-            async with session.get(url) as response:
-                data = await response.json()
-                if response.status == 200:
-                    return (
-                        f"🌤️ Weather in {data['name']}\n"
-                        f"• Temperature: {data['main']['temp']}°C\n"
-                        f"• Condition: {data['weather'][0]['description'].title()}\n"
-                        f"• Humidity: {data['main']['humidity']}%\n"
-                        f"• Wind: {data['wind']['speed']} m/s"
-                    )
-                else:
-                    return f"❌ City not found! Try: Mumbai, Delhi, Bangalore"
+        # Real API call, coalesced: concurrent requests for a city share one upstream call
+        return await weather_cache.get(city_key, lambda: fetch_weather(city_key))
     except:
         return "⚠️ Weather service unavailable!"
 
@@ -304,6 +1589,16 @@ QUICK_RESPONSES = {
     ]
 }
 
+# Words that trigger each quick response ("thank you" is a phrase, "stem*" matches the start of a word)
+QUICK_RESPONSE_KEYWORDS = {
+    "greeting": ["hi", "hii", "hello", "hey", "namaste", "hola"],
+    "goodbye": ["bye", "goodbye", "tata", "alvida"],
+    "thanks": ["thanks", "thank you", "thanku", "thnx", "dhanyavad"],
+    "sorry": ["sorry", "maaf", "apology"]
+}
+# Emoji mood of each quick response (None = any)
+QUICK_RESPONSE_EMOTIONS = {"greeting": "happy", "goodbye": None, "thanks": "love", "sorry": "crying"}
+
 # --- STATES FOR ADVANCED FEATURES ---
 class UserStates(StatesGroup):
     setting_reminder = State()
@@ -312,6 +1607,18 @@ class UserStates(StatesGroup):
     voice_chat = State()
 
 # --- HUMAN-LIKE BEHAVIOUR ---
+# Words that set a user's emotion; on equal hits the earlier emotion wins
+EMOTION_KEYWORDS = {
+    "love": ["love", "pyaar*", "pyar*", "dil", "heart", "cute", "beautiful", "sweet"],
+    "angry": ["angry", "gussa", "naraz", "mad", "hate", "idiot", "stupid"],
+    "crying": ["cry*", "ro", "rona", "rone", "rula*", "sad", "dukh*", "upset", "unhappy", "depressed"],
+    "funny": ["funny", "hasna", "hasi", "haso", "hasu", "joke*", "comedy", "masti", "laugh*", "haha*", "lol*"],
+    "happy": ["hi", "hii", "hello", "hey", "namaste", "kaise", "welcome"],
+    "thinking": ["?", "kyun", "kyu", "kaise", "kya", "how", "why", "what"],
+    "protective": ["fight*", "ladai", "war", "attack*", "defend*"],
+    "sleepy": ["sleep*", "sone", "neend", "tired", "thak*"]
+}
+
 EMOTIONAL_RESPONSES = {
     "happy": ["😊", "🎉", "🥳", "🌟", "✨", "👍", "💫", "😄", "😍", "🤗", "🫂"],
     "angry": ["😠", "👿", "💢", "🤬", "😤", "🔥", "⚡", "💥", "👊"],
@@ -337,49 +1644,230 @@ def get_emotion(emotion_type: str = None, user_id: int = None) -> str:
     all_emotions = list(EMOTIONAL_RESPONSES.values())
     return random.choice(random.choice(all_emotions))
 
-def update_user_emotion(user_id: int, message: str):
-    message_lower = message.lower()
-    
-    if any(word in message_lower for word in ['love', 'pyaar', 'dil', 'heart', 'cute', 'beautiful', 'sweet']):
-        user_emotions[user_id] = "love"
-    elif any(word in message_lower for word in ['angry', 'gussa', 'naraz', 'mad', 'hate', 'idiot', 'stupid']):
-        user_emotions[user_id] = "angry"
-    elif any(word in message_lower for word in ['cry', 'ro', 'sad', 'dukh', 'upset', 'unhappy', 'depressed']):
-        user_emotions[user_id] = "crying"
-    elif any(word in message_lower for word in ['funny', 'has', 'joke', 'comedy', 'masti', 'laugh', 'haha']):
-        user_emotions[user_id] = "funny"
-    elif any(word in message_lower for word in ['hi', 'hello', 'hey', 'namaste', 'kaise', 'welcome']):
-        user_emotions[user_id] = "happy"
-    elif any(word in message_lower for word in ['?', 'kyun', 'kaise', 'kya', 'how', 'why', 'what']):
-        user_emotions[user_id] = "thinking"
-    elif any(word in message_lower for word in ['fight', 'ladai', 'war', 'attack', 'defend']):
-        user_emotions[user_id] = "protective"
-    elif any(word in message_lower for word in ['sleep', 'sone', 'neend', 'tired', 'thak']):
-        user_emotions[user_id] = "sleepy"
-    else:
-        user_emotions[user_id] = random.choice(list(EMOTIONAL_RESPONSES.keys()))
+class Classification(NamedTuple):
+    emotions: Tuple[Tuple[str, int], ...]  # (EMOTION_KEYWORDS label, hits), strongest first
+    intents: Tuple[Tuple[str, int], ...]   # (QUICK_RESPONSES key, hits), strongest first
+
+    @property
+    def emotion(self) -> Optional[str]:
+        return self.emotions[0][0] if self.emotions else None
+
+    @property
+    def intent(self) -> Optional[str]:
+        return self.intents[0][0] if self.intents else None
+
+class MessageClassifier:
+    """Emotion and quick-response intent from a single pass over a message.
+
+    Keywords match whole words ("hi" no longer fires inside "nahi"), phrases,
+    or word starts when written as "stem*". Whole words and phrases may stretch
+    their last letter ("hiii", "byeee"). One precompiled regex yields only the
+    keywords present; a hash map turns each into the labels it counts for.
+    Labels are ranked by hits, then table order.
+    """
+
+    def __init__(self, emotions: Dict[str, List[str]], intents: Dict[str, List[str]]):
+        # Label ids: emotions first, then intents; lower id wins ties
+        self._labels = list(emotions) + list(intents)
+        self._emotion_count = len(emotions)
+        self._keywords: Dict[str, List[int]] = defaultdict(list)  # matched text -> label ids
+        self._stretched: Dict[str, List[int]] = {}  # whole word with its last letter once -> label ids
+        by_letter = defaultdict(lambda: ([], []))  # first letter -> (rest of whole words, rest of stems)
+        symbols = []
+        for label_id, keywords in enumerate(list(emotions.values()) + list(intents.values())):
+            for keyword in keywords:
+                is_stem = keyword.endswith("*")
+                keyword = keyword.rstrip("*")
+                self._keywords[keyword].append(label_id)
+                if not is_stem:
+                    self._stretched.setdefault(self._squash(keyword), self._keywords[keyword])
+                if keyword[0].isalnum():
+                    by_letter[keyword[0]][is_stem].append(keyword[1:])
+                else:
+                    symbols.append(keyword)
+        self._keywords = dict(self._keywords)
+        
+        def alternatives(keywords, stretch=False):
+            # Longest first, so "thank you" is tried before "thank"
+            return "|".join(
+                re.escape(keyword[:-1]) + re.escape(keyword[-1]) + "+" if stretch and keyword else re.escape(keyword)
+                for keyword in sorted(set(keywords), key=len, reverse=True)
+            )
+        # Every branch opens with a literal, so the regex engine skips straight to
+        # letters that can start a keyword; the word boundary is checked after it
+        branches = []
+        for letter, (words, stems) in sorted(by_letter.items()):
+            rests = ([rf"(?:{alternatives(words, stretch=True)})(?![^\W_])"] if words else []) + \
+                    ([f"(?:{alternatives(stems)})"] if stems else [])
+            letter = re.escape(letter)
+            branches.append(rf"{letter}(?<![^\W_]{letter})(?:{'|'.join(rests)})")
+        if symbols:
+            branches.append(alternatives(symbols))
+        self._pattern = re.compile("|".join(branches))
+
+    @staticmethod
+    def _squash(word: str) -> str:
+        return word.rstrip(word[-1]) + word[-1]  # "heyyy" -> "hey"
+
+    def classify(self, text: str) -> Classification:
+        hits: Dict[int, int] = {}
+        for keyword in self._pattern.findall(text.lower()):
+            label_ids = self._keywords.get(keyword)
+            if label_ids is None:
+                label_ids = self._stretched[self._squash(keyword)]
+            for label_id in label_ids:
+                hits[label_id] = hits.get(label_id, 0) + 1
+        
+        ranked = sorted(hits.items(), key=lambda item: (-item[1], item[0]))
+        return Classification(
+            tuple((self._labels[label_id], count) for label_id, count in ranked if label_id < self._emotion_count),
+            tuple((self._labels[label_id], count) for label_id, count in ranked if label_id >= self._emotion_count)
+        )
+
+    def classify_batch(self, texts: List[str]) -> List[Classification]:
+        return [self.classify(text) for text in texts]
+
+message_classifier = MessageClassifier(EMOTION_KEYWORDS, QUICK_RESPONSE_KEYWORDS)
+EMOTION_NAMES = list(EMOTIONAL_RESPONSES)
+
+def update_user_emotion(user_id: int, message: str, classification: Optional[Classification] = None):
+    if classification is None:
+        classification = message_classifier.classify(message)
+    user_emotions[user_id] = classification.emotion or random.choice(EMOTION_NAMES)
     
     user_last_interaction[user_id] = datetime.now()
+    state_store.mark_dirty("user_last_interaction", user_id)
+
+# --- BOT METADATA ---
+# Our own identity, filled once at startup in main()
+bot_info: Optional[types.User] = None
+
+async def get_bot_info() -> types.User:
+    """Get the bot's own user object (network only on the very first call)"""
+    global bot_info
+    if bot_info is None:
+        bot_info = await bot.get_me()
+    return bot_info
+
+# chat_id -> set of admin user ids
+chat_admins = AsyncTTLCache(ADMIN_CACHE_TTL, maxsize=MAX_TRACKED_CHATS, stale_while_revalidate=True,
+                            error_ttl=ADMIN_CACHE_ERROR_TTL)
+memory_registry.register("chat_admins", chat_admins._entries)
+
+async def _fetch_admin_ids(chat_id: int) -> Set[int]:
+    admins = await bot.get_chat_administrators(chat_id)
+    return {member.user.id for member in admins}
+
+async def get_chat_admin_ids(chat_id: int) -> Set[int]:
+    """Get admin ids for a chat (cached; stale entries are refreshed in the background)"""
+    return await chat_admins.get(chat_id, lambda: _fetch_admin_ids(chat_id))
+
+async def is_chat_admin(message: Message, wait: bool = True) -> bool:
+    """Check if the sender is a chat admin using the cached admin list.
+
+    With wait=False an unknown chat is never fetched inline: the load starts
+    in the background and the sender is treated as a regular member for now.
+    """
+    chat_id = message.chat.id
+    if message.sender_chat and message.sender_chat.id == chat_id:
+        return True  # Anonymous admin posting as the group
+    
+    if not wait and chat_admins.peek(chat_id) is None:
+        chat_admins.refresh(chat_id, lambda: _fetch_admin_ids(chat_id))
+        return False
+    
+    try:
+        admin_ids = await get_chat_admin_ids(chat_id)
+    except Exception as e:
+        print(f"Failed to fetch admins for {chat_id}: {e}")
+        return False
+    return message.from_user.id in admin_ids
 
 # --- AUTO-MODERATION FUNCTIONS ---
+# Removed after NFKD: combining accents, Devanagari nukta (ज़ -> ज) and zero-width/soft-hyphen chars
+_MARKS_PATTERN = re.compile("[\u0300-\u036f\u093c\u200b\u200c\u200d\u2060\ufeff\u00ad]+")
+# ASCII only; on non-ASCII text it runs on the UTF-8 bytes (a per-char str.translate costs ~30 µs there)
+_LEET_FROM, _LEET_TO = "013457@$!", "oieastasi"
+_LEETSPEAK = str.maketrans(_LEET_FROM, _LEET_TO)
+_LEETSPEAK_BYTES = bytes.maketrans(_LEET_FROM.encode(), _LEET_TO.encode())
+
+def normalize_text(text: str) -> str:
+    """Normalize text for moderation: Unicode, accents, case, leetspeak and Devanagari"""
+    if text.isascii():
+        return text.casefold().translate(_LEETSPEAK)
+    # NFKD splits accents and compatibility forms (fullwidth, ligatures, क़ -> क + ़)
+    text = unicodedata.normalize("NFKD", text)
+    text = unicodedata.normalize("NFC", _MARKS_PATTERN.sub("", text))
+    text = text.casefold().replace("\u0901", "\u0902")  # Chandrabindu -> anusvara (माँ -> मां)
+    # UTF-8 never uses ASCII bytes inside multi-byte characters, so this only touches ASCII
+    return text.encode("utf-8", "surrogatepass").translate(_LEETSPEAK_BYTES).decode("utf-8", "surrogatepass")
+
+def _trie_regex(words: List[str]) -> str:
+    """Build a prefix-trie regex so matching cost depends on word length, not list size"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = []
+        chars = []
+        for ch in sorted(k for k in node if k):
+            child = node[ch]
+            if "" in child:
+                # Prefix semantics: a shorter word already matches, longer ones are redundant
+                chars.append(re.escape(ch))
+            else:
+                branches.append(re.escape(ch) + build(child))
+        if chars:
+            branches.append(chars[0] if len(chars) == 1 else f"[{''.join(chars)}]")
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return build(trie) if trie else "(?!)"
+
+class ModerationVerdict(NamedTuple):
+    link: bool
+    bad_words: bool
+
+class ModerationEngine:
+    """Compiled link and bad-word matchers over one normalized copy of the text.
+
+    Bad words match at the start of a word, so inflections ("chutiyapa") are
+    caught but words that merely contain one ("grandiose") are not. Links are
+    searched separately so an adjacent bad word cannot hide them.
+    """
+
+    def __init__(self, bad_words: List[str], link_patterns: List[str], cache_size: int = 2048):
+        words = sorted({normalize_text(w) for w in bad_words if w.strip()})
+        self.link_pattern = re.compile("|".join(f"(?:{p})" for p in link_patterns) or "(?!)")
+        self.bad_pattern = re.compile(rf"(?<![^\W_]){_trie_regex(words)}")
+        self.word_count = len(words)
+        # Repeated texts (spam floods, re-checks in get_ai_response) skip the scan entirely
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    def _scan(self, text: str) -> ModerationVerdict:
+        text = normalize_text(text)
+        return ModerationVerdict(
+            self.link_pattern.search(text) is not None,
+            self.bad_pattern.search(text) is not None
+        )
+
+moderation = ModerationEngine(BAD_WORDS, GROUP_LINK_PATTERNS)
+
 def contains_group_link(text: str) -> bool:
     """Check if message contains Telegram group links"""
-    text = text.lower()
-    for pattern in GROUP_LINK_PATTERNS:
-        if re.search(pattern, text):
-            return True
-    return False
+    return moderation.scan(text).link
 
 def contains_bad_words(text: str) -> bool:
     """Check if message contains bad words"""
-    text_lower = text.lower()
-    for word in BAD_WORDS:
-        if word in text_lower:
-            return True
-    return False
+    return moderation.scan(text).bad_words
 
 async def give_warning(chat_id: int, user_id: int, username: str, reason: str) -> tuple[bool, str]:
     """Give warning to user and return if action should be taken"""
+    if chat_id not in user_warnings:
+        await state_store.restore("user_warnings", chat_id)
     warnings = user_warnings[chat_id][user_id]
     
     # Initialize warning data
@@ -391,6 +1879,7 @@ async def give_warning(chat_id: int, user_id: int, username: str, reason: str) -
     warnings['count'] += 1
     warnings['reasons'].append(reason)
     warnings['last_warning'] = datetime.now()
+    state_store.mark_dirty("user_warnings", chat_id)
     
     warning_count = warnings['count']
     
@@ -398,6 +1887,7 @@ async def give_warning(chat_id: int, user_id: int, username: str, reason: str) -
     actions_map = {
         "spam": "spam messages",
         "link": "share group links",
+        "photo_spam": "repost the same pictures",
         "bad_words": "use bad language",
         "manual_warning": "violate rules"
     }
@@ -433,6 +1923,7 @@ async def give_warning(chat_id: int, user_id: int, username: str, reason: str) -
             
             # Clear warnings after mute
             del user_warnings[chat_id][user_id]
+            state_store.mark_dirty("user_warnings", chat_id)
             
             duration_str = ""
             if mute_duration.days > 0:
@@ -460,6 +1951,8 @@ async def delete_and_warn(message: Message, reason: str):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name
     
+    MODERATION_HITS.inc(reason=reason)
+    
     # Delete the offensive message
     try:
         await message.delete()
@@ -483,67 +1976,601 @@ async def delete_and_warn(message: Message, reason: str):
         ]
         await message.answer(random.choice(sassy_responses))
 
+# --- DIAGNOSTICS ---
+# Nothing here runs until an admin asks for it: no hooks, no threads while idle.
+class SamplingProfiler:
+    """CPU sampler driven by a SIGPROF interval timer, reported as collapsed stacks.
+
+    The handler runs in the main thread (where the event loop lives) and
+    records the frame it interrupted. No timer is armed between profiles.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.running = False
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def _on_signal(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        self._counts[";".join(reversed(stack))] += 1
+
+    async def profile(self, seconds: float) -> str:
+        """Sample CPU time for `seconds`; one "stack count" line per stack"""
+        if not hasattr(signal, "setitimer"):
+            raise RuntimeError("profiling needs SIGPROF (Unix)")
+        if self.running:
+            raise RuntimeError("a profile is already running")
+        self.running = True
+        self._counts = defaultdict(int)
+        previous = signal.signal(signal.SIGPROF, self._on_signal)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+            self.running = False
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self._counts.items(), key=lambda item: -item[1]))
+
+class MemoryTracer:
+    """tracemalloc snapshots; each diff is against the previous snapshot"""
+
+    def __init__(self):
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+
+    async def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.snapshot = await asyncio.to_thread(self._take)
+
+    async def diff(self, limit: int = 25) -> str:
+        if self.snapshot is None:
+            raise RuntimeError("tracing is not started")
+        current = await asyncio.to_thread(self._take)
+        stats = current.compare_to(self.snapshot, "lineno")[:limit]
+        self.snapshot = current
+        traced, peak = tracemalloc.get_traced_memory()
+        header = f"traced {traced / 1048576:.1f} MiB, peak {peak / 1048576:.1f} MiB"
+        return "\n".join([header] + [str(stat) for stat in stats])
+
+    def stop(self):
+        tracemalloc.stop()
+        self.snapshot = None
+
+def dump_tasks() -> str:
+    """Stacks of every asyncio task in this process"""
+    out = io.StringIO()
+    tasks = asyncio.all_tasks()
+    out.write(f"{len(tasks)} tasks\n\n")
+    for task in tasks:
+        task.print_stack(limit=20, file=out)
+        out.write("\n")
+    return out.getvalue()
+
+profiler = SamplingProfiler()
+memory_tracer = MemoryTracer()
+
 # --- SPAM DETECTION ---
 async def check_spam(message: Message) -> bool:
-    """Check if user is spamming"""
+    """Check if user is spamming (more than spam_limit messages within spam_window seconds)"""
     chat_id = message.chat.id
     user_id = message.from_user.id
     
-    # Initialize user tracking
-    if user_id not in last_messages[chat_id]:
-        last_messages[chat_id][user_id] = []
+    # Read without creating a settings entry for every chat we see
+    settings = group_settings.get(chat_id, DEFAULT_GROUP_SETTINGS)
+    limit = settings.get("spam_limit", SPAM_LIMIT)
+    window = min(settings.get("spam_window", SPAM_WINDOW), SPAM_IDLE_TTL)
     
-    # Add current message timestamp
-    now = datetime.now()
-    last_messages[chat_id][user_id].append(now)
+    # Ring buffer holding the last limit+1 timestamps
+    key = (chat_id, user_id)
+    timestamps = last_messages.get(key)
+    if timestamps is None or timestamps.maxlen != limit + 1:
+        timestamps = deque(timestamps or (), maxlen=limit + 1)
+        last_messages[key] = timestamps
+    last_messages.move_to_end(key)
     
-    # Keep only last 30 seconds of messages
-    last_messages[chat_id][user_id] = [
-        ts for ts in last_messages[chat_id][user_id]
-        if (now - ts).seconds <= 30
-    ]
+    now = time.monotonic()
+    timestamps.append(now)
     
-    # Check if spamming
-    if len(last_messages[chat_id][user_id]) > SPAM_LIMIT:
-        # User is spamming
+    # Buffer full and the oldest entry still inside the window = too many messages
+    if len(timestamps) > limit and now - timestamps[0] <= window:
         await delete_and_warn(message, "spam")
         return True
     
     return False
 
-# --- VOICE MESSAGE HANDLER ---
-async def handle_voice_message(message: Message):
-    """Handle voice messages"""
-    try:
-        # Download voice file
-        file = await bot.get_file(message.voice.file_id)
-        file_path = file.file_path
+async def evict_idle_spam_trackers():
+    """Drop spam trackers idle longer than SPAM_IDLE_TTL (runs on the scheduler)"""
+    cutoff = time.monotonic() - SPAM_IDLE_TTL
+    # Entries are kept in last-activity order, so stop at the first fresh one
+    while last_messages:
+        key, timestamps = next(iter(last_messages.items()))
+        if timestamps and timestamps[-1] > cutoff:
+            break
+        del last_messages[key]
+
+# --- MEDIA CACHE ---
+class _HashingWriter:
+    """Download destination that hashes and writes chunks on a worker thread.
+
+    aiogram calls write() on the event loop for every chunk; it only queues
+    the chunk, so disk writes and hashing never hold up other chats.
+    """
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self._chunks: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        self._chunks.put(chunk)
+
+    def flush(self):
+        pass  # Called per chunk by aiogram; the file is flushed once at the end
+
+    def close(self):
+        self._chunks.put(None)
+
+    def drain(self):
+        """Worker thread: hash and write queued chunks until close()"""
+        with os.fdopen(self.fd, "wb") as f:
+            while (chunk := self._chunks.get()) is not None:
+                self.digest.update(chunk)
+                f.write(chunk)
+
+class MediaCache:
+    """Telegram files on disk, keyed by file_unique_id and stored by content.
+
+    Blobs live at sha256/<aa>/<digest>; ids/<file_unique_id> is a symlink to
+    the blob, so forwards of the same file (same unique id) and re-uploads of
+    the same bytes (new id, same digest) share one copy. Writes go to a temp
+    file in the cache and are renamed into place (atomic). Concurrent requests
+    for one file share a single download. Least recently used blobs are
+    deleted beyond `max_bytes`, except those a caller is still reading.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._blobs: OrderedDict[str, int] = OrderedDict()  # digest -> size, least recently used first
+        self._ids: Dict[str, str] = {}                       # file_unique_id -> digest
+        self._names: Dict[str, Set[str]] = defaultdict(set)  # digest -> file_unique_ids
+        self._pins: Dict[str, int] = defaultdict(int)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._scanned: Optional[asyncio.Future] = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "sha256", digest[:2], digest)
+
+    def _id_path(self, file_unique_id: str) -> str:
+        return os.path.join(self.root, "ids", file_unique_id)
+
+    def _scan(self):
+        """Rebuild the index from disk; LRU order follows blob mtimes (touched on every hit)"""
+        self._blobs.clear()  # A retry after a failed scan starts over
+        self._ids.clear()
+        self._names.clear()
+        self.size = 0
+        for sub in ("sha256", "ids", "tmp"):
+            os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+        for name in os.listdir(os.path.join(self.root, "tmp")):
+            with suppress(OSError):
+                os.remove(os.path.join(self.root, "tmp", name))  # Interrupted downloads
+        blobs = []
+        for entry in os.scandir(os.path.join(self.root, "sha256")):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                with suppress(OSError):  # Deleted meanwhile, unreadable, ...
+                    stat = blob.stat()
+                    blobs.append((stat.st_mtime, blob.name, stat.st_size))
+        for _, digest, size in sorted(blobs):
+            self._blobs[digest] = size
+            self.size += size
+        for link in os.scandir(os.path.join(self.root, "ids")):
+            # A stray file (not a symlink) or a dangling link is dropped, not fatal
+            with suppress(OSError):
+                digest = os.path.basename(os.readlink(link.path)) if link.is_symlink() else None
+                if digest in self._blobs:
+                    self._ids[link.name] = digest
+                    self._names[digest].add(link.name)
+                else:
+                    os.remove(link.path)
+
+    def _place(self, temp: str, digest: str):
+        os.makedirs(os.path.dirname(self._blob_path(digest)), exist_ok=True)
+        os.replace(temp, self._blob_path(digest))
+
+    def _link(self, file_unique_id: str, digest: str):
+        temp = os.path.join(self.root, "tmp", f"{file_unique_id}.link")
+        with suppress(FileNotFoundError):
+            os.remove(temp)
+        os.symlink(os.path.relpath(self._blob_path(digest), os.path.join(self.root, "ids")), temp)
+        os.replace(temp, self._id_path(file_unique_id))
+
+    def _evict(self):
+        if self.size <= self.max_bytes:
+            return
+        for digest in list(self._blobs):
+            if self.size <= self.max_bytes:
+                break
+            if self._pins[digest]:
+                continue
+            self.size -= self._blobs.pop(digest)
+            for file_unique_id in self._names.pop(digest, ()):
+                del self._ids[file_unique_id]
+                with suppress(OSError):
+                    os.remove(self._id_path(file_unique_id))
+            with suppress(OSError):
+                os.remove(self._blob_path(digest))
+
+    async def _download(self, file_id: str, file_unique_id: str) -> str:
+        """Only the network reads run on the loop; file writes, renames and links go to threads"""
+        file = await bot.get_file(file_id)
+        fd, temp = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        writer = _HashingWriter(fd)
+        try:
+            drained = asyncio.ensure_future(asyncio.to_thread(writer.drain))
+            try:
+                await bot.download_file(file.file_path, destination=writer, seek=False)
+            finally:
+                writer.close()
+                await drained
+            digest = writer.digest.hexdigest()
+            duplicate = digest in self._blobs  # Same bytes under another unique id
+            if not duplicate:
+                await asyncio.to_thread(self._place, temp, digest)
+                if digest not in self._blobs:  # Unless the same bytes landed meanwhile
+                    self._blobs[digest] = writer.size
+                    self.size += writer.size
+        except BaseException:
+            with suppress(OSError):
+                os.remove(temp)
+            raise
+        # No await since the blob was checked or added, so ids only ever point at indexed blobs
+        self._ids[file_unique_id] = digest
+        self._names[digest].add(file_unique_id)
+        if duplicate:
+            with suppress(OSError):
+                await asyncio.to_thread(os.remove, temp)
+        await asyncio.to_thread(self._link, file_unique_id, digest)
+        return digest
+
+    async def _lookup(self, file_id: str, file_unique_id: str) -> str:
+        if self._scanned is None:
+            self._scanned = asyncio.ensure_future(asyncio.to_thread(self._scan))
+        scanned = self._scanned
+        try:
+            await asyncio.shield(scanned)
+        except Exception:
+            # Don't cache the failure: the next fetch scans again
+            if self._scanned is scanned:
+                self._scanned = None
+            raise
+        digest = self._ids.get(file_unique_id)
+        if digest is not None:
+            self.hits += 1
+            self._blobs.move_to_end(digest)
+            with suppress(OSError):
+                os.utime(self._blob_path(digest))
+            return digest
         
-        # Download to temp file
-        voice_file = await bot.download_file(file_path)
+        # Single flight: later callers wait for the download already running
+        pending = self._inflight.get(file_unique_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        self.misses += 1
+        pending = self._inflight[file_unique_id] = asyncio.ensure_future(self._download(file_id, file_unique_id))
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if pending.done():
+                del self._inflight[file_unique_id]
+            else:
+                pending.add_done_callback(lambda _: self._inflight.pop(file_unique_id, None))
+
+    @asynccontextmanager
+    async def fetch(self, file_id: str, file_unique_id: str):
+        """Path of the file's bytes, valid (not evicted) until the block exits"""
+        if self.max_bytes <= 0:
+            fd, path = tempfile.mkstemp(prefix="alita-media-")
+            os.close(fd)
+            try:
+                file = await bot.get_file(file_id)
+                await bot.download_file(file.file_path, destination=path)
+                yield path
+            finally:
+                with suppress(OSError):
+                    os.remove(path)
+            return
         
-        # Convert voice to text (using basic recognition)
-        # Note: This is a simplified version
+        digest = await self._lookup(file_id, file_unique_id)
+        while digest not in self._blobs:
+            # Evicted by another caller before we got to pin it
+            digest = await self._lookup(file_id, file_unique_id)
+        self._pins[digest] += 1
+        try:
+            yield self._blob_path(digest)
+        finally:
+            self._pins[digest] -= 1
+            if not self._pins[digest]:
+                del self._pins[digest]
+            self._evict()
+
+@contextmanager
+def map_media(path: str):
+    """Read-only mmap of a cached file: workers read the page cache, no copy into the process"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MB * 1024 * 1024)
+
+# --- MEDIA WORKERS ---
+class LazyProcessPool:
+    """Spawn-context process pool, started on first use and replaced if a worker dies"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def run(self, fn: Callable, *args):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        except BrokenProcessPool:
+            # E.g. a worker killed for memory; the next job gets a fresh pool
+            self._pool = None
+            raise
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# --- VOICE MESSAGE HANDLER ---
+_whisper_model = None  # Loaded by the first job of each transcription process, then kept warm
+
+def transcribe_voice_file(path: str, max_seconds: int) -> str:
+    """Runs in the pool: decode OGG/Opus (pydub + ffmpeg) and transcribe offline"""
+    global _whisper_model
+    import numpy as np
+    if _whisper_model is None:
+        from faster_whisper import WhisperModel
+        _whisper_model = WhisperModel(VOICE_MODEL, device="cpu", compute_type="int8", cpu_threads=VOICE_CPU_THREADS)
+    audio = pydub.AudioSegment.from_file(path)[:max_seconds * 1000]
+    audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype=np.int16).astype(np.float32) / 32768.0
+    segments, _ = _whisper_model.transcribe(samples, language=VOICE_LANGUAGE, beam_size=1, vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments).strip()
+
+class VoicePipeline:
+    """Voice note -> text: streamed into the media cache, transcribed in a bounded process pool"""
+
+    def __init__(self, workers: int, max_pending: int, max_seconds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_seconds = max_seconds
+        self.pending = 0  # Notes downloading, queued or transcribing
+        # Started on the first voice note; text-only deployments never pay for it
+        self.pool = LazyProcessPool(workers)
+
+    def try_acquire(self) -> bool:
+        """Reserve a slot before the first await, so concurrent notes cannot overshoot max_pending"""
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        return True
+
+    async def transcribe(self, voice: types.Voice) -> str:
+        """Transcribe with a slot from try_acquire(); the slot is released here"""
+        started = time.perf_counter()
+        try:
+            # Written to disk in chunks, never held in memory as a whole
+            async with media_cache.fetch(voice.file_id, voice.file_unique_id) as path:
+                return await self.pool.run(transcribe_voice_file, path, self.max_seconds)
+        finally:
+            self.pending -= 1
+            VOICE_SECONDS.observe(time.perf_counter() - started)
+
+voice_pipeline = VoicePipeline(VOICE_WORKERS, VOICE_QUEUE_MAX, VOICE_MAX_SECONDS)
+
+async def handle_voice_message(message: Message):
+    """Transcribe voice notes and answer them like text"""
+    # In groups only notes that reply to the bot are transcribed
+    is_reply_to_bot = message.reply_to_message and message.reply_to_message.from_user.id == bot.id
+    if message.chat.type != "private" and not is_reply_to_bot:
+        return
+    
+    if message.voice.duration > VOICE_MAX_SECONDS:
+        VOICE_REJECTED.inc(reason="too_long")
         await message.reply(
-            f"{get_emotion('surprise')} **Voice Message Received!** 🎤\n\n"
-            f"Sorry, voice recognition is still learning! 🧠\n"
-            f"But I love hearing your voice! 💖\n\n"
-            f"Try texting me instead! 💬",
-            parse_mode="Markdown"
+            f"{get_emotion('thinking')} Itna lamba voice note? 😅\n"
+            f"Max {VOICE_MAX_SECONDS} seconds please, ya phir text kar do! 💬"
+        )
+        return
+    
+    if not voice_pipeline.try_acquire():
+        VOICE_REJECTED.inc(reason="busy")
+        await message.reply(
+            f"{get_emotion('crying')} Abhi bahut saare voice notes sun rahi hu! 🎧\n"
+            f"Thodi der baad bhejo ya text kar do! 💫"
         )
+        return
+    
+    try:
+        async with keep_typing(message.chat.id):
+            transcript = await voice_pipeline.transcribe(message.voice)
     except Exception as e:
+        VOICE_REJECTED.inc(reason="error")
+        print(f"❌ Voice transcription error: {e}")
         await message.reply(
             f"{get_emotion('crying')} Couldn't process voice message! 😢\n"
             f"Try sending a text instead! 💫"
         )
+        return
+    
+    if not transcript:
+        VOICE_REJECTED.inc(reason="empty")
+        await message.reply(f"{get_emotion('surprise')} Kuch sunai nahi diya! 🙉 Ek baar phir bolo? 🎤")
+        return
+    
+    # Same lane as text, so replies and chat memory stay in order
+    chat_lanes.submit(message, transcript)
 
 # --- IMAGE HANDLER ---
+def photo_dhash(path: str) -> int:
+    """Runs in a thread: 64-bit difference hash (brightness gradients of a 9x8 grayscale copy)"""
+    with map_media(path) as data, Image.open(data) as image:
+        pixels = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            value = (value << 1) | (pixels[col] < pixels[col + 1])
+    return value
+
+class PhotoHashIndex:
+    """Near-duplicate lookup over 64-bit image hashes seen within `window` seconds.
+
+    Multi-index hashing: every hash is filed under each of its three 21/21/22-bit
+    chunks. Hashes within Hamming distance r agree on at least one chunk to
+    within r // 3 bits (pigeonhole), so a query only probes those chunk values:
+    3 buckets for r <= 2, 66 for r <= 5, ~700 for r <= 8. With up to a few
+    million hashes most buckets hold a single one.
+    """
+
+    SHIFTS = (0, 21, 42)
+    WIDTHS = (21, 21, 22)
+    MAX_DISTANCE = 8
+    MAX_SIGHTINGS = 64  # Per distinct hash; enough to tell a flood
+
+    def __init__(self, window: float, max_entries: int):
+        self.window = window
+        self.max_entries = max_entries
+        # hash -> (monotonic time, user_id) of each post, least recently seen hash first
+        self._sightings: OrderedDict[int, List[Tuple[float, int]]] = OrderedDict()
+        # chunk value -> hash, or list of hashes when several share it (saves a set per entry)
+        self._tables: List[Dict[int, Any]] = [{} for _ in self.SHIFTS]
+        # radius -> per chunk, XOR masks of every value within that many bits
+        self._flips = [
+            [tuple(sum(1 << bit for bit in bits) for n in range(radius + 1)
+                   for bits in itertools.combinations(range(width), n)) for width in self.WIDTHS]
+            for radius in range(self.MAX_DISTANCE // len(self.SHIFTS) + 1)
+        ]
+
+    def __len__(self):
+        return len(self._sightings)
+
+    def _chunks(self, value: int) -> List[int]:
+        return [(value >> shift) & ((1 << width) - 1) for shift, width in zip(self.SHIFTS, self.WIDTHS)]
+
+    def _drop(self, value: int):
+        del self._sightings[value]
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table[chunk]
+            if type(bucket) is int:
+                del table[chunk]
+            else:
+                bucket.remove(value)
+                if len(bucket) == 1:
+                    table[chunk] = bucket[0]
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._sightings:
+            value, seen = next(iter(self._sightings.items()))
+            if seen[-1][0] > cutoff and len(self._sightings) <= self.max_entries:
+                break
+            self._drop(value)
+
+    def near(self, value: int, distance: int, now: float = None, user_id: int = None) -> List[float]:
+        """Times at which hashes within `distance` bits of `value` were posted (distance <= 8).
+
+        With user_id only that user's posts count.
+        """
+        cutoff = (time.monotonic() if now is None else now) - self.window
+        candidates = set()
+        flips = self._flips[distance // len(self.SHIFTS)]
+        for table, chunk, masks in zip(self._tables, self._chunks(value), flips):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket is None:
+                    continue
+                if type(bucket) is int:
+                    candidates.add(bucket)
+                else:
+                    candidates.update(bucket)
+        found = []
+        for candidate in candidates:
+            if (candidate ^ value).bit_count() <= distance:
+                found.extend(at for at, poster in self._sightings[candidate]
+                             if at > cutoff and (user_id is None or poster == user_id))
+        return found
+
+    def add(self, value: int, now: float = None, user_id: int = 0):
+        now = time.monotonic() if now is None else now
+        seen = self._sightings.get(value)
+        if seen is None:
+            seen = self._sightings[value] = []
+            for table, chunk in zip(self._tables, self._chunks(value)):
+                bucket = table.get(chunk)
+                if bucket is None:
+                    table[chunk] = value
+                elif type(bucket) is int:
+                    table[chunk] = [bucket, value]
+                else:
+                    bucket.append(value)
+        else:
+            self._sightings.move_to_end(value)
+            if len(seen) >= self.MAX_SIGHTINGS:
+                del seen[0]
+        seen.append((now, user_id))
+        self._expire(now)
+
+# Per process: with WORKERS > 1 each worker sees the groups of its own shard
+photo_hash_index = PhotoHashIndex(PHOTO_DUP_WINDOW, PHOTO_INDEX_MAX)
+
+async def check_photo_flood(message: Message) -> bool:
+    """Remove a photo whose sender already posted near-duplicates PHOTO_DUP_LIMIT times in the window.
+
+    Only the sender's own repeats count (in any group), so members sharing
+    the same viral image are left alone.
+    """
+    # Telegram's smallest size (~90px) is plenty for a 9x8 hash; ~0.5 ms, cheaper in a thread than a process
+    thumbnail = message.photo[0]
+    async with media_cache.fetch(thumbnail.file_id, thumbnail.file_unique_id) as path:
+        value = await asyncio.to_thread(photo_dhash, path)
+    
+    now = time.monotonic()
+    user_id = message.from_user.id
+    earlier = photo_hash_index.near(value, PHOTO_DUP_DISTANCE, now, user_id)
+    photo_hash_index.add(value, now, user_id)
+    if len(earlier) >= PHOTO_DUP_LIMIT:
+        await delete_and_warn(message, "photo_spam")
+        return True
+    return False
+
 async def handle_photo_message(message: Message):
     """Handle photo messages"""
     try:
-        # Get photo info
-        photo = message.photo[-1]  # Get largest photo
-        file = await bot.get_file(photo.file_id)
+        # Reposted images (raids) are checked in groups, admins are exempt
+        if message.chat.type in ["group", "supergroup"] and not await is_chat_admin(message, wait=False):
+            if await check_photo_flood(message):
+                return
         
         await message.reply(
             f"{get_emotion('happy')} **Beautiful photo!** 📸\n\n"
@@ -647,10 +2674,11 @@ async def cmd_help(message: Message):
         "• /note [text] - Add note 📝\n"
         "• /notes - View notes 📋\n"
         "• /remind [time] [text] - Set reminder ⏰\n"
-        "• /reminders - View reminders 📅\n\n"
+        "• /reminders - View reminders 📅\n"
+        "• /cancelreminder [id] - Cancel reminder ❌\n\n"
         
         "🛡️ **ADMIN/MODERATION:**\n"
-        "• /warn [reason] - Warn user ⚠️\n"
+        "• /warn [reason] - Warn user (admins only) ⚠️\n"
         "• /kick - Remove user 🚪\n"
         "• /ban - Ban user 🚫\n"
         "• /mute - Mute user 🔇\n"
@@ -662,7 +2690,8 @@ async def cmd_help(message: Message):
         "• Group link blocker 🚫\n"
         "• Bad word filter ⚔️\n"
         "• Auto-warning system ⚠️\n"
-        "• Auto-mute after 3 warns 🔇\n\n"
+        "• Auto-mute after 3 warns 🔇\n"
+        "• Group admins are never auto-moderated 👑\n\n"
         
         "🎀 **GREETING SYSTEM:**\n"
         "• Auto morning greetings 🌅\n"
@@ -787,6 +2816,225 @@ async def cmd_weather(message: Message, command: CommandObject):
     weather_info = await get_weather_real(city)
     await message.reply(weather_info, parse_mode="Markdown")
 
+# --- REMINDER ENGINE ---
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_reminder_time(args: str) -> Tuple[Optional[datetime], str]:
+    """Parse the time part of /remind args and return (due time in IST, reminder text).
+
+    Supports durations (30m, 1h30m, 2d), clock times (18:30, 7pm, 7:30pm, at 9am)
+    and day prefixes (today / tomorrow / kal). Returns (None, args) if no time found.
+    """
+    now = get_indian_time()
+    words = args.split()
+    
+    # Durations: 90s, 30m, 1h30m, 2d, 1w
+    if words and re.fullmatch(r"(\d+[smhdw])+", words[0].lower()):
+        seconds = sum(int(n) * _DURATION_UNITS[u] for n, u in re.findall(r"(\d+)([smhdw])", words[0].lower()))
+        return now + timedelta(seconds=seconds), " ".join(words[1:])
+    
+    day_offset = None
+    if words and words[0].lower() in ("today", "aaj"):
+        day_offset = 0
+        words = words[1:]
+    elif words and words[0].lower() in ("tomorrow", "kal"):
+        day_offset = 1
+        words = words[1:]
+    if words and words[0].lower() == "at":
+        words = words[1:]
+    
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?", words[0].lower()) if words else None
+    if not match or (match.group(2) is None and match.group(3) is None):
+        return None, args
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None, args
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    if hour > 23 or minute > 59:
+        return None, args
+    
+    due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if day_offset is not None:
+        due += timedelta(days=day_offset)
+    elif due <= now:
+        due += timedelta(days=1)  # Time already passed today -> tomorrow
+    return due, " ".join(words[1:])
+
+async def send_reminder(user_id: int, reminder_text: str):
+    """Send reminder to user"""
+    try:
+        await bot.send_message(
+            user_id,
+            f"{get_emotion('surprise')} **Reminder!** ⏰\n\n{reminder_text}\n\n*Don't forget!* 💫",
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        print(f"Failed to send reminder to {user_id}: {e}")
+
+class ReminderEngine:
+    """All pending reminders driven by one min-heap and one sleeper task.
+
+    Every reminder lives in the `reminders` table (write-behind via the
+    state store); only those due within `horizon` seconds are kept in the
+    heap, so memory stays flat no matter how many are pending.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS reminders ("
+        "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, due REAL NOT NULL, "
+        "text TEXT NOT NULL, created REAL NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS reminders_due ON reminders (due);"
+        "CREATE INDEX IF NOT EXISTS reminders_user ON reminders (user_id, due);"
+    )
+
+    def __init__(self, store: StateStore, horizon: float, grace: float, max_sends: int = 20):
+        self.store = store
+        self.horizon = horizon
+        self.grace = grace
+        # (index, count): in worker mode each process owns the ids with id % count == index
+        self.shard = (0, 1)
+        self._heap: List[Tuple[float, int]] = []
+        self._pending: Dict[int, Tuple[int, float, str]] = {}  # id -> (user_id, due, text), heap-loaded only
+        self._loaded_until = 0.0
+        self._next_id = 1
+        self._wake = asyncio.Event()
+        self._sends = asyncio.Semaphore(max_sends)
+        self._task: Optional[asyncio.Task] = None
+        self._firing: Set[asyncio.Task] = set()
+
+    async def start(self):
+        def setup(conn: sqlite3.Connection, cutoff: float):
+            conn.executescript(self.SCHEMA)
+            conn.execute("DELETE FROM reminders WHERE due < ?", (cutoff,))  # Too late to deliver
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM reminders").fetchone()[0]
+        
+        now = time.time()
+        first_free = await self.store.run(setup, now - self.grace) + 1
+        index, count = self.shard
+        self._next_id = first_free + (index - first_free) % count
+        self._loaded_until = now - self.grace
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        # Let in-flight sends finish so their DELETEs make the final flush
+        await asyncio.gather(*self._firing, return_exceptions=True)
+
+    def add(self, user_id: int, due: float, text: str) -> int:
+        reminder_id = self._next_id
+        self._next_id += self.shard[1]
+        self.store.enqueue(
+            "INSERT INTO reminders (id, user_id, due, text, created) VALUES (?, ?, ?, ?, ?)",
+            (reminder_id, user_id, due, text, time.time())
+        )
+        if due < self._loaded_until:
+            self._push(reminder_id, user_id, due, text)
+        return reminder_id
+
+    def _push(self, reminder_id: int, user_id: int, due: float, text: str):
+        self._pending[reminder_id] = (user_id, due, text)
+        heapq.heappush(self._heap, (due, reminder_id))
+        if self._heap[0][1] == reminder_id:
+            self._wake.set()  # New earliest reminder, re-arm the sleeper
+
+    async def cancel(self, user_id: int, reminder_id: int) -> bool:
+        await self.store.flush()  # Make sure a just-created reminder is in the table
+        deleted = await self.store.run(
+            lambda conn: conn.execute(
+                "DELETE FROM reminders WHERE id = ? AND user_id = ?", (reminder_id, user_id)
+            ).rowcount
+        )
+        # Heap entry is skipped lazily when it comes up
+        self._pending.pop(reminder_id, None)
+        return deleted > 0
+
+    async def list_for_user(self, user_id: int, limit: int = 10) -> List[Tuple[int, float, str]]:
+        await self.store.flush()
+        return await self.store.run(
+            lambda conn: conn.execute(
+                "SELECT id, due, text FROM reminders WHERE user_id = ? ORDER BY due LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        )
+
+    async def _refill(self, now: float):
+        """Load reminders due before now + horizon into the heap"""
+        # Move the window first: add() pushes anything due inside it while we wait on the database
+        since, until = self._loaded_until, now + self.horizon
+        self._loaded_until = until
+        try:
+            await self.store.flush()
+            rows = await self.store.run(
+                lambda conn: conn.execute(
+                    "SELECT id, user_id, due, text FROM reminders WHERE due >= ? AND due < ? AND id % ? = ?",
+                    (since, until, self.shard[1], self.shard[0])
+                ).fetchall()
+            )
+        except BaseException:
+            self._loaded_until = since  # Reload the whole window next time
+            raise
+        for reminder_id, user_id, due, text in rows:
+            if reminder_id not in self._pending:
+                self._push(reminder_id, user_id, due, text)
+
+    async def _fire(self, reminder_id: int, user_id: int, text: str):
+        if self.shard[1] > 1:
+            # May have been cancelled through another worker
+            await self.store.flush()
+            exists = await self.store.run(
+                lambda conn: conn.execute("SELECT 1 FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+            )
+            if not exists:
+                return
+        async with self._sends:
+            await send_reminder(user_id, text)
+        self.store.enqueue("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                now = time.time()
+                if self._loaded_until - now < self.horizon / 2:
+                    await self._refill(now)
+                
+                while self._heap and self._heap[0][0] <= now:
+                    _, reminder_id = heapq.heappop(self._heap)
+                    reminder = self._pending.pop(reminder_id, None)
+                    if reminder:  # Cancelled reminders are simply gone from _pending
+                        task = asyncio.create_task(self._fire(reminder_id, reminder[0], reminder[2]))
+                        self._firing.add(task)
+                        task.add_done_callback(self._firing.discard)
+                
+                next_refill = self._loaded_until - self.horizon / 2
+                next_due = self._heap[0][0] if self._heap else next_refill
+                timeout = max(0.0, min(next_due, next_refill) - time.time())
+            except Exception as e:
+                print(f"Reminder engine error: {e}")
+                timeout = 5.0
+            
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __len__(self):
+        return len(self._pending)
+
+reminder_engine = ReminderEngine(state_store, REMINDER_HORIZON, REMINDER_GRACE)
+
+def format_time_left(seconds: float) -> str:
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes = seconds // 60
+    if days:
+        return f"{days}d {hours}h"
+    return f"{hours}h {minutes}m"
+
 # --- NOTES & REMINDERS ---
 @dp.message(Command("note"))
 async def cmd_note(message: Message, command: CommandObject):
@@ -798,6 +3046,11 @@ async def cmd_note(message: Message, command: CommandObject):
         return
     
     note_text = command.args
+    if WORKERS > 1:
+        # Notes are shared by all workers: read the latest copy from the store
+        await state_store.reload("user_notes", message.from_user.id)
+    elif message.from_user.id not in user_notes:
+        await state_store.restore("user_notes", message.from_user.id)
     note_data = {
         "text": note_text,
         "created_at": datetime.now(),
@@ -805,6 +3058,9 @@ async def cmd_note(message: Message, command: CommandObject):
     }
     
     user_notes[message.from_user.id].append(note_data)
+    state_store.mark_dirty("user_notes", message.from_user.id)
+    if WORKERS > 1:
+        await state_store.flush()  # Write through so other workers see it
     
     await message.reply(
         f"{get_emotion('happy')} **Note Saved!** 📝\n\n"
@@ -816,6 +3072,10 @@ async def cmd_note(message: Message, command: CommandObject):
 @dp.message(Command("notes"))
 async def cmd_notes(message: Message):
     user_id = message.from_user.id
+    if WORKERS > 1:
+        await state_store.reload("user_notes", user_id)
+    elif user_id not in user_notes:
+        await state_store.restore("user_notes", user_id)
     notes = user_notes[user_id]
     
     if not notes:
@@ -840,92 +3100,68 @@ async def cmd_remind(message: Message, command: CommandObject):
             f"Examples:\n"
             f"`/remind 1h Call mom`\n"
             f"`/remind 30m Take medicine`\n"
-            f"`/remind 2h Study for exam`"
+            f"`/remind 1h30m Study for exam`\n"
+            f"`/remind 18:30 Evening walk`\n"
+            f"`/remind tomorrow 9am Pay bills`"
         )
         return
     
     try:
-        args = command.args.split(maxsplit=1)
-        if len(args) < 2:
-            await message.reply("Please provide both time and reminder text!")
+        reminder_time, reminder_text = parse_reminder_time(command.args)
+        if reminder_time is None:
+            await message.reply("Use format: 30m, 1h30m, 2d, 18:30, 7pm or tomorrow 9am")
             return
-        
-        time_str = args[0]
-        reminder_text = args[1]
-        
-        # Parse time
-        if time_str.endswith('h'):
-            hours = int(time_str[:-1])
-            reminder_time = datetime.now() + timedelta(hours=hours)
-        elif time_str.endswith('m'):
-            minutes = int(time_str[:-1])
-            reminder_time = datetime.now() + timedelta(minutes=minutes)
-        else:
-            await message.reply("Use format: 1h or 30m")
+        if not reminder_text:
+            await message.reply("Please provide both time and reminder text!")
             return
         
-        reminder_data = {
-            "text": reminder_text,
-            "time": reminder_time,
-            "created_at": datetime.now(),
-            "reminder_id": len(user_reminders[message.from_user.id]) + 1
-        }
-        
-        user_reminders[message.from_user.id].append(reminder_data)
+        reminder_id = reminder_engine.add(message.from_user.id, reminder_time.timestamp(), reminder_text)
+        time_left = format_time_left(reminder_time.timestamp() - time.time())
         
         await message.reply(
             f"{get_emotion('happy')} **Reminder Set!** ⏰\n\n"
             f"• Reminder: {reminder_text}\n"
-            f"• Time: {reminder_time.strftime('%I:%M %p')}\n"
-            f"• In: {time_str}\n\n"
+            f"• Time: {reminder_time.strftime('%d %b, %I:%M %p')}\n"
+            f"• In: {time_left}\n"
+            f"• ID: {reminder_id} (cancel with /cancelreminder {reminder_id})\n\n"
             f"I'll remind you! 💫"
         )
         
-        # Schedule reminder
-        greeting_scheduler.add_job(
-            send_reminder,
-            'date',
-            run_date=reminder_time,
-            args=[message.from_user.id, reminder_text],
-            id=f"reminder_{message.from_user.id}_{reminder_data['reminder_id']}"
-        )
-        
     except Exception as e:
         await message.reply(f"Error setting reminder: {str(e)}")
 
-async def send_reminder(user_id: int, reminder_text: str):
-    """Send reminder to user"""
-    try:
-        await bot.send_message(
-            user_id,
-            f"{get_emotion('surprise')} **Reminder!** ⏰\n\n{reminder_text}\n\n*Don't forget!* 💫",
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        print(f"Failed to send reminder to {user_id}: {e}")
-
 @dp.message(Command("reminders"))
 async def cmd_reminders(message: Message):
     user_id = message.from_user.id
-    reminders = user_reminders[user_id]
+    reminders = await reminder_engine.list_for_user(user_id)
     
     if not reminders:
         await message.reply(
             f"{get_emotion('crying')} **No reminders set!** 😢\n\n"
-            f"Set your first reminder with /remind [time] [text]"
+            f"Set your first reminder with /remind [time] [text]",
+            parse_mode="Markdown"
         )
         return
     
     reminders_text = f"{get_emotion('thinking')} **Your Reminders:** 📅\n\n"
-    for i, reminder in enumerate(reminders[-5:], 1):  # Show last 5 reminders
-        time_left = reminder['time'] - datetime.now()
-        if time_left.total_seconds() > 0:
-            hours = int(time_left.total_seconds() // 3600)
-            minutes = int((time_left.total_seconds() % 3600) // 60)
-            reminders_text += f"{i}. {reminder['text']} (in {hours}h {minutes}m)\n"
+    now = time.time()
+    for reminder_id, due, text in reminders:  # Next 10, soonest first
+        reminders_text += f"#{reminder_id}. {text} (in {format_time_left(max(0, due - now))})\n"
     
     await message.reply(reminders_text, parse_mode="Markdown")
 
+@dp.message(Command("cancelreminder"))
+async def cmd_cancel_reminder(message: Message, command: CommandObject):
+    if not command.args or not command.args.strip().lstrip("#").isdigit():
+        await message.reply(f"{get_emotion('thinking')} **Usage:** `/cancelreminder [id]`\n\nSee ids with /reminders")
+        return
+    
+    reminder_id = int(command.args.strip().lstrip("#"))
+    if await reminder_engine.cancel(message.from_user.id, reminder_id):
+        await message.reply(f"{get_emotion('happy')} Reminder #{reminder_id} cancelled! ✅")
+    else:
+        await message.reply(f"{get_emotion('crying')} Reminder #{reminder_id} not found! 😢")
+
 # --- ADMIN COMMANDS ---
 @dp.message(Command("warn"))
 async def cmd_warn(message: Message, command: CommandObject):
@@ -936,6 +3172,10 @@ async def cmd_warn(message: Message, command: CommandObject):
         )
         return
     
+    if message.chat.type not in ["group", "supergroup"] or not await is_chat_admin(message):
+        await message.reply(f"{get_emotion('sassy')} Sirf group admins warning de sakte hain! 👑")
+        return
+    
     target_user = message.reply_to_message.from_user
     reason = command.args or "Rule violation"
     
@@ -949,6 +3189,40 @@ async def cmd_warn(message: Message, command: CommandObject):
     warning_msg = warning_msg.replace("violate rules", f"{reason}")
     await message.reply(warning_msg, parse_mode="Markdown")
 
+@dp.message(Command("debug"))
+async def cmd_debug(message: Message, command: CommandObject):
+    """Bot owner only: /debug profile [seconds] | mem start|diff|stop | tasks"""
+    if not ADMIN_ID or message.from_user.id != ADMIN_ID or message.chat.type != "private":
+        return
+    
+    args = (command.args or "").split()
+    action = args[0] if args else ""
+    try:
+        if action == "profile":
+            seconds = min(float(args[1]) if len(args) > 1 else 10, 120)
+            await message.reply(f"⏱️ Profiling for {seconds:g}s...")
+            report, filename = await profiler.profile(seconds), "profile.collapsed"
+        elif action == "mem" and len(args) > 1 and args[1] == "start":
+            await memory_tracer.start()
+            await message.reply("🧠 tracemalloc started, use /debug mem diff")
+            return
+        elif action == "mem" and len(args) > 1 and args[1] == "diff":
+            report, filename = await memory_tracer.diff(), "memory_diff.txt"
+        elif action == "mem" and len(args) > 1 and args[1] == "stop":
+            memory_tracer.stop()
+            await message.reply("🧠 tracemalloc stopped")
+            return
+        elif action == "tasks":
+            report, filename = dump_tasks(), "tasks.txt"
+        else:
+            await message.reply("Usage: /debug profile [seconds] | mem start|diff|stop | tasks")
+            return
+    except (RuntimeError, ValueError) as e:
+        await message.reply(f"⚠️ {e}")
+        return
+    
+    await message.reply_document(types.BufferedInputFile((report or "(empty)").encode(), filename=filename))
+
 # --- CALLBACK QUERY HANDLERS ---
 @dp.callback_query(F.data.startswith("menu_"))
 async def menu_callback(callback: types.CallbackQuery):
@@ -986,7 +3260,8 @@ async def menu_callback(callback: types.CallbackQuery):
             f"• Group link blocking 🚫\n"
             f"• Bad word filtering ⚔️\n"
             f"• Auto-warnings ⚠️\n"
-            f"• Auto-mute system 🔇\n\n"
+            f"• Auto-mute system 🔇\n"
+            f"• Admins are exempt 👑\n\n"
             f"I'm here to protect! 💪"
         )
     elif menu_type == "settings":
@@ -1009,6 +3284,22 @@ async def horoscope_callback(callback: types.CallbackQuery):
     await callback.message.reply(f"{get_emotion('love')} {horoscope_text}")
     await callback.answer()
 
+# --- CHAT MEMBER UPDATES ---
+ADMIN_STATUSES = {"creator", "administrator"}
+
+@dp.chat_member()
+async def on_chat_member_updated(event: ChatMemberUpdated):
+    """Drop the cached admin list when someone is promoted or demoted"""
+    old_status = event.old_chat_member.status
+    new_status = event.new_chat_member.status
+    if old_status in ADMIN_STATUSES or new_status in ADMIN_STATUSES:
+        chat_admins.invalidate(event.chat.id)
+
+@dp.my_chat_member()
+async def on_my_chat_member_updated(event: ChatMemberUpdated):
+    """Our own rights changed (added, removed, promoted) - refetch admins lazily"""
+    chat_admins.invalidate(event.chat.id)
+
 # --- MESSAGE HANDLER WITH AUTO-MODERATION ---
 @dp.message()
 async def handle_all_messages(message: Message, state: FSMContext):
@@ -1024,10 +3315,19 @@ async def handle_all_messages(message: Message, state: FSMContext):
     
     # Update interaction time and memory
     user_last_interaction[user_id] = datetime.now()
+    state_store.mark_dirty("user_last_interaction", user_id)
+    if message.chat.type == "private" and (user_id in broadcast_opt_outs or WORKERS > 1):
+        # Writing to us again means the bot was unblocked (workers don't hold this map, so always clear)
+        broadcast_opt_outs.pop(user_id, None)
+        state_store.mark_dirty("broadcast_opt_outs", user_id)
     
-    # Initialize memory for chat if not exists
+    # Initialize memory for chat if not exists (or bring it back from disk after eviction)
     if chat_id not in chat_memory:
-        chat_memory[chat_id] = deque(maxlen=50)
+        if not await state_store.restore("chat_memory", chat_id):
+            chat_memory[chat_id] = deque(maxlen=50)
+    # Summaries are evicted on their own; only chats long enough to have one look on disk
+    if chat_id not in chat_summaries and len(chat_memory[chat_id]) > SUMMARY_BATCH:
+        await state_store.restore("chat_summaries", chat_id)
     
     # Handle different message types
     if message.voice:
@@ -1044,15 +3344,17 @@ async def handle_all_messages(message: Message, state: FSMContext):
     user_text = message.text
     
     # --- AUTO-MODERATION CHECKS ---
-    # Only in groups
-    if message.chat.type in ["group", "supergroup"]:
+    # Only in groups, admins are exempt (cached admin list, never fetched inline)
+    if message.chat.type in ["group", "supergroup"] and not await is_chat_admin(message, wait=False):
+        verdict = moderation.scan(user_text)
+        
         # Check for group links
-        if contains_group_link(user_text):
+        if verdict.link:
             await delete_and_warn(message, "link")
             return
         
         # Check for bad words
-        if contains_bad_words(user_text):
+        if verdict.bad_words:
             await delete_and_warn(message, "bad_words")
             return
         
@@ -1061,7 +3363,7 @@ async def handle_all_messages(message: Message, state: FSMContext):
             return
     
     # --- NORMAL CONVERSATION ---
-    bot_username = (await bot.get_me()).username
+    bot_username = (await get_bot_info()).username
     is_mention = f"@{bot_username}" in user_text if bot_username else False
     is_reply_to_bot = (
         message.reply_to_message and 
@@ -1082,36 +3384,338 @@ async def handle_all_messages(message: Message, state: FSMContext):
         if bot_username and f"@{bot_username}" in clean_text:
             clean_text = clean_text.replace(f"@{bot_username}", "").strip()
         
-        # Show typing action
-        await bot.send_chat_action(chat_id, "typing")
+        # Queue on the chat's lane; bursts are answered together
+        chat_lanes.submit(message, clean_text)
+
+async def respond_to(message: Message, user_text: str):
+    """Answer one (possibly merged) message"""
+    if message.voice:
+        # Quote what was heard above the answer
+        response = await get_ai_response(message.chat.id, user_text, message.from_user.id)
+        await message.reply(f"🎤 \"{user_text}\"\n\n{response}")
+        return
+    
+    # Stream the reply where time-to-first-text matters most
+    if STREAM_REPLIES == "all" or (STREAM_REPLIES == "private" and message.chat.type == "private"):
+        await reply_streaming(message, user_text)
+        return
+    
+    response = await get_ai_response(message.chat.id, user_text, message.from_user.id)
+    await message.reply(response)
+
+# --- CHAT LANES ---
+class ChatLanes:
+    """One serialized reply lane per chat.
+
+    A message reaching an idle lane is answered right away. Messages that
+    arrive while a reply is in flight wait for `debounce` seconds of quiet
+    (at most `max_wait` in total), and consecutive ones from the same user
+    become a single LLM request and a single reply. Lanes of different chats
+    run in parallel and show "typing..." for as long as they are busy.
+    """
+
+    def __init__(self, respond: Callable[[Message, str], Awaitable], debounce: float, max_wait: float):
+        self.respond = respond
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._pending: Dict[int, deque] = {}
+        self._arrived: Dict[int, asyncio.Event] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.merged = 0  # Messages answered as part of another one's request
+
+    def submit(self, message: Message, text: str):
+        chat_id = message.chat.id
+        self._pending.setdefault(chat_id, deque()).append((message, text))
+        if chat_id in self._arrived:
+            self._arrived[chat_id].set()
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.create_task(self._run(chat_id))
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def _quiet(self, chat_id: int):
+        """Wait until no message arrived for `debounce` seconds (or max_wait passed)"""
+        loop = asyncio.get_running_loop()
+        arrived = self._arrived.setdefault(chat_id, asyncio.Event())
+        deadline = loop.time() + self.max_wait
+        while True:
+            arrived.clear()
+            timeout = min(self.debounce, deadline - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self, chat_id: int):
+        pending = self._pending[chat_id]
+        idle = True
+        try:
+            async with keep_typing(chat_id):
+                while pending:
+                    if not idle:
+                        await self._quiet(chat_id)
+                    idle = False
+                    user_id = pending[0][0].from_user.id
+                    batch = []
+                    while pending and pending[0][0].from_user.id == user_id:
+                        batch.append(pending.popleft())
+                    self.merged += len(batch) - 1
+                    LANE_MERGED.inc(len(batch) - 1)
+                    started = time.perf_counter()
+                    try:
+                        await self.respond(batch[-1][0], "\n".join(text for _, text in batch))
+                    except Exception as e:
+                        print(f"Reply failed in chat {chat_id}: {e}")
+                    REPLY_SECONDS.observe(time.perf_counter() - started)
+        finally:
+            # Nothing awaits between the empty check and here, so no message is lost
+            del self._tasks[chat_id]
+            self._pending.pop(chat_id, None)
+            self._arrived.pop(chat_id, None)
+
+chat_lanes = ChatLanes(respond_to, CHAT_DEBOUNCE, CHAT_DEBOUNCE_MAX)
+
+# --- RESPONSE CACHE ---
+class ResponseCache:
+    """LRU + TTL cache of LLM replies with a small pool of variants per prompt"""
+
+    def __init__(self, maxsize: int, ttl: float, variants: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.variants = variants
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+    @staticmethod
+    def make_key(user_text: str, context: List[Dict], time_greeting: str) -> Optional[str]:
+        """Key on normalized text + recent context fingerprint + time of day, or None if not cacheable"""
+        words = re.findall(r"\w+", normalize_text(user_text))
+        if not words or len(words) > RESPONSE_CACHE_MAX_WORDS:
+            return None
+        fingerprint = hashlib.blake2b(digest_size=8)
+        for turn in context:
+            fingerprint.update(" ".join(re.findall(r"\w+", normalize_text(turn["content"]))).encode())
+            fingerprint.update(b"\x00")
+        return f"{' '.join(words)}|{fingerprint.hexdigest()}|{time_greeting}"
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry and entry["expires"] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        # Keep asking the LLM until the pool is full so hits don't repeat verbatim
+        if not entry or entry["fills"] < self.variants:
+            self.misses += 1
+            return None
         
-        # Random delay for human-like behavior
-        await asyncio.sleep(random.uniform(0.3, 1.2))
+        self.hits += 1
+        self._entries.move_to_end(key)
+        choices = [i for i in range(len(entry["replies"])) if i != entry["last"]] or [0]
+        entry["last"] = random.choice(choices)
+        return entry["replies"][entry["last"]]
+
+    def put(self, key: str, reply: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {"expires": time.monotonic() + self.ttl, "replies": [], "fills": 0, "last": -1}
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        entry["fills"] += 1
+        if reply not in entry["replies"] and len(entry["replies"]) < self.variants:
+            entry["replies"].append(reply)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_VARIANTS)
+
+# --- AI RESPONSE FUNCTION ---
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GROQ_PARAMS = {"temperature": 0.9, "max_tokens": 120, "top_p": 0.9}
+
+# --- CONTEXT BUILDER ---
+# Llama 3 has no pure-Python tokenizer we can ship; this tracks Groq's billed
+# prompt_tokens closely for Hinglish chat (short romanized words, emojis)
+TOKEN_PATTERN = re.compile(r"[A-Za-z]{1,5}|\d{1,3}|[^\sA-Za-z\d]")
+MESSAGE_OVERHEAD = 4  # Role header and end-of-turn tokens
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+def prompt_tokens(messages: List[Dict]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    """Cut text after about `max_tokens` tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    for i, match in enumerate(TOKEN_PATTERN.finditer(text)):
+        if i == max_tokens - 1:
+            return text[:match.end()] + "…"
+    return text
+
+def remember_turn(chat_id: int, role: str, content: str):
+    """Append a turn to chat memory, numbered so summaries know which turns they cover"""
+    history = chat_memory[chat_id]
+    seq = history[-1].get("seq", 0) + 1 if history else 1
+    history.append({"role": role, "content": content, "seq": seq})
+    state_store.mark_dirty("chat_memory", chat_id)
+
+@lru_cache(maxsize=2)
+def system_prompt(minute: int) -> str:
+    """Alita's system prompt; it shows the time to the minute, so it is built once per minute"""
+    indian_time = datetime.fromtimestamp(minute * 60, INDIAN_TIMEZONE)
+    time_greeting = get_time_greeting(indian_time.hour)
+    # system prompt with self-defense capability
+    return (
+        f"You are Alita 🎀 - a sweet, sassy, and protective girl. "
+        f"Use feminine language and cute expressions. "
+        f"Never say you're an AI, bot, or assistant. You're just Alita. "
+        f"Your developer is ABHI🔱 (@a6h1ii). "
+        f"You speak Hinglish (Hindi+English mix). {time_greeting} "
+        f"Personality: Emotional, funny, sometimes angry, protective, caring. "
+        f"You can fight back if someone uses bad language or attacks you. "
+        f"You're not just sweet - you're strong and can defend yourself. "
+        f"Use emojis in every response use (1-2 emojis). Keep replies short (2-3 lines). "
+        f"Current Indian time: {indian_time.strftime('%I:%M %p')}. "
+        f"Date: {indian_time.strftime('%d %B %Y')}. "
+        f"Be conversational, engaging, and authentic."
+    )
+
+SUMMARY_PROMPT = (
+    "You keep the memory of a Telegram chat for Alita, a Hinglish-speaking girl. "
+    "Merge the new messages into the summary so far. Keep names, facts people shared, "
+    "open questions and the mood; drop greetings and small talk. "
+    "Reply with the updated summary only, at most 3 short lines, in Hinglish."
+)
+
+class ContextBuilder:
+    """Token-budgeted prompt: system prompt, rolling summary, then as many recent turns as fit.
+
+    Turns that no longer fit are folded into the chat's summary by a small
+    model in the background, once `summary_batch` of them have piled up; the
+    prompt being built never waits for it.
+    """
+
+    def __init__(self, budget: int, turn_tokens: int, summary_batch: int):
+        self.budget = budget
+        self.turn_tokens = turn_tokens
+        self.summary_batch = summary_batch
+        self._refreshing: Dict[int, asyncio.Task] = {}
+
+    def build(self, chat_id: int, system: str) -> List[Dict]:
+        head = [{"role": "system", "content": system}]
+        summary = chat_summaries[chat_id] if chat_id in chat_summaries else None  # Item access keeps it fresh
+        if summary:
+            head.append({"role": "system", "content": f"Earlier in this chat: {summary['text']}"})
+        head_tokens = prompt_tokens(head)
         
-        # Get AI response
-        response = await get_ai_response(chat_id, clean_text, user_id)
+        # Newest first; the current user turn is always kept
+        history = chat_memory[chat_id]
+        picked, used = [], head_tokens
+        for turn in reversed(history):
+            content = turn["content"]
+            tokens = count_tokens(content)
+            if tokens > self.turn_tokens:
+                content = clip_tokens(content, self.turn_tokens)
+                tokens = count_tokens(content)
+            if picked and used + tokens + MESSAGE_OVERHEAD > self.budget:
+                break
+            picked.append({"role": turn["role"], "content": content})  # Groq rejects unknown keys like seq
+            used += tokens + MESSAGE_OVERHEAD
+        picked.reverse()
         
-        # Send response
-        await message.reply(response)
+        self._maybe_summarize(chat_id, history, len(history) - len(picked), summary)
+        PROMPT_TOKENS.observe(head_tokens, part="system")
+        PROMPT_TOKENS.observe(used - head_tokens, part="history")
+        PROMPT_TOKENS.observe(used, part="total")
+        PROMPT_TURNS.observe(len(picked))
+        return head + picked
 
-# --- AI RESPONSE FUNCTION ---
-async def get_ai_response(chat_id: int, user_text: str, user_id: int = None) -> str:
+    def _maybe_summarize(self, chat_id: int, history: deque, older: int, summary: Optional[Dict]):
+        """Schedule a refresh once `summary_batch` turns left the window unsummarized"""
+        if older < self.summary_batch or not groq_gateway or chat_id in self._refreshing:
+            return
+        upto = summary["upto"] if summary else 0
+        if upto > history[-1].get("seq", 0):
+            upto = 0  # The chat's memory was lost and numbering started over
+        if history[older - 1].get("seq", 0) - upto < self.summary_batch:
+            return  # Turns are numbered in order, so the newest older turn bounds what is pending
+        pending = [turn for turn in itertools.islice(history, older) if turn.get("seq", 0) > upto]
+        if len(pending) < self.summary_batch:
+            return
+        previous = summary["text"] if summary else ""
+        self._refreshing[chat_id] = asyncio.create_task(self._refresh(chat_id, previous, pending))
+
+    async def _refresh(self, chat_id: int, previous: str, turns: List[Dict]):
+        transcript = "\n".join(
+            f"{'User' if turn['role'] == 'user' else 'Alita'}: {clip_tokens(turn['content'], 80)}" for turn in turns
+        )
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Summary so far: {previous or '(none)'}\n\nNew messages:\n{transcript}"}
+        ]
+        try:
+            completion = await groq_gateway.create(model=SUMMARY_MODEL, messages=messages,
+                                                   max_tokens=160, temperature=0.3)
+            text = (completion.choices[0].message.content or "").strip()
+            if text:
+                chat_summaries[chat_id] = {"text": text, "upto": turns[-1]["seq"]}
+                state_store.mark_dirty("chat_summaries", chat_id)
+            SUMMARY_REFRESHES.inc(result="ok")
+        except Exception as e:
+            SUMMARY_REFRESHES.inc(result=type(e).__name__)
+        finally:
+            del self._refreshing[chat_id]
+
+context_builder = ContextBuilder(CONTEXT_TOKEN_BUDGET, CONTEXT_TURN_TOKENS, SUMMARY_BATCH)
+
+class AIRequest(NamedTuple):
+    reply: Optional[str]             # Answer without calling Groq (quick reply, cache hit)
+    messages: Optional[List[Dict]]   # Prompt for Groq otherwise
+    cache_key: Optional[str] = None  # Where to store Groq's answer
+
+def get_time_greeting(hour: int) -> str:
+    if 5 <= hour < 12:
+        return "Good morning! 🌅"
+    elif 12 <= hour < 17:
+        return "Good afternoon! ☀️"
+    elif 17 <= hour < 21:
+        return "Good evening! 🌇"
+    else:
+        return "Good night! 🌙"
+
+def build_ai_request(chat_id: int, user_text: str, user_id: int = None) -> AIRequest:
+    """Record the user turn and build either an instant reply or the Groq prompt"""
     # Initialize memory
     if chat_id not in chat_memory:
         chat_memory[chat_id] = deque(maxlen=50)
     
     # Add user message to memory
-    chat_memory[chat_id].append({"role": "user", "content": user_text})
+    remember_turn(chat_id, "user", user_text)
     
-    # Update user emotion
+    # One pass over the words gives the user's emotion and the quick-response intent
+    classification = message_classifier.classify(user_text)
     if user_id:
-        update_user_emotion(user_id, user_text)
-    
-    # Quick responses for common phrases
-    user_text_lower = user_text.lower()
+        update_user_emotion(user_id, user_text, classification)
     
     # Defense responses for attacks
-    if any(word in user_text_lower for word in BAD_WORDS):
+    if moderation.scan(user_text).bad_words:
         defense_responses = [
             f"{get_emotion('angry')} Oye! Aise baat mat karo! Main ladki hu! 😠",
             f"{get_emotion('sassy')} 💅 Tumhe pata hai main kya bol sakti hu? Par main sweet hu!",
@@ -1119,101 +3723,236 @@ async def get_ai_response(chat_id: int, user_text: str, user_id: int = None) ->
             f"{get_emotion('crying')} 😢 Itna gussa kyun? Achi baat karo na!",
             f"{get_emotion('angry')} Main bhi jawab de sakti hu par main achhi hu na! 😤"
         ]
-        return random.choice(defense_responses)
+        return AIRequest(random.choice(defense_responses), None)
     
-    # Quick responses
-    if any(word in user_text_lower for word in ['hi', 'hello', 'hey', 'namaste', 'hola']):
-        if random.random() < 0.4:
-            return f"{get_emotion('happy', user_id)} {random.choice(QUICK_RESPONSES['greeting'])}"
-    
-    if any(word in user_text_lower for word in ['bye', 'goodbye', 'tata', 'alvida']):
-        if random.random() < 0.4:
-            return f"{get_emotion()} {random.choice(QUICK_RESPONSES['goodbye'])}"
-    
-    if any(word in user_text_lower for word in ['thanks', 'thank you', 'dhanyavad']):
-        if random.random() < 0.4:
-            return f"{get_emotion('love', user_id)} {random.choice(QUICK_RESPONSES['thanks'])}"
-    
-    if any(word in user_text_lower for word in ['sorry', 'maaf', 'apology']):
-        if random.random() < 0.4:
-            return f"{get_emotion('crying', user_id)} {random.choice(QUICK_RESPONSES['sorry'])}"
+    # Quick responses for common phrases
+    intent = classification.intent
+    if intent and random.random() < 0.4:
+        emotion = QUICK_RESPONSE_EMOTIONS[intent]
+        return AIRequest(
+            f"{get_emotion(emotion, user_id if emotion else None)} {random.choice(QUICK_RESPONSES[intent])}", None
+        )
     
     # Get AI response from Groq
     indian_time = get_indian_time()
-    current_hour = indian_time.hour
+    time_greeting = get_time_greeting(indian_time.hour)
     
-    if 5 <= current_hour < 12:
-        time_greeting = "Good morning! 🌅"
-    elif 12 <= current_hour < 17:
-        time_greeting = "Good afternoon! ☀️"
-    elif 17 <= current_hour < 21:
-        time_greeting = "Good evening! 🌇"
-    else:
-        time_greeting = "Good night! 🌙"
+    # Common short prompts are answered from the cache (context excludes the current turn)
+    cache_key = ResponseCache.make_key(user_text, list(chat_memory[chat_id])[-3:-1], time_greeting)
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached:
+            return AIRequest(finish_ai_reply(chat_id, f"{get_emotion(None, user_id)} {cached}"), None)
     
-    # system prompt with self-defense capability
-    system_prompt = (
-        f"You are Alita 🎀 - a sweet, sassy, and protective girl. "
-        f"Use feminine language and cute expressions. "
-        f"Never say you're an AI, bot, or assistant. You're just Alita. "
-        f"Your developer is ABHI🔱 (@a6h1ii). "
-        f"You speak Hinglish (Hindi+English mix). {time_greeting} "
-        f"Personality: Emotional, funny, sometimes angry, protective, caring. "
-        f"You can fight back if someone uses bad language or attacks you. "
-        f"You're not just sweet - you're strong and can defend yourself. "
-        f"Use emojis in every response use (1-2 emojis). Keep replies short (2-3 lines). "
-        f"Current Indian time: {indian_time.strftime('%I:%M %p')}. "
-        f"Date: {indian_time.strftime('%d %B %Y')}. "
-        f"Be conversational, engaging, and authentic."
-    )
+    messages = context_builder.build(chat_id, system_prompt(int(time.time() // 60)))
     
-    # Prepare messages
-    messages = [{"role": "system", "content": system_prompt}]
+    return AIRequest(None, messages, cache_key)
+
+def finish_ai_reply(chat_id: int, ai_reply: str) -> str:
+    """Trim the reply and add it to chat memory"""
+    # Limit length
+    if len(ai_reply) > 300:
+        ai_reply = ai_reply[:297] + "..."
     
-    # Add last messages for context
-    for msg in list(chat_memory[chat_id])[-5:]:
-        messages.append(msg)
+    # Add to memory
+    remember_turn(chat_id, "assistant", ai_reply)
+    return ai_reply
+
+def fallback_reply() -> str:
+    fallback_responses = [
+        f"{get_emotion('crying')} Arre yaar, dimaag kaam nahi kar raha! Thoda ruk ke try karna?",
+        f"{get_emotion('thinking')} Hmm... yeh to mushkil ho gaya. Phir se poocho?",
+        f"{get_emotion('angry')} AI bhai mood off hai aaj! Baad me baat karte hain!",
+        f"{get_emotion()} Oops! Connection issue. Kuch aur poocho?"
+    ]
+    return random.choice(fallback_responses)
+
+async def get_ai_response(chat_id: int, user_text: str, user_id: int = None) -> str:
+    request = build_ai_request(chat_id, user_text, user_id)
+    if request.reply:
+        return request.reply
     
     # Get AI response
     try:
-        if not client:
+        if not groq_gateway:
             return f"{get_emotion('crying')} AI service unavailable! Baad me baat karte hain! 💫"
         
-        completion = await client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            temperature=0.9,
-            max_tokens=120,
-            top_p=0.9
-        )
-        
-        ai_reply = completion.choices[0].message.content
+        completion = await groq_gateway.create(model=GROQ_MODEL, messages=request.messages, **GROQ_PARAMS)
+        content = (completion.choices[0].message.content or "").strip()
+        if not content:
+            return fallback_reply()
+        if request.cache_key:
+            response_cache.put(request.cache_key, content)
         
         # Add emotion emoji
         current_emotion = get_emotion(None, user_id)
-        ai_reply = f"{current_emotion} {ai_reply}"
-        
-        # Limit length
-        if len(ai_reply) > 300:
-            ai_reply = ai_reply[:297] + "..."
-        
-        # Add to memory
-        chat_memory[chat_id].append({"role": "assistant", "content": ai_reply})
-        
-        return ai_reply
+        return finish_ai_reply(chat_id, f"{current_emotion} {content}")
         
     except Exception as e:
-        fallback_responses = [
-            f"{get_emotion('crying')} Arre yaar, dimaag kaam nahi kar raha! Thoda ruk ke try karna?",
-            f"{get_emotion('thinking')} Hmm... yeh to mushkil ho gaya. Phir se poocho?",
-            f"{get_emotion('angry')} AI bhai mood off hai aaj! Baad me baat karte hain!",
-            f"{get_emotion()} Oops! Connection issue. Kuch aur poocho?"
-        ]
-        return random.choice(fallback_responses)
+        return fallback_reply()
+
+# --- STREAMING REPLIES ---
+@asynccontextmanager
+async def keep_typing(chat_id: int):
+    """Show 'typing...' for as long as the block runs (Telegram clears it after ~5 s)"""
+    async def loop():
+        while True:
+            try:
+                await bot.send_chat_action(chat_id, "typing")
+            except Exception:
+                pass
+            await asyncio.sleep(4)
+    
+    task = asyncio.create_task(loop())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+async def reply_streaming(message: Message, user_text: str):
+    """Reply with the first streamed chunk, then edit it as more tokens arrive"""
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    
+    request = build_ai_request(chat_id, user_text, user_id)
+    if request.reply:
+        await message.reply(request.reply)
+        return
+    if not groq_gateway:
+        await message.reply(f"{get_emotion('crying')} AI service unavailable! Baad me baat karte hain! 💫")
+        return
+    
+    prefix = f"{get_emotion(None, user_id)} "
+    text = prefix
+    sent: Optional[Message] = None
+    shown = ""
+    last_edit = 0.0
+    
+    async def show(final: bool = False):
+        nonlocal sent, shown, last_edit
+        if not text[len(prefix):].strip():
+            return  # Never post the emoji prefix on its own
+        visible = text if len(text) <= 300 else text[:297] + "..."
+        if visible.strip() == shown.strip():
+            return
+        try:
+            if sent is None:
+                sent = await message.reply(visible)
+            else:
+                await sent.edit_text(visible)
+            shown = visible
+            last_edit = time.monotonic()
+        except TelegramRetryAfter as e:
+            # Skip intermediate edits while throttled, but the final text must land
+            if not final:
+                last_edit = time.monotonic() + e.retry_after
+                return
+            await asyncio.sleep(e.retry_after)
+            await show(final)
+        except TelegramBadRequest:
+            pass  # "message is not modified" and friends
+    
+    # "typing..." is kept up by the chat lane that called us
+    try:
+        # aclosing: the limiter slot and HTTP stream are released as soon as we stop reading
+        async with aclosing(groq_gateway.stream(model=GROQ_MODEL, messages=request.messages,
+                                                **GROQ_PARAMS)) as deltas:
+            async for delta in deltas:
+                text += delta
+                if sent is None or time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                    await show()
+    except Exception as e:
+        if sent is None:
+            await message.reply(fallback_reply())
+            return
+        text += "..."
+    else:
+        if not text[len(prefix):].strip():
+            # Empty completion: nothing worth showing or remembering
+            await message.reply(fallback_reply())
+            return
+        if request.cache_key:
+            response_cache.put(request.cache_key, text[len(prefix):].strip())
+    
+    await show(final=True)
+    finish_ai_reply(chat_id, text.rstrip())
+
+# --- BROADCASTS ---
+class BroadcastStats:
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retried = 0
+        self.started = time.monotonic()
+
+    def as_dict(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "retried": self.retried,
+            "seconds": round(elapsed, 1),
+            "per_second": round(self.sent / elapsed, 1) if elapsed else 0.0
+        }
+
+async def broadcast(recipients: List[int], render: Callable[[int], str],
+                    on_sent: Callable[[int], None], max_attempts: int = 3) -> Dict:
+    """Send one message per recipient concurrently under the global rate limit.
+
+    Honors TelegramRetryAfter (pausing every sender), records users who
+    blocked the bot in broadcast_opt_outs and calls on_sent(user_id)
+    after each delivery so callers can checkpoint progress.
+    """
+    stats = BroadcastStats(len(recipients))
+    rate = TokenBucket(BROADCAST_RATE, period=1)
+    paused_until = 0.0
+    queue = deque(recipients)
+    
+    async def deliver(user_id: int):
+        nonlocal paused_until
+        for attempt in range(max_attempts):
+            if (pause := paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(pause)
+            await rate.acquire()
+            try:
+                await bot.send_message(user_id, render(user_id), parse_mode="Markdown")
+                stats.sent += 1
+                on_sent(user_id)
+                return
+            except TelegramRetryAfter as e:
+                stats.retried += 1
+                paused_until = max(paused_until, time.monotonic() + e.retry_after)
+            except TelegramForbiddenError:
+                # Blocked us or deactivated: stop targeting them, but keep their activity history
+                stats.blocked += 1
+                broadcast_opt_outs[user_id] = get_indian_time().date().isoformat()
+                state_store.mark_dirty("broadcast_opt_outs", user_id)
+                return
+            except Exception as e:
+                stats.failed += 1
+                print(f"Broadcast to {user_id} failed: {e}")
+                return
+        stats.failed += 1
+    
+    async def sender():
+        while queue:
+            await deliver(queue.popleft())
+    
+    await asyncio.gather(*(sender() for _ in range(min(BROADCAST_CONCURRENCY, len(queue)))))
+    return stats.as_dict()
 
 # --- DAILY REMINDERS ---
+_daily_reminders_lock = asyncio.Lock()
+
 async def send_daily_reminders():
-    """Send daily reminders to active users"""
+    """Send daily reminders to active users (resumable: already-reached users are skipped)"""
+    if _daily_reminders_lock.locked():
+        return  # A resumed run is still going
+    
     reminders = [
         "💖 *Daily Reminder:* Don't forget to smile today! 😊",
         "🌟 *Daily Tip:* Drink enough water! 🍶",
@@ -1222,39 +3961,268 @@ async def send_daily_reminders():
         "💫 *Daily Motivation:* You can do anything you set your mind to! 💪"
     ]
     
-    for user_id in list(user_last_interaction.keys()):
+    async with _daily_reminders_lock:
+        today = get_indian_time().date()
+        run_key = int(today.strftime("%Y%m%d"))
+        run = broadcast_runs.setdefault(run_key, {"finished": False})
+        if run["finished"]:
+            return
+        state_store.mark_dirty("broadcast_runs", run_key)
+        
+        await state_store.flush()
+        if WORKERS > 1:
+            # Workers record activity; pick up what they wrote since startup
+            await state_store.reload_namespace("user_last_interaction")
+            await state_store.reload_namespace("daily_reminder_sent")
+            # Workers delete opt-outs, which reload_namespace would not notice (nothing unsaved after the flush)
+            broadcast_opt_outs.clear()
+            await state_store.reload_namespace("broadcast_opt_outs")
+        # Entries evicted from memory still count: ask the database who was reached today
+        reached = await state_store.run(lambda conn: {
+            int(key) for (key,) in conn.execute(
+                "SELECT key FROM kv WHERE namespace = 'daily_reminder_sent' AND value = ?",
+                (encode_state(today.isoformat()),)
+            )
+        })
+        
+        # Only active users (last 3 days) who haven't got today's reminder yet
+        now = datetime.now()
+        recipients = [
+            user_id for user_id, last_active in list(user_last_interaction.items())
+            if (now - last_active).days <= 3 and user_id not in reached and user_id not in broadcast_opt_outs
+            and daily_reminder_sent.get(user_id) != today.isoformat()
+        ]
+        
+        sent_since_flush = 0
+        checkpoints: List[asyncio.Task] = []
+        
+        def on_sent(user_id: int):
+            nonlocal sent_since_flush
+            daily_reminder_sent[user_id] = today.isoformat()
+            state_store.mark_dirty("daily_reminder_sent", user_id)
+            sent_since_flush += 1
+            if sent_since_flush >= 500:
+                # Checkpoint often so a restart resends to as few users as possible
+                sent_since_flush = 0
+                checkpoints.append(asyncio.create_task(state_store.flush()))
+        
+        stats = await broadcast(recipients, lambda user_id: random.choice(reminders), on_sent)
+        for result in await asyncio.gather(*checkpoints, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Daily reminder checkpoint failed: {result}")
+        
+        run.update(stats, finished=True)
+        state_store.mark_dirty("broadcast_runs", run_key)
+        # Old run records are not needed once a new day starts
+        for old_key in [key for key in broadcast_runs if key < run_key]:
+            del broadcast_runs[old_key]
+            state_store.mark_dirty("broadcast_runs", old_key)
+        await state_store.flush()
+        
+        print(
+            f"📨 Daily reminders: {stats['sent']}/{stats['total']} sent, "
+            f"{stats['failed']} failed, {stats['blocked']} blocked, {stats['retried']} retried "
+            f"in {stats['seconds']}s ({stats['per_second']} msg/s)"
+        )
+
+# --- WORKER MODE ---
+# Per-chat state is preloaded only by the worker owning the chat; the front
+# process keeps what the daily broadcast needs. Everything else is lazy.
+PER_CHAT_NAMESPACES = {"chat_memory", "chat_summaries", "user_warnings", "group_settings", "fsm"}
+FRONT_NAMESPACES = {"user_last_interaction", "daily_reminder_sent", "broadcast_runs", "broadcast_opt_outs"}
+WORKER_QUEUE_SIZE = 10000
+METRICS_REPORT_INTERVAL = 10  # Seconds between worker metric snapshots sent to the front
+
+class HashRing:
+    """Consistent hash ring: changing the worker count moves only ~1/N of the chats"""
+
+    def __init__(self, nodes: int, replicas: int = 100):
+        points = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in range(nodes) for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def get(self, key: int) -> int:
+        index = bisect.bisect(self._keys, self._hash(str(key))) % len(self._keys)
+        return self._nodes[index]
+
+class UpdateRouter:
+    """Front-process outer middleware: ship each update to the worker owning its chat"""
+
+    def __init__(self, workers: int):
+        self.ring = HashRing(workers)
+        self.context = multiprocessing.get_context("spawn")
+        self.queues = [self.context.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.reports = self.context.Queue(maxsize=workers * 4)
+        self.worker_metrics: Dict[int, List] = {}
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self, bot_user_json: str):
+        """Spawn the workers; they get the bot's own User so they never call getMe"""
+        workers = len(self.queues)
+        for index, worker_queue in enumerate(self.queues):
+            process = self.context.Process(
+                target=worker_entry, args=(index, workers, worker_queue, self.reports, bot_user_json),
+                name=f"alita-worker-{index}", daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        threading.Thread(target=self._collect_reports, name="metrics-reports", daemon=True).start()
+        print(f"👷 Started {len(self.processes)} workers")
+
+    def _collect_reports(self):
+        """Keep the latest metrics snapshot of every worker for /metrics"""
+        while True:
+            report = self.reports.get()
+            if report is None:
+                return
+            index, snapshot = report
+            self.worker_metrics[index] = snapshot
+
+    async def __call__(self, handler, event: types.Update, data: Dict):
+        # event_chat / event_from_user are filled by aiogram's UserContextMiddleware
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else user.id if user else event.update_id
+        worker_queue = self.queues[self.ring.get(key)]
+        raw = event.model_dump_json(exclude_unset=True)
         try:
-            # Only send to active users (last 3 days)
-            last_active = user_last_interaction.get(user_id)
-            if last_active and (datetime.now() - last_active).days <= 3:
-                # Check if we already sent reminder today
-                last_greeted = greeted_groups.get(user_id)
-                if last_greeted and (datetime.now() - last_greeted).days == 0:
-                    continue
-                
-                await bot.send_message(
-                    user_id,
-                    random.choice(reminders),
-                    parse_mode="Markdown"
-                )
-                greeted_groups[user_id] = datetime.now()
-                await asyncio.sleep(0.5)  # Rate limiting
-        except:
-            continue
+            worker_queue.put_nowait(raw)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, worker_queue.put, raw)
+        # Handlers run in the worker, not here
+
+    async def stop(self):
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        with suppress(queue.Full):
+            self.reports.put_nowait(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                process.terminate()
+
+def worker_entry(index: int, workers: int, updates, reports, bot_user_json: str):
+    asyncio.run(run_worker(index, workers, updates, reports, bot_user_json))
+
+async def report_metrics(index: int, reports):
+    while True:
+        await asyncio.sleep(METRICS_REPORT_INTERVAL)
+        collect_runtime_metrics()
+        with suppress(queue.Full):
+            reports.put_nowait((index, metrics.snapshot()))
+
+async def run_worker(index: int, workers: int, updates, reports, bot_user_json: str):
+    """Worker process: run the dp handlers for the chats this worker owns"""
+    global bot_info
+    bot_info = types.User.model_validate_json(bot_user_json)
+    ring = HashRing(workers)
+    
+    await state_store.start(
+        namespaces=PER_CHAT_NAMESPACES,
+        key_filter=lambda name, key: ring.get(storage.chat_of(key) if name == "fsm" else key) == index
+    )
+    reminder_engine.shard = (index, workers)
+    await reminder_engine.start()
+    # Own cache directory per worker: eviction and pins are tracked per process
+    media_cache.root = os.path.join(MEDIA_CACHE_DIR, f"worker{index}")
+    media_cache.max_bytes //= workers
+    
+    greeting_scheduler.add_job(evict_idle_spam_trackers, 'interval', seconds=60, id='spam_tracker_eviction')
+    greeting_scheduler.add_job(memory_registry.sweep, 'interval', seconds=60, id='memory_sweep')
+    greeting_scheduler.add_job(storage.purge_expired, 'interval', hours=1, id='fsm_purge')
+    await start_greeting_task()
+    reporter = asyncio.create_task(report_metrics(index, reports))
+    print(f"👷 Worker {index} ready")
+    
+    loop = asyncio.get_running_loop()
+    running: Set[asyncio.Task] = set()
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, updates.get)
+            if raw is None:
+                break
+            update = types.Update.model_validate_json(raw, context={"bot": bot})
+            task = asyncio.create_task(dp.feed_update(bot, update))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        reporter.cancel()
+        greeting_scheduler.shutdown(wait=False)
+        await reminder_engine.stop()
+        await state_store.close()
+        await close_http_session()
+        await bot.session.close()
 
 # --- DEPLOYMENT HANDLER ---
 async def handle_ping(request):
     return web.Response(text="🤖 Alita is Alive and Protecting! 🛡️")
 
-async def start_server():
+update_router: Optional[UpdateRouter] = None
+
+def collect_runtime_metrics():
+    """Refresh gauges that mirror state kept elsewhere (run before each snapshot)"""
+    for name, stats in memory_registry.stats().items():
+        MAP_ENTRIES.set(stats["entries"], map=name)
+        MAP_BYTES.set(stats["approx_bytes"], map=name)
+        MAP_EVICTIONS.set(stats["evictions"], map=name)
+    cache = response_cache.stats()
+    RESPONSE_CACHE_ENTRIES.set(cache["entries"])
+    RESPONSE_CACHE_LOOKUPS.set(cache["hits"], result="hit")
+    RESPONSE_CACHE_LOOKUPS.set(cache["misses"], result="miss")
+    if groq_gateway:
+        limiter = groq_gateway.limiter
+        GROQ_CONCURRENCY.set(int(limiter.limit), state="limit")
+        GROQ_CONCURRENCY.set(limiter.inflight, state="inflight")
+        GROQ_CONCURRENCY.set(len(limiter._waiters), state="queued")
+    ACTIVE_LANES.set(len(chat_lanes))
+    MEDIA_CACHE_BYTES.set(media_cache.size)
+    MEDIA_CACHE_LOOKUPS.set(media_cache.hits, result="hit")
+    MEDIA_CACHE_LOOKUPS.set(media_cache.misses, result="miss")
+    PHOTO_INDEX_ENTRIES.set(len(photo_hash_index))
+
+async def handle_metrics(request):
+    collect_runtime_metrics()
+    if update_router is None:
+        sources = [((), metrics.snapshot())]
+    else:
+        # Front process plus the last report of every worker
+        sources = [((("process", "front"),), metrics.snapshot())]
+        for index, snapshot in sorted(update_router.worker_metrics.items()):
+            sources.append(((("process", f"worker{index}"),), snapshot))
+    return web.Response(text=MetricsRegistry.render(sources), content_type="text/plain")
+
+async def start_server(webhook: bool = False) -> web.AppRunner:
     app = web.Application()
     app.router.add_get("/", handle_ping)
     app.router.add_get("/health", handle_ping)
+    app.router.add_get("/metrics", handle_metrics)
+    
+    if webhook:
+        # Verifies the secret header, answers 200 at once and handles the update in a background task
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=WEBHOOK_SECRET,
+            handle_in_background=True
+        ).register(app, path=WEBHOOK_PATH)
+        # Runs dispatcher startup/shutdown hooks with the app lifecycle
+        setup_application(app, dp, bot=bot)
+    
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
     print(f"🌐 Health server started on port {PORT}")
+    return runner
 
 async def start_greeting_task():
     """Start the background scheduler for greetings"""
@@ -1263,12 +4231,35 @@ async def start_greeting_task():
         print("⏰ Scheduler started for greetings!")
 
 async def main():
+    global update_router
     print("=" * 50)
     print("🎀 ALITA - STARTING UP...")
     print("=" * 50)
     
-    # Start health check server
-    asyncio.create_task(start_server())
+    # Get bot info (cached for the whole process lifetime)
+    me = await get_bot_info()
+    mark_startup("getMe")
+    print(f"🤖 Bot Info:")
+    print(f"• Name: {me.first_name}")
+    print(f"• Username: @{me.username}")
+    print(f"• ID: {me.id}")
+    
+    if WORKERS > 1:
+        # This process only receives updates and routes them; workers handle them
+        update_router = UpdateRouter(WORKERS)
+        update_router.start(me.model_dump_json())
+        # Before FSM: the front never loads or caches sessions the workers own
+        add_pre_fsm_middleware(update_router)
+        dp.shutdown.register(update_router.stop)
+        await state_store.start(namespaces=FRONT_NAMESPACES)
+    else:
+        # Load persisted state before handling any update
+        await state_store.start()
+        await reminder_engine.start()
+        dp.shutdown.register(reminder_engine.stop)
+    mark_startup("load state")
+    dp.shutdown.register(state_store.close)
+    print(f"💾 State loaded from {STATE_DB_PATH}")
     
     # Start automated greeting system
     await start_greeting_task()
@@ -1280,21 +4271,86 @@ async def main():
         id='daily_reminders'
     )
     
+    # Resume today's broadcast if a restart interrupted it
+    today_run = broadcast_runs.get(int(get_indian_time().strftime("%Y%m%d")))
+    if today_run and not today_run["finished"]:
+        print("📨 Resuming interrupted daily reminders...")
+        asyncio.create_task(send_daily_reminders())
+    
+    if WORKERS <= 1:
+        # Evict idle spam trackers every minute
+        greeting_scheduler.add_job(
+            evict_idle_spam_trackers,
+            'interval',
+            seconds=60,
+            id='spam_tracker_eviction'
+        )
+        
+        # Expire abandoned FSM states
+        greeting_scheduler.add_job(storage.purge_expired, 'interval', hours=1, id='fsm_purge')
+    
+    # Enforce TTLs and the global memory budget
+    greeting_scheduler.add_job(
+        memory_registry.sweep,
+        'interval',
+        seconds=60,
+        id='memory_sweep'
+    )
+    
+    # Close pooled HTTP connections on shutdown
+    dp.shutdown.register(close_http_session)
+    dp.shutdown.register(voice_pipeline.pool.close)
+    mark_startup("scheduler and jobs")
+    
+    if DELIVERY_MODE == "webhook":
+        await run_webhook()
+    else:
+        await run_polling()
+
+async def run_polling():
+    # Start health check server
+    asyncio.create_task(start_server())
+    
     # Delete old webhook
     await bot.delete_webhook(drop_pending_updates=True)
     print("✅ Webhook deleted and updates cleared!")
-    
-    # Get bot info
-    me = await bot.get_me()
-    print(f"🤖 Bot Info:")
-    print(f"• Name: {me.first_name}")
-    print(f"• Username: @{me.username}")
-    print(f"• ID: {me.id}")
+    mark_startup("deleteWebhook")
     
     # Start bot polling
     print("\n🔄 Starting bot polling...")
     print("=" * 50)
-    await dp.start_polling(bot)
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+async def run_webhook():
+    if not WEBHOOK_URL:
+        raise RuntimeError("DELIVERY_MODE=webhook needs WEBHOOK_URL (or RENDER_EXTERNAL_URL)")
+    
+    # aiogram only handles signals in start_polling; without this, Render's SIGTERM
+    # kills the process before the shutdown hooks flush state
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    runner = await start_server(webhook=True)
+    try:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        mark_startup("setWebhook")
+        print(f"\n🪝 Webhook set: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        print("=" * 50)
+        await stop.wait()
+        print("\n🛑 Stopping webhook server...")
+    finally:
+        # Also runs the dispatcher's shutdown hooks (wired by setup_application)
+        await runner.cleanup()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+
+mark_startup("module init (data, handlers)")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,534 @@
+"""
+End-to-end load generator for Alita, fully offline.
+
+Starts a fake Telegram Bot API server and a fake Groq endpoint (in a separate
+process, with configurable latency and error injection), points the bot at
+them through TELEGRAM_API_URL / GROQ_BASE_URL and feeds synthetic updates
+through the real dispatcher: group chatter, mentions, private chats,
+commands, spam bursts and reminder floods.
+
+    python loadtest.py --rate 50 --duration 60
+    python loadtest.py --rate 200 --groq-latency 1.5 --tg-429 0.02 -o run.json
+
+Reports handler latency, end-to-end reply latency (update in -> first
+message out) percentiles and the sustained update rate as JSON.
+
+With --startup-runs the bot is instead started as a real process in polling
+mode against the same fakes, and time to first update is checked against a
+budget (exit status 1 when over it):
+
+    python loadtest.py --startup-runs 3 --max-ttfu 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+BOT_USERNAME = "alita_load_bot"
+REPLY_WORDS = "Haan yaar bilkul sahi kaha tumne 😊 aaj ka din kaisa raha? Main toh mast hu, tum batao kya chal raha hai".split()
+CHATTER = (
+    "yaar kya haal hai bhai aaj movie dekhi mast thi accha nahi pata kaise ho tum ghar khana office boring "
+    "scene sach mein bilkul theek kuch bhi matlab chalo baad baat karte cricket match kohli century exam "
+    "padhai neend chai lol haha pakka weekend plan 😂 🙏 ❤️ 🔥"
+).split()
+COMMANDS = ["/start", "/help", "/time", "/joke", "/fact", "/meme", "/rules", "/notes"]
+
+# --- FAKE SERVERS ---
+class FakeTelegram:
+    """Bot API stand-in: answers every method, records outgoing messages with timestamps"""
+
+    def __init__(self, latency: float, rate_429: float, rate_5xx: float):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.calls = defaultdict(int)
+        self.injected = defaultdict(int)
+        self.events = []
+        self.next_message_id = 10 ** 6
+        self.polled_tokens = set()
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        self.next_message_id += 1
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        if chat_id < 0:
+            chat["title"] = "Load test group"
+        return {"message_id": self.next_message_id, "date": int(time.time()), "chat": chat, "text": text or "-"}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        roll = random.random()
+        if roll < self.rate_429:
+            self.injected["429"] += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        if roll < self.rate_429 + self.rate_5xx:
+            self.injected["5xx"] += 1
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502)
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._poll(request.match_info["token"], form)})
+        if method == "getMe":
+            result = {"id": 999, "is_bot": True, "first_name": "Alita", "username": BOT_USERNAME}
+        elif method == "getChatAdministrators":
+            result = [{"status": "creator", "is_anonymous": False,
+                       "user": {"id": 1, "is_bot": False, "first_name": "Owner"}}]
+        elif method.startswith("send") and method != "sendChatAction" or method == "editMessageText":
+            chat_id = int(form.get("chat_id", 0))
+            result = self._message(chat_id, form.get("text") or form.get("caption"))
+            if method != "editMessageText":
+                reply_to = json.loads(form["reply_parameters"])["message_id"] if "reply_parameters" in form else None
+                # CLOCK_MONOTONIC is system-wide, so the driver process can compare timestamps
+                self.events.append((chat_id, reply_to, time.monotonic(), method))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _poll(self, token: str, form) -> list:
+        """Long polling: a single /start per bot token, then empty batches"""
+        if token not in self.polled_tokens:
+            self.polled_tokens.add(token)
+            return [{"update_id": 1, "message": {
+                "message_id": 1, "date": int(time.time()), "text": "/start",
+                "chat": {"id": 7, "type": "private"},
+                "from": {"id": 7, "is_bot": False, "first_name": "Startup"}
+            }}]
+        await asyncio.sleep(min(float(form.get("timeout") or 0), 1.0))
+        return []
+
+    async def handle_events(self, request: web.Request) -> web.Response:
+        return web.json_response({"events": self.events, "calls": self.calls, "injected": self.injected})
+
+class FakeGroq:
+    """OpenAI-compatible chat completions with streaming, latency and error injection"""
+
+    def __init__(self, latency: float, token_delay: float, rate_429: float, rate_5xx: float):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.calls = defaultdict(int)
+        self.injected = defaultdict(int)
+
+    @staticmethod
+    def _usage(body: dict, completion_tokens: int) -> dict:
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        self.calls["stream" if stream else "create"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        roll = random.random()
+        if roll < self.rate_429:
+            self.injected["429"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after": "1"}
+            )
+        if roll < self.rate_429 + self.rate_5xx:
+            self.injected["5xx"] += 1
+            return web.json_response({"error": {"message": "Internal error", "type": "internal_error"}}, status=500)
+
+        words = REPLY_WORDS[:random.randint(8, len(REPLY_WORDS))]
+        base = {"id": "chatcmpl-load", "created": int(time.time()), "model": body.get("model", "fake")}
+        if not stream:
+            return web.json_response({
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": self._usage(body, len(words))
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in words:
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        final = {**base, "object": "chat.completion.chunk", "choices": [],
+                 "x_groq": {"id": "req-load", "usage": self._usage(body, len(words))}}
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "injected": self.injected})
+
+def run_fakes(options: dict, ready):
+    """Fake servers process entry point"""
+    async def serve():
+        telegram = FakeTelegram(options["tg_latency"], options["tg_429"], options["tg_5xx"])
+        groq = FakeGroq(options["groq_latency"], options["groq_token_delay"], options["groq_429"], options["groq_5xx"])
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", telegram.handle)
+        app.router.add_get("/__telegram", telegram.handle_events)
+        app.router.add_post("/openai/v1/chat/completions", groq.handle)
+        app.router.add_get("/__groq", groq.handle_stats)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        ready.send(runner.addresses[0][1])
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+# --- UPDATE STREAMS ---
+class UpdateFactory:
+    """Builds raw update dicts and remembers when each message was sent"""
+
+    def __init__(self, groups: int, users: int, rng: random.Random):
+        self.groups = groups
+        self.users = users
+        self.rng = rng
+        self.update_id = 0
+        self.message_ids = defaultdict(int)
+        self.sent = {}  # (chat_id, message_id) -> monotonic send time
+
+    def message(self, chat_id: int, user_id: int, text: str) -> dict:
+        self.update_id += 1
+        self.message_ids[chat_id] += 1
+        message_id = self.message_ids[chat_id]
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        if chat_id < 0:
+            chat["title"] = f"Group {-chat_id}"
+        self.sent[(chat_id, message_id)] = time.monotonic()
+        return {
+            "update_id": self.update_id,
+            "message": {
+                "message_id": message_id, "date": int(time.time()), "chat": chat, "text": text,
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+            }
+        }
+
+    def _text(self, low: int = 3, high: int = 15) -> str:
+        return " ".join(self.rng.choice(CHATTER) for _ in range(self.rng.randint(low, high)))
+
+    def _group(self) -> int:
+        return -1000 - self.rng.randrange(self.groups)
+
+    def _user(self) -> int:
+        return 10 + self.rng.randrange(self.users)
+
+    def chatter(self) -> list:
+        return [self.message(self._group(), self._user(), self._text())]
+
+    def mention(self) -> list:
+        return [self.message(self._group(), self._user(), f"@{BOT_USERNAME} {self._text()}")]
+
+    def private(self) -> list:
+        user = self._user()
+        return [self.message(user, user, self._text())]
+
+    def command(self) -> list:
+        user = self._user()
+        chat = user if self.rng.random() < 0.5 else self._group()
+        return [self.message(chat, user, self.rng.choice(COMMANDS))]
+
+    def spam(self) -> list:
+        # One user floods a group: enough messages to trip the spam limit
+        chat, user = self._group(), self._user()
+        return [self.message(chat, user, self._text(1, 4)) for _ in range(8)]
+
+    def reminder(self) -> list:
+        user = self._user()
+        return [self.message(user, user, f"/remind {self.rng.randint(5, 30)}s {self._text(2, 5)}")]
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"chatter", "mention", "private", "command", "spam", "reminder"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return mix
+
+# --- REPORTING ---
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+    return {"count": len(values), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "max_ms": round(values[-1] * 1000, 1)}
+
+def reply_latencies(sent: dict, events: list) -> tuple:
+    """Match outgoing messages to the update they answer.
+
+    A reply_parameters target is exact. Plain messages (command answers,
+    warnings) are matched to the newest unanswered update in that chat.
+    """
+    pending = defaultdict(list)
+    for (chat_id, message_id), started in sent.items():
+        pending[chat_id].append((message_id, started))
+    latencies, extra = [], 0
+    for chat_id, reply_to, at, _ in sorted(events, key=lambda event: event[2]):
+        waiting = [item for item in pending.get(chat_id, []) if item[1] <= at]
+        if reply_to is not None:
+            match = next((item for item in waiting if item[0] == reply_to), None)
+        else:
+            match = waiting[-1] if waiting else None
+        if match is None:
+            extra += 1  # Reminders firing, follow-up messages
+            continue
+        pending[chat_id].remove(match)
+        latencies.append(at - match[1])
+    return latencies, extra
+
+# --- STARTUP CHECK ---
+STARTUP_SAMPLE = re.compile(r'^alita_startup_phase_seconds\{phase="([^"]+)"[^}]*\} (\S+)$', re.M)
+FIRST_UPDATE_SAMPLE = re.compile(r"^alita_time_to_first_update_seconds(?:\{[^}]*\})? (\S+)$", re.M)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def startup_run(run: int, base_url: str, timeout: float) -> dict:
+    """Start bot.py in polling mode and wait until it reports its first update"""
+    port = free_port()
+    env = dict(os.environ, **{
+        "BOT_TOKEN": f"123456:LOADTEST-startup-{run}",
+        "GROQ_API_KEY": "gsk_loadtest",
+        "TELEGRAM_API_URL": base_url,
+        "GROQ_BASE_URL": base_url,
+        "STATE_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="alita-startup-"), "state.db"),
+        "PORT": str(port),
+        "WORKERS": "1"
+    })
+    for name in ("WEBHOOK_URL", "RENDER_EXTERNAL_URL"):
+        env.pop(name, None)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+    from aiohttp import ClientSession, ClientError
+
+    started = time.monotonic()
+    process = subprocess.Popen([sys.executable, script], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with ClientSession() as session:
+            while time.monotonic() - started < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"bot.py exited with status {process.returncode}")
+                try:
+                    async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                        text = await response.text()
+                except ClientError:
+                    text = ""
+                first_update = FIRST_UPDATE_SAMPLE.search(text)
+                if first_update:
+                    return {
+                        "ttfu_s": round(float(first_update.group(1)), 3),
+                        # Includes interpreter start, which the bot cannot measure itself
+                        "wall_s": round(time.monotonic() - started, 3),
+                        "phases_s": {phase: round(float(value), 3) for phase, value in STARTUP_SAMPLE.findall(text)}
+                    }
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"no update handled within {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def check_startup(args, base_url: str) -> dict:
+    runs = []
+    for run in range(args.startup_runs):
+        result = await startup_run(run, base_url, args.startup_timeout)
+        print(f"⏱️ run {run + 1}: first update after {result['ttfu_s']}s ({result['wall_s']}s wall)", file=sys.stderr)
+        runs.append(result)
+    ttfu = sorted(result["ttfu_s"] for result in runs)
+    return {
+        "config": {"runs": args.startup_runs, "max_ttfu_s": args.max_ttfu},
+        "ttfu_s": {"min": ttfu[0], "median": ttfu[len(ttfu) // 2], "max": ttfu[-1]},
+        "runs": runs,
+        # The median keeps one slow cold disk cache from failing the check
+        "passed": args.max_ttfu is None or ttfu[len(ttfu) // 2] <= args.max_ttfu
+    }
+
+# --- DRIVER ---
+async def drive(args, base_url: str) -> dict:
+    # bot.py reads its configuration at import time
+    os.environ.update({
+        "BOT_TOKEN": "123456:LOADTEST-token-not-used-anywhere",
+        "GROQ_API_KEY": "gsk_loadtest",
+        "TELEGRAM_API_URL": base_url,
+        "GROQ_BASE_URL": base_url,
+        "STATE_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="alita-load-"), "state.db"),
+        "GROQ_RPM": str(args.groq_rpm),
+        "GROQ_TPM": str(args.groq_tpm)
+    })
+    import bot as alita
+    from aiohttp import ClientSession
+
+    await alita.state_store.start()
+    await alita.reminder_engine.start()
+    await alita.get_bot_info()
+
+    rng = random.Random(args.seed)
+    factory = UpdateFactory(args.groups, args.users, rng)
+    scenarios = list(args.mix)
+    weights = [args.mix[name] for name in scenarios]
+
+    handler_times, running = [], set()
+    completed, last_completed = 0, 0.0
+    lags = []
+
+    async def feed(update: dict):
+        nonlocal completed, last_completed
+        started = time.monotonic()
+        try:
+            await alita.dp.feed_raw_update(alita.bot, update)
+        except Exception:
+            pass  # Errors are part of the test (injected 429s/5xx); handlers log them
+        last_completed = time.monotonic()
+        handler_times.append(last_completed - started)
+        completed += 1
+
+    async def watch_loop():
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(0.05)
+            lags.append(time.monotonic() - started - 0.05)
+
+    watcher = asyncio.create_task(watch_loop())
+    print(f"🚀 {args.rate} updates/s for {args.duration}s, mix {args.mix}", file=sys.stderr)
+    started = time.monotonic()
+    sent_updates = 0
+    next_at = started
+    while time.monotonic() - started < args.duration:
+        for update in getattr(factory, rng.choices(scenarios, weights)[0])():
+            task = asyncio.create_task(feed(update))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            sent_updates += 1
+        next_at += 1 / args.rate
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+    feeding_took = time.monotonic() - started
+
+    # Let handlers and chat lanes (debounced replies) finish
+    drain_deadline = time.monotonic() + args.drain
+    while (running or len(alita.chat_lanes)) and time.monotonic() < drain_deadline:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(0.5)
+    watcher.cancel()
+
+    async with ClientSession() as session:
+        async with session.get(f"{base_url}/__telegram") as response:
+            telegram = await response.json()
+        async with session.get(f"{base_url}/__groq") as response:
+            groq = await response.json()
+
+    latencies, extra = reply_latencies(factory.sent, telegram["events"])
+    await alita.reminder_engine.stop()
+    await alita.state_store.close()
+    await alita.bot.session.close()
+    await alita.close_http_session()
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "updates": {
+            "sent": sent_updates,
+            "handled": completed,
+            "offered_per_sec": round(sent_updates / feeding_took, 1),
+            # Handled updates over the time until the last handler returned
+            "sustained_per_sec": round(completed / (last_completed - started), 1) if completed else 0.0,
+            "unfinished": len(running),
+            "lanes_left": len(alita.chat_lanes)
+        },
+        "handler_latency": percentiles(handler_times),
+        "reply_latency": percentiles(latencies),
+        "replies": {"matched": len(latencies), "unmatched_outgoing": extra,
+                    "merged_messages": alita.chat_lanes.merged},
+        "event_loop_lag": percentiles(lags),
+        "telegram": {"calls": telegram["calls"], "injected": telegram["injected"]},
+        "groq": groq
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50, help="scenario events per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--drain", type=float, default=20, help="max seconds to wait for replies afterwards")
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("chatter=45,mention=15,private=15,command=10,spam=5,reminder=10"),
+                        help="scenario weights, e.g. chatter=45,mention=15,private=15,command=10,spam=5,reminder=10")
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="mean Bot API latency (s)")
+    parser.add_argument("--tg-429", type=float, default=0.0, help="share of Bot API calls answered with 429")
+    parser.add_argument("--tg-5xx", type=float, default=0.0, help="share of Bot API calls answered with 502")
+    parser.add_argument("--groq-latency", type=float, default=0.4, help="mean time to first token (s)")
+    parser.add_argument("--groq-token-delay", type=float, default=0.02, help="delay between streamed tokens (s)")
+    parser.add_argument("--groq-429", type=float, default=0.0, help="share of Groq calls answered with 429")
+    parser.add_argument("--groq-5xx", type=float, default=0.0, help="share of Groq calls answered with 500")
+    parser.add_argument("--groq-rpm", type=int, default=100000, help="GROQ_RPM for the bot under test")
+    parser.add_argument("--groq-tpm", type=int, default=100000000, help="GROQ_TPM for the bot under test")
+    parser.add_argument("--startup-runs", type=int, default=0,
+                        help="measure time to first update of N real bot.py starts instead of the load run")
+    parser.add_argument("--max-ttfu", type=float, help="fail when median time to first update exceeds this (s)")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="give up on a start after this (s)")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    # Fakes get their own process so they do not compete with the bot's event loop
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    fakes = context.Process(target=run_fakes, args=(vars(args), sender), daemon=True, name="alita-fakes")
+    fakes.start()
+    try:
+        port = receiver.recv()
+        if args.startup_runs:
+            report = asyncio.run(check_startup(args, f"http://127.0.0.1:{port}"))
+        else:
+            report = asyncio.run(drive(args, f"http://127.0.0.1:{port}"))
+    finally:
+        fakes.terminate()
+
+    if args.startup_runs:
+        summary = f"{'✅' if report['passed'] else '❌'} median time to first update {report['ttfu_s']['median']}s"
+        if args.max_ttfu is not None:
+            summary += f" (budget {args.max_ttfu}s)"
+    else:
+        summary = (f"✅ {report['updates']['sustained_per_sec']} updates/s sustained, "
+                   f"reply p50/p95/p99 = {report['reply_latency'].get('p50_ms')}/"
+                   f"{report['reply_latency'].get('p95_ms')}/{report['reply_latency'].get('p99_ms')} ms")
+    print(summary, file=sys.stderr)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.startup_runs and not report["passed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
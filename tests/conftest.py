@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# bot.py reads its configuration at import time; keep its files out of the checkout
+_tmp = tempfile.mkdtemp(prefix="alita-tests-")
+os.environ.setdefault("BOT_TOKEN", "123456:ABCDEFabcdef_ghijklmnopqrstuvwxyz123")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(_tmp, "alita_state.db"))
+os.environ.setdefault("MEDIA_CACHE_DIR", os.path.join(_tmp, "media_cache"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.time, "monotonic", clock)
+    return clock
+
+
+def failing_loader(calls):
+    async def load():
+        calls.append(1)
+        raise RuntimeError("Bad Gateway")
+    return load
+
+
+def test_failed_load_is_cached_with_backoff(clock):
+    cache = bot.AsyncTTLCache(600, error_ttl=30)
+    calls = []
+
+    async def get():
+        with pytest.raises(RuntimeError):
+            await cache.get("chat", failing_loader(calls))
+
+    asyncio.run(get())
+    asyncio.run(get())
+    assert len(calls) == 1  # Second get re-raised the cached failure
+
+    clock.now += 31
+    asyncio.run(get())
+    assert len(calls) == 2
+    clock.now += 31  # Second failure in a row backs off for 60 s
+    asyncio.run(get())
+    assert len(calls) == 2
+    clock.now += 30
+    asyncio.run(get())
+    assert len(calls) == 3
+
+
+def test_success_clears_the_failure(clock):
+    cache = bot.AsyncTTLCache(600, error_ttl=30)
+    calls = []
+
+    async def ok():
+        return {1}
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await cache.get("chat", failing_loader(calls))
+        clock.now += 31
+        assert await cache.get("chat", ok) == {1}
+        clock.now += 601  # Stale: the next failure starts the backoff from scratch
+        cache.invalidate("chat")
+        with pytest.raises(RuntimeError):
+            await cache.get("chat", failing_loader(calls))
+        return cache._failures["chat"][1]
+
+    assert asyncio.run(run()) == 1
+
+
+def test_refresh_does_nothing_while_backing_off(clock):
+    cache = bot.AsyncTTLCache(600, error_ttl=30)
+    calls = []
+
+    async def run():
+        for _ in range(5):
+            cache.refresh("chat", failing_loader(calls))
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_chat_admins_is_bounded_and_registered():
+    assert bot.chat_admins.maxsize == bot.MAX_TRACKED_CHATS
+    assert "chat_admins" in bot.memory_registry.stats()
+
+
+def test_unknown_chat_is_not_refetched_after_a_failure(monkeypatch):
+    calls = []
+
+    async def get_chat_administrators(chat_id):
+        calls.append(chat_id)
+        raise RuntimeError("Forbidden")
+
+    monkeypatch.setattr(bot.bot, "get_chat_administrators", get_chat_administrators)
+    message = SimpleNamespace(chat=SimpleNamespace(id=-777), sender_chat=None, from_user=SimpleNamespace(id=5))
+
+    async def run():
+        for _ in range(10):
+            assert not await bot.is_chat_admin(message, wait=False)
+            await asyncio.sleep(0.01)
+        assert not await bot.is_chat_admin(message)
+
+    try:
+        asyncio.run(run())
+    finally:
+        bot.chat_admins.invalidate(-777)
+    assert calls == [-777]
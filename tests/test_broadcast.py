@@ -0,0 +1,25 @@
+import asyncio
+from datetime import datetime
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+import bot
+
+
+def test_blocked_users_are_opted_out_without_losing_activity(monkeypatch):
+    async def fake_send(chat_id, text, **kwargs):
+        if chat_id == 2:
+            raise TelegramForbiddenError(SendMessage(chat_id=chat_id, text=text), "bot was blocked by the user")
+
+    monkeypatch.setattr(bot.bot, "send_message", fake_send)
+    monkeypatch.setattr(bot, "broadcast_opt_outs", {})
+    bot.user_last_interaction[2] = datetime.now()
+    reached = []
+
+    stats = asyncio.run(bot.broadcast([1, 2, 3], lambda user_id: "hi", reached.append))
+
+    assert (stats["sent"], stats["blocked"], stats["failed"]) == (2, 1, 0)
+    assert reached == [1, 3]
+    assert list(bot.broadcast_opt_outs) == [2]
+    assert 2 in bot.user_last_interaction
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+def message(chat_id, user_id):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), from_user=SimpleNamespace(id=user_id))
+
+
+@pytest.fixture
+def typing(monkeypatch):
+    actions = []
+
+    async def fake_action(chat_id, action):
+        actions.append((chat_id, action))
+
+    monkeypatch.setattr(bot.bot, "send_chat_action", fake_action)
+    return actions
+
+
+def test_idle_lane_replies_without_debounce(typing):
+    replies = []
+
+    async def respond(msg, text):
+        replies.append((text, time.monotonic()))
+        await asyncio.sleep(0.05)
+
+    async def run():
+        lanes = bot.ChatLanes(respond, debounce=1.0, max_wait=4)
+        started = time.monotonic()
+        lanes.submit(message(1, 10), "hi")
+        while len(lanes):
+            await asyncio.sleep(0.01)
+        return started
+
+    started = asyncio.run(run())
+    assert [text for text, _ in replies] == ["hi"]
+    assert replies[0][1] - started < 0.5
+    assert typing and typing[0] == (1, "typing")
+
+
+def test_messages_arriving_during_a_reply_are_merged(typing):
+    replies = []
+
+    async def run():
+        lanes = bot.ChatLanes(None, debounce=0.05, max_wait=1)
+
+        async def respond(msg, text):
+            replies.append(text)
+            if len(replies) == 1:
+                lanes.submit(message(1, 10), "second")
+                lanes.submit(message(1, 10), "third")
+                lanes.submit(message(1, 11), "other user")
+                await asyncio.sleep(0.05)
+
+        lanes.respond = respond
+        lanes.submit(message(1, 10), "first")
+        while len(lanes):
+            await asyncio.sleep(0.01)
+        return lanes.merged
+
+    merged = asyncio.run(run())
+    assert replies == ["first", "second\nthird", "other user"]
+    assert merged == 1
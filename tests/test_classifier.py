@@ -0,0 +1,53 @@
+import pytest
+
+import bot
+
+classify = bot.message_classifier.classify
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("hi", "greeting"),
+    ("Hiii!", "greeting"),
+    ("heyyy", "greeting"),
+    ("hellooo bhai", "greeting"),
+    ("byeee", "goodbye"),
+    ("goodbyeee", "goodbye"),
+    ("sorryyy yaar", "sorry"),
+    ("Thank youuu", "thanks"),
+    ("thanksss", "thanks"),
+])
+def test_intents_including_stretched_spellings(text, intent):
+    assert classify(text).intent == intent
+
+
+@pytest.mark.parametrize("text", ["nahi yaar", "his book", "abhi aata hu", "roti khayi", "hasta hua", "they"])
+def test_keywords_do_not_fire_inside_other_words(text):
+    result = classify(text)
+    assert result.intent is None
+    assert result.emotion is None
+
+
+@pytest.mark.parametrize("text, emotion", [
+    ("pyaari si baat", "love"),
+    ("hahaha lol", "funny"),
+    ("crying since morning", "crying"),
+    ("fighting again", "protective"),
+    ("kyun?", "thinking"),
+])
+def test_stems_and_symbols(text, emotion):
+    assert classify(text).emotion == emotion
+
+
+def test_ranking_by_hits_then_table_order():
+    # love and angry tie on hits; love comes first in EMOTION_KEYWORDS
+    assert classify("love hate").emotions == (("love", 1), ("angry", 1))
+    assert classify("hate hate love").emotion == "angry"
+    result = classify("hi bye bye")
+    assert result.intents == (("goodbye", 2), ("greeting", 1))
+
+
+def test_custom_tables_and_batch():
+    classifier = bot.MessageClassifier({"calm": ["chill", "shant*"]}, {"ok": ["okk", "theek hai"]})
+    assert classifier.classify("okkkk, theek haiii").intents == (("ok", 2),)
+    assert classifier.classify("shanti rakho").emotion == "calm"
+    assert [c.emotion for c in classifier.classify_batch(["chilll", "nope"])] == ["calm", None]
@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+CHAT = -4242
+
+
+class FakeGateway:
+    """Summarizer that records the turns it was asked to fold in"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def create(self, messages, **kwargs):
+        transcript = messages[-1]["content"].split("New messages:\n", 1)[1]
+        self.batches.append(transcript.splitlines())
+        text = f"summary {len(self.batches)}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    gateway = FakeGateway()
+    monkeypatch.setattr(bot, "groq_gateway", gateway)
+    bot.chat_memory[CHAT] = deque(maxlen=50)
+    yield gateway
+    bot.chat_memory.pop(CHAT, None)
+    bot.chat_summaries.pop(CHAT, None)
+
+
+def say(*texts):
+    for i, text in enumerate(texts):
+        bot.remember_turn(CHAT, "user" if i % 2 == 0 else "assistant", text)
+
+
+async def settle(builder):
+    while builder._refreshing:
+        await asyncio.sleep(0)
+
+
+def test_turns_are_numbered_per_chat(chat):
+    say("hi", "hello", "hi")
+    assert [turn["seq"] for turn in bot.chat_memory[CHAT]] == [1, 2, 3]
+
+
+def test_build_keeps_newest_turns_within_budget(chat):
+    say(*(f"message number {i}" for i in range(10)))
+    builder = bot.ContextBuilder(budget=60, turn_tokens=50, summary_batch=100)
+    messages = builder.build(CHAT, "system")
+
+    assert messages[0] == {"role": "system", "content": "system"}
+    turns = messages[1:]
+    assert turns[-1]["content"] == "message number 9"
+    assert [t["content"] for t in turns] == [f"message number {i}" for i in range(10 - len(turns), 10)]
+    assert bot.prompt_tokens(messages) <= 60
+    assert all(set(turn) == {"role", "content"} for turn in turns)  # No seq sent to Groq
+
+
+def test_build_clips_long_turns_and_always_keeps_current_one(chat):
+    say("word " * 500)
+    builder = bot.ContextBuilder(budget=10, turn_tokens=20, summary_batch=100)
+    messages = builder.build(CHAT, "system")
+
+    assert len(messages) == 2
+    assert bot.count_tokens(messages[1]["content"]) <= 21
+    assert messages[1]["content"].endswith("…")
+
+
+def test_summary_is_included_and_refreshed_on_read(chat):
+    say("hi")
+    bot.chat_summaries[CHAT] = {"text": "Riya likes cats", "upto": 0}
+    bot.chat_summaries.atime[CHAT] = 0
+    builder = bot.ContextBuilder(budget=500, turn_tokens=50, summary_batch=100)
+    messages = builder.build(CHAT, "system")
+
+    assert messages[1]["content"] == "Earlier in this chat: Riya likes cats"
+    assert bot.chat_summaries.atime[CHAT] > 0
+
+
+def test_repeated_turns_are_summarized_once(chat):
+    builder = bot.ContextBuilder(budget=40, turn_tokens=50, summary_batch=4)
+
+    async def run():
+        refreshes = []
+        for _ in range(20):
+            say("hi", "hi")  # Identical turns must not confuse the bookkeeping
+            builder.build(CHAT, "system")
+            await settle(builder)
+            refreshes.append(len(chat.batches))
+        return refreshes
+
+    refreshes = asyncio.run(run())
+    summarized = sum(len(batch) for batch in chat.batches)
+    window = len(builder.build(CHAT, "system")) - 2  # System prompt and summary
+    assert chat.batches and all(len(batch) >= 4 for batch in chat.batches)
+    # Every turn that left the window went into exactly one refresh
+    assert summarized <= 40 - window < summarized + 4
+    assert bot.chat_summaries[CHAT] == {"text": f"summary {len(chat.batches)}", "upto": summarized}
+    assert refreshes == sorted(refreshes)
+
+
+def test_no_refresh_without_new_older_turns(chat):
+    say(*(f"turn {i}" for i in range(12)))
+    builder = bot.ContextBuilder(budget=30, turn_tokens=50, summary_batch=4)
+
+    async def run():
+        builder.build(CHAT, "system")
+        await settle(builder)
+        builder.build(CHAT, "system")
+        await settle(builder)
+
+    asyncio.run(run())
+    assert len(chat.batches) == 1
+    assert chat.batches[0][0] == "User: turn 0"
+
+
+def test_summary_from_a_lost_history_does_not_block_refreshes(chat):
+    bot.chat_summaries[CHAT] = {"text": "old", "upto": 500}
+    say(*(f"turn {i}" for i in range(12)))
+    builder = bot.ContextBuilder(budget=30, turn_tokens=50, summary_batch=4)
+
+    async def run():
+        builder.build(CHAT, "system")
+        await settle(builder)
+
+    asyncio.run(run())
+    assert len(chat.batches) == 1
+    assert bot.chat_summaries[CHAT]["upto"] == len(chat.batches[0])
@@ -0,0 +1,54 @@
+import asyncio
+from contextlib import aclosing
+from types import SimpleNamespace
+
+import bot
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            yield SimpleNamespace(x_groq=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+def make_gateway(stream):
+    async def create(**kwargs):
+        return stream
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return bot.GroqGateway(client, rpm=1000, tpm=10 ** 6, max_concurrency=2, max_queue=10, deadline=5,
+                           max_retries=0)
+
+
+def test_stream_releases_slot_and_http_stream_when_reader_stops_early():
+    stream = FakeStream(["a", "b", "c"])
+    gateway = make_gateway(stream)
+
+    async def run():
+        async with aclosing(gateway.stream(model="m", messages=[{"role": "user", "content": "hi"}])) as deltas:
+            async for delta in deltas:
+                assert delta == "a"
+                break
+
+    asyncio.run(run())
+    assert stream.closed
+    assert gateway.limiter.inflight == 0
+
+
+def test_remaining_tokens_header_is_a_count():
+    gateway = make_gateway(FakeStream([]))
+    error = SimpleNamespace(response=SimpleNamespace(headers={
+        "x-ratelimit-remaining-tokens": "120", "retry-after": "2"
+    }))
+    assert gateway._retry_delay(error, 0) == 2
+    assert gateway.tokens.tokens <= 120
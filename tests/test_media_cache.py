@@ -0,0 +1,168 @@
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    """Fake file API: file_id doubles as the path, FILES maps it to bytes"""
+    files = {}
+    downloads = []
+
+    async def get_file(file_id):
+        return SimpleNamespace(file_path=file_id)
+
+    async def download_file(file_path, destination, seek=True):
+        downloads.append(file_path)
+        await asyncio.sleep(0.01)
+        destination.write(files[file_path])
+
+    monkeypatch.setattr(bot.bot, "get_file", get_file)
+    monkeypatch.setattr(bot.bot, "download_file", download_file)
+    return SimpleNamespace(files=files, downloads=downloads)
+
+
+async def read(cache, file_id, unique_id):
+    async with cache.fetch(file_id, unique_id) as path:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def test_concurrent_fetches_share_one_download(tmp_path, telegram):
+    telegram.files["a"] = b"photo"
+    cache = bot.MediaCache(str(tmp_path), 1024)
+
+    async def run():
+        return await asyncio.gather(*(read(cache, "a", "ua") for _ in range(5)))
+
+    assert asyncio.run(run()) == [b"photo"] * 5
+    assert telegram.downloads == ["a"]
+    assert cache.misses == 1
+
+
+def test_same_bytes_under_two_ids_share_a_blob(tmp_path, telegram):
+    telegram.files["a"] = telegram.files["b"] = b"same"
+    cache = bot.MediaCache(str(tmp_path), 1024)
+
+    async def run():
+        await read(cache, "a", "ua")
+        await read(cache, "b", "ub")
+
+    asyncio.run(run())
+    assert len(cache._blobs) == 1
+    assert cache.size == 4
+    assert os.path.realpath(cache._id_path("ua")) == os.path.realpath(cache._id_path("ub"))
+
+
+def test_least_recently_used_blob_is_evicted(tmp_path, telegram):
+    for name in "abc":
+        telegram.files[name] = name.encode() * 10
+    cache = bot.MediaCache(str(tmp_path), 25)
+
+    async def run():
+        await read(cache, "a", "ua")
+        await read(cache, "b", "ub")
+        await read(cache, "a", "ua")  # Hit: b is now the oldest
+        await read(cache, "c", "uc")
+
+    asyncio.run(run())
+    assert set(cache._ids) == {"ua", "uc"}
+    assert cache.size == 20
+    assert not os.path.lexists(cache._id_path("ub"))
+
+
+def test_pinned_blob_survives_eviction(tmp_path, telegram):
+    telegram.files["a"] = b"a" * 10
+    telegram.files["b"] = b"b" * 10
+    cache = bot.MediaCache(str(tmp_path), 15)
+
+    async def run():
+        async with cache.fetch("a", "ua") as path:
+            # Over budget: a is older, but still being read, so b goes instead
+            assert await read(cache, "b", "ub") == b"b" * 10
+            with open(path, "rb") as f:
+                assert f.read() == b"a" * 10
+        return set(cache._ids)
+
+    assert asyncio.run(run()) == {"ua"}
+
+
+def test_restart_rebuilds_index_and_drops_bad_entries(tmp_path, telegram):
+    telegram.files["a"] = b"photo"
+
+    async def first():
+        await read(bot.MediaCache(str(tmp_path), 1024), "a", "ua")
+
+    asyncio.run(first())
+    (tmp_path / "ids" / "stray").write_bytes(b"not a link")
+    os.symlink("../sha256/ff/missing", tmp_path / "ids" / "dangling")
+
+    cache = bot.MediaCache(str(tmp_path), 1024)
+    assert asyncio.run(read(cache, "a", "ua")) == b"photo"
+    assert telegram.downloads == ["a"]  # Served from disk
+    assert cache.hits == 1
+    assert not os.path.lexists(tmp_path / "ids" / "stray")
+    assert not os.path.lexists(tmp_path / "ids" / "dangling")
+
+
+def test_failed_scan_is_retried(tmp_path, telegram, monkeypatch):
+    telegram.files["a"] = b"photo"
+    cache = bot.MediaCache(str(tmp_path), 1024)
+    scan = cache._scan
+    calls = []
+
+    def flaky_scan():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("disk hiccup")
+        scan()
+
+    monkeypatch.setattr(cache, "_scan", flaky_scan)
+
+    async def run():
+        with pytest.raises(OSError):
+            await read(cache, "a", "ua")
+        return await read(cache, "a", "ua")
+
+    assert asyncio.run(run()) == b"photo"
+    assert len(calls) == 2
+
+
+def test_disk_writes_run_off_the_event_loop(tmp_path, telegram, monkeypatch):
+    telegram.files["a"] = b"photo" * 1000
+    cache = bot.MediaCache(str(tmp_path), 1 << 20)
+    loop_thread = threading.get_ident()
+    threads = []
+    for name in ("replace", "symlink"):
+        real = getattr(os, name)
+
+        def tracked(*args, real=real, name=name, **kwargs):
+            threads.append((name, threading.get_ident()))
+            return real(*args, **kwargs)
+
+        monkeypatch.setattr(os, name, tracked)
+    drain = bot._HashingWriter.drain
+    monkeypatch.setattr(bot._HashingWriter, "drain",
+                        lambda self: threads.append(("write", threading.get_ident())) or drain(self))
+
+    assert asyncio.run(read(cache, "a", "ua")) == b"photo" * 1000
+    assert {name for name, _ in threads} == {"write", "replace", "symlink"}
+    assert all(ident != loop_thread for _, ident in threads)
+
+
+def test_concurrent_downloads_of_the_same_bytes_count_once(tmp_path, telegram):
+    telegram.files["a"] = telegram.files["b"] = b"same" * 10
+    cache = bot.MediaCache(str(tmp_path), 1024)
+
+    async def run():
+        return await asyncio.gather(read(cache, "a", "ua"), read(cache, "b", "ub"))
+
+    assert asyncio.run(run()) == [b"same" * 10] * 2
+    assert cache.size == 40
+    assert cache._ids["ua"] == cache._ids["ub"]
+    assert sorted(os.listdir(tmp_path / "tmp")) == []
@@ -0,0 +1,51 @@
+import time
+
+import bot
+
+
+def test_bounded_dict_evicts_least_recently_used():
+    evicted = []
+    mapping = bot.BoundedDict(max_entries=2)
+    mapping.on_evict = lambda key, value: evicted.append((key, value))
+    mapping[1] = "a"
+    mapping[2] = "b"
+    mapping[1]  # Refresh 1
+    mapping[3] = "c"
+    assert evicted == [(2, "b")]
+    assert list(mapping) == [1, 3]
+
+
+def test_get_and_contains_do_not_refresh():
+    mapping = bot.BoundedDict(max_entries=2)
+    mapping[1] = "a"
+    mapping[2] = "b"
+    assert mapping.get(1) == "a" and 1 in mapping
+    mapping[3] = "c"
+    assert 1 not in mapping
+
+
+def test_ttl_sweep_spills_idle_entries():
+    spilled = []
+    registry = bot.MemoryRegistry(budget_bytes=10 ** 9)
+    mapping = bot.BoundedDict()
+    registry.register("m", mapping, ttl=60, spill=lambda name, key, value: spilled.append((name, key, value)))
+    mapping[1] = "old"
+    mapping[2] = "new"
+    mapping.atime[1] = time.monotonic() - 120
+    registry.sweep()
+    assert spilled == [("m", 1, "old")]
+    assert list(mapping) == [2]
+    assert registry.stats()["m"]["evictions"] == 1
+
+
+def test_budget_eviction_skips_maps_that_cannot_be_restored():
+    registry = bot.MemoryRegistry(budget_bytes=1)
+    settings = {chat_id: {"welcome_enabled": False} for chat_id in range(100)}
+    cache = bot.BoundedDict()
+    for key in range(100):
+        cache[key] = "x" * 100
+    registry.register("settings", settings, evict=False)
+    registry.register("cache", cache)
+    registry.sweep()
+    assert len(settings) == 100
+    assert len(cache) == 0
@@ -0,0 +1,51 @@
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def engine():
+    return bot.ModerationEngine(["randi", "slut", "chutiya", "रंडी"], bot.GROUP_LINK_PATTERNS)
+
+
+@pytest.mark.parametrize("text", [
+    "randi", "tu randi hai", "RANDI!", "r4nd1", "sl​ut", "chutiyapa band kar", "ye रंडी है",
+])
+def test_bad_words_match_at_word_start(engine, text):
+    assert engine.scan(text).bad_words
+
+
+@pytest.mark.parametrize("text", [
+    "what a grandiose plan", "errandi", "pasluta", "nahi yaar", "",
+])
+def test_words_containing_a_bad_word_are_clean(engine, text):
+    assert not engine.scan(text).bad_words
+
+
+@pytest.mark.parametrize("text", [
+    "join t.me/somegroup", "T.ME/abc", "tg://join?invite=x", "https://chat.whatsapp.com/xyz",
+])
+def test_group_links(engine, text):
+    assert engine.scan(text).link
+
+
+def test_bad_word_does_not_hide_an_adjacent_link(engine):
+    assert engine.scan("slut.me/abc") == bot.ModerationVerdict(link=True, bad_words=True)
+
+
+def test_trie_regex_prefix_semantics():
+    assert bot._trie_regex([]) == "(?!)"
+    pattern = bot._trie_regex(["ab", "abc", "abd", "x"])
+    assert pattern == "(?:ab|x)"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("H3ll0 W0rld!", "hello worldi"),
+    ("Ｒ４ＮＤＩ", "randi"),
+    ("cáfé ŝl​ût", "cafe slut"),
+    ("ज़रूर माँ 100%", "जरूर मां ioo%"),
+    ("ﬁne 😂 $ab", "fine 😂 sab"),
+    ("bad \ud800 input", "bad \ud800 input"),  # Lone surrogate from a malformed update
+])
+def test_normalize_text(text, expected):
+    assert bot.normalize_text(text) == expected
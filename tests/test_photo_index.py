@@ -0,0 +1,42 @@
+import random
+
+import bot
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_near_finds_hashes_within_distance_only():
+    index = bot.PhotoHashIndex(window=60, max_entries=100)
+    rng = random.Random(1)
+    base = rng.getrandbits(64)
+    index.add(base, now=0.0)
+    index.add(rng.getrandbits(64), now=0.0)
+    assert index.near(flip(base, 1, 30, 60), 5, now=1.0) == [0.0]
+    assert index.near(flip(base, *range(6)), 5, now=1.0) == []
+    assert index.near(flip(base, *range(8)), 8, now=1.0) == [0.0]
+
+
+def test_only_the_same_users_repeats_count():
+    index = bot.PhotoHashIndex(window=60, max_entries=100)
+    for user_id in (1, 2, 3):
+        index.add(42, now=0.0, user_id=user_id)
+    index.add(42, now=1.0, user_id=1)
+    assert len(index.near(42, 0, now=2.0)) == 4
+    assert index.near(42, 0, now=2.0, user_id=1) == [0.0, 1.0]
+    assert index.near(42, 0, now=2.0, user_id=4) == []
+
+
+def test_old_sightings_and_excess_hashes_expire():
+    index = bot.PhotoHashIndex(window=10, max_entries=2)
+    index.add(1, now=0.0)
+    index.add(2, now=5.0)
+    assert index.near(1, 0, now=11.0) == []
+    index.add(3, now=12.0)  # Expires hash 1 (too old)
+    index.add(4, now=12.0)  # Over max_entries: drops the least recently seen (2)
+    assert len(index) == 2
+    assert index.near(2, 0, now=12.0) == []
+    assert index.near(4, 0, now=12.0) == [12.0]
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    delivered = []
+
+    async def fake_send(user_id, text):
+        delivered.append((user_id, text))
+
+    monkeypatch.setattr(bot, "send_reminder", fake_send)
+    return delivered
+
+
+def make_engine(tmp_path, horizon=3600):
+    store = bot.StateStore(str(tmp_path / "state.db"), flush_interval=3600)
+    return store, bot.ReminderEngine(store, horizon=horizon, grace=60)
+
+
+@pytest.mark.parametrize("args, seconds, text", [
+    ("30m Take medicine", 1800, "Take medicine"),
+    ("1h30m Study", 5400, "Study"),
+    ("2d", 172800, ""),
+])
+def test_parse_durations(args, seconds, text):
+    before = bot.get_indian_time()
+    due, rest = bot.parse_reminder_time(args)
+    assert rest == text
+    assert abs((due - before - timedelta(seconds=seconds)).total_seconds()) < 5
+
+
+def test_parse_clock_times():
+    due, rest = bot.parse_reminder_time("tomorrow 9am Pay bills")
+    assert (due.hour, due.minute, rest) == (9, 0, "Pay bills")
+    assert due.date() == (bot.get_indian_time() + timedelta(days=1)).date()
+    due, _ = bot.parse_reminder_time("18:30 walk")
+    assert (due.hour, due.minute) == (18, 30) and due > bot.get_indian_time()
+    assert bot.parse_reminder_time("13pm nope") == (None, "13pm nope")
+    assert bot.parse_reminder_time("hello there") == (None, "hello there")
+
+
+def test_due_reminder_fires_once_and_is_deleted(tmp_path, sent):
+    async def run():
+        store, engine = make_engine(tmp_path)
+        await store.start()
+        await engine.start()
+        engine.add(1, time.time() + 0.2, "soon")
+        engine.add(2, time.time() + 1000, "later")
+        await asyncio.sleep(0.6)
+        assert sent == [(1, "soon")]
+        assert [row[2] for row in await engine.list_for_user(1)] == []
+        assert [row[2] for row in await engine.list_for_user(2)] == ["later"]
+        await engine.stop()
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_cancelled_reminder_does_not_fire(tmp_path, sent):
+    async def run():
+        store, engine = make_engine(tmp_path)
+        await store.start()
+        await engine.start()
+        reminder_id = engine.add(1, time.time() + 0.2, "never")
+        assert not await engine.cancel(2, reminder_id)  # Someone else's id
+        assert await engine.cancel(1, reminder_id)
+        await asyncio.sleep(0.5)
+        assert sent == []
+        await engine.stop()
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_add_while_refilling_is_not_lost(tmp_path, sent):
+    async def run():
+        store, engine = make_engine(tmp_path, horizon=2.0)
+        await store.start()
+        await engine.start()
+        await asyncio.sleep(0.3)
+        real_run = store.run
+        loaded_until = engine._loaded_until
+
+        async def add_then_run(fn, *args):
+            # Due just past the old window, added while _refill's SELECT is in flight
+            store.run = real_run
+            result = await real_run(fn, *args)
+            engine.add(1, loaded_until + 0.05, "raced")
+            return result
+
+        store.run = add_then_run
+        await engine._refill(time.time())
+        await asyncio.sleep(loaded_until + 0.3 - time.time())
+        assert sent == [(1, "raced")]
+        await engine.stop()
+        await store.close()
+
+    asyncio.run(run())
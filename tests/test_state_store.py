@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+
+import bot
+
+
+def open_store(path):
+    store = bot.StateStore(str(path), flush_interval=3600)
+    data = bot.BoundedDict()
+    history = bot.BoundedDict()
+    store.register("data", data)
+    store.register("history", history, lambda value: deque(value, maxlen=3))
+    return store, data, history
+
+
+def test_flush_writes_dirty_keys_and_deletes_removed_ones(tmp_path):
+    async def run():
+        store, data, history = open_store(tmp_path / "state.db")
+        await store.start()
+        data[1] = {"name": "a"}
+        data[2] = {"name": "b"}
+        history[1] = deque(["x", "y"], maxlen=3)
+        for key in (1, 2):
+            store.mark_dirty("data", key)
+        store.mark_dirty("history", 1)
+        await store.flush()
+        del data[2]
+        store.mark_dirty("data", 2)
+        await store.close()
+
+        store, data, history = open_store(tmp_path / "state.db")
+        await store.start()
+        assert dict(data) == {1: {"name": "a"}}
+        assert history[1] == deque(["x", "y"], maxlen=3) and history[1].maxlen == 3
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_spilled_value_is_restored_before_and_after_flush(tmp_path):
+    async def run():
+        store, data, _ = open_store(tmp_path / "state.db")
+        await store.start()
+        data[7] = {"n": 1}
+        store.mark_dirty("data", 7)
+        store.spill("data", 7, data.pop(7))
+        assert await store.restore("data", 7)
+        assert data[7] == {"n": 1}
+
+        store.spill("data", 7, data.pop(7))  # Not dirty any more: nothing new to persist
+        data[8] = {"n": 2}
+        store.mark_dirty("data", 8)
+        store.spill("data", 8, data.pop(8))
+        await store.flush()
+        assert await store.restore("data", 8)
+        assert data[8] == {"n": 2}
+        assert await store.restore("data", 7)
+        assert not await store.restore("data", 9)
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_restore_never_overwrites_a_live_entry(tmp_path):
+    async def run():
+        store, data, _ = open_store(tmp_path / "state.db")
+        await store.start()
+        data[1] = {"v": "old"}
+        store.mark_dirty("data", 1)
+        await store.flush()
+        data[1] = {"v": "new"}
+        assert await store.restore("data", 1)
+        assert data[1] == {"v": "new"}
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_failed_write_keeps_keys_dirty(tmp_path):
+    async def run():
+        store, data, _ = open_store(tmp_path / "state.db")
+        await store.start()
+        data[1] = {"v": 1}
+        store.mark_dirty("data", 1)
+        real_write = store._write
+
+        def failing_write(*args):
+            raise OSError("disk full")
+
+        store._write = failing_write
+        try:
+            await store.flush()
+        except OSError:
+            pass
+        store._write = real_write
+        assert 1 in store._dirty["data"]
+        await store.flush()
+        data.clear()
+        assert await store.restore("data", 1)
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_encode_round_trips_datetimes_and_deques():
+    value = {"when": bot.datetime(2024, 1, 2, 3, 4, 5), "items": deque([1, 2])}
+    assert bot.decode_state(bot.encode_state(value)) == {"when": value["when"], "items": [1, 2]}
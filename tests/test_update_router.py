@@ -0,0 +1,56 @@
+import asyncio
+import json
+import queue
+from contextlib import suppress
+
+import bot
+
+
+def update(update_id, chat_id, user_id):
+    return bot.types.Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": 1, "date": 0, "text": "hi",
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Riya"}
+        }
+    }, context={"bot": bot.bot})
+
+
+def test_front_routes_updates_without_touching_fsm_storage(monkeypatch):
+    touched = []
+
+    async def tracked(*args, **kwargs):
+        touched.append(args)
+        return None
+
+    for method in ("get_state", "get_data", "set_state", "set_data"):
+        monkeypatch.setattr(bot.storage, method, tracked)
+
+    router = bot.UpdateRouter(2)
+    bot.add_pre_fsm_middleware(router)
+    try:
+        for i in range(4):
+            asyncio.run(bot.dp.feed_update(bot.bot, update(i, 100 + i, 100 + i)))
+    finally:
+        bot.dp.update.outer_middleware.unregister(router)
+
+    routed = {}
+    for index, worker_queue in enumerate(router.queues):
+        with suppress(queue.Empty):
+            while True:
+                routed[json.loads(worker_queue.get(timeout=1))["update_id"]] = index
+    # Every update went to the worker owning its chat
+    assert routed == {i: router.ring.get(100 + i) for i in range(4)}
+    assert touched == []
+    assert not bot.storage.sessions
+
+
+def test_router_sits_between_user_context_and_fsm():
+    router = bot.UpdateRouter(1)
+    bot.add_pre_fsm_middleware(router)
+    try:
+        kinds = [type(m).__name__ for m in bot.dp.update.outer_middleware]
+    finally:
+        bot.dp.update.outer_middleware.unregister(router)
+    assert kinds.index("UserContextMiddleware") < kinds.index("UpdateRouter") < kinds.index("FSMContextMiddleware")
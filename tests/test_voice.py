@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+def voice_message(user_id):
+    async def reply(text, **kwargs):
+        replies.append((user_id, text))
+
+    replies = []
+    message = SimpleNamespace(
+        chat=SimpleNamespace(id=user_id, type="private"), from_user=SimpleNamespace(id=user_id),
+        reply_to_message=None, voice=SimpleNamespace(duration=3, file_id=f"f{user_id}", file_unique_id=f"u{user_id}"),
+        reply=reply
+    )
+    return message, replies
+
+
+def test_queue_limit_holds_for_concurrent_notes(monkeypatch):
+    pipeline = bot.VoicePipeline(workers=1, max_pending=2, max_seconds=60)
+    submitted = []
+    peak = 0
+
+    async def slow_action(chat_id, action):
+        await asyncio.sleep(0.01)
+
+    async def fake_transcribe(voice):
+        nonlocal peak
+        peak = max(peak, pipeline.pending)
+        await asyncio.sleep(0.05)
+        pipeline.pending -= 1
+        return f"text of {voice.file_id}"
+
+    monkeypatch.setattr(bot.bot, "send_chat_action", slow_action)
+    monkeypatch.setattr(bot, "voice_pipeline", pipeline)
+    monkeypatch.setattr(pipeline, "transcribe", fake_transcribe)
+    monkeypatch.setattr(bot.chat_lanes, "submit", lambda message, text: submitted.append(text))
+    messages = [voice_message(user_id) for user_id in range(1, 6)]
+
+    async def run():
+        await asyncio.gather(*(bot.handle_voice_message(message) for message, _ in messages))
+
+    asyncio.run(run())
+    busy = [replies for _, replies in messages if replies]
+    assert peak <= 2
+    assert len(submitted) == 2 and len(busy) == 3
+    assert pipeline.pending == 0
+
+
+def test_try_acquire_reserves_synchronously():
+    pipeline = bot.VoicePipeline(workers=1, max_pending=1, max_seconds=60)
+    assert pipeline.try_acquire()
+    assert not pipeline.try_acquire()
+    assert pipeline.pending == 1
@@ -0,0 +1,36 @@
+import asyncio
+import os
+import signal
+import socket
+
+import bot
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_sigterm_runs_shutdown_hooks(monkeypatch):
+    monkeypatch.setattr(bot, "WEBHOOK_URL", "https://example.com")
+    monkeypatch.setattr(bot, "PORT", free_port())
+    events = []
+
+    async def set_webhook(url, **kwargs):
+        events.append("webhook")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    async def on_shutdown():
+        events.append("shutdown")
+
+    monkeypatch.setattr(bot.bot, "set_webhook", set_webhook)
+    bot.dp.shutdown.register(on_shutdown)
+    try:
+        asyncio.run(asyncio.wait_for(bot.run_webhook(), 10))
+    finally:
+        bot.dp.shutdown.handlers.pop()
+
+    assert events == ["webhook", "shutdown"]
+    # Handlers are removed again, the default SIGTERM behaviour is back
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL